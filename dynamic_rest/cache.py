@@ -0,0 +1,416 @@
+"""This module contains caching utilities."""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from dynamic_rest.conf import settings
+
+
+class LocalCache(object):
+    """A thread-safe, process-local LRU cache with per-entry expiry.
+
+    Arguments:
+        ttl: number of seconds an entry stays valid, or None to never expire.
+        max_entries: maximum number of entries, or None for no limit.
+            The least recently used entries are evicted first.
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires is not None and expires <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                result[key] = value
+        return result
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, values):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            for key, value in values.items():
+                self._data[key] = (expires, value)
+                self._data.move_to_end(key)
+            if self.max_entries:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def add(self, key, value):
+        """Set a value unless the key is present; return True if it was set."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (
+                entry[0] is None or entry[0] > time.monotonic()
+            ):
+                return False
+        # another thread may add the key in between;
+        # callers only use this for best-effort leases
+        self.set(key, value)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def get_shared_cache(alias):
+    """Return the Django cache for `alias`, or None if `alias` is empty."""
+    return caches[alias] if alias else None
+
+
+class SideloadCache(object):
+    """A two-level cache of model instances, keyed by primary key.
+
+    Lookups go to a process-local `LocalCache` first, then to the
+    shared Django cache named by `SIDELOAD_CACHE_BACKEND` (if any).
+    Entries are dropped whenever an instance is saved or deleted,
+    or on `clear`; writes that bypass model signals (e.g.
+    `QuerySet.update`) are only picked up after `ttl` expires, unless
+    they call `invalidate_model`.
+
+    Without a shared cache, entries are dropped from process memory
+    only. With one, both levels are keyed by a data generation of the
+    model, kept in the shared cache: any invalidation bumps it, which
+    drops every entry of the model, in every process. This costs a
+    round trip to the shared cache per lookup.
+
+    Instances are copied on the way in and out, so callers are free
+    to attach prefetched data to them.
+    """
+
+    DEFAULT_TTL = 300
+    DEFAULT_MAX_ENTRIES = 1000
+
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model, ttl=None, max_entries=None, backend=None):
+        self.model = model
+        self.ttl = ttl or self.DEFAULT_TTL
+        self.local = LocalCache(
+            ttl=self.ttl, max_entries=max_entries or self.DEFAULT_MAX_ENTRIES
+        )
+        if backend is None:
+            backend = settings.SIDELOAD_CACHE_BACKEND
+        self.shared = get_shared_cache(backend)
+        # bumped by hand, rather than connected to model signals
+        self.generations = (
+            Generations(backend) if self.shared is not None else None
+        )
+        self.prefix = 'drest:sideload:%s:' % model._meta.label_lower
+
+        uid = 'drest-sideload-%s' % model._meta.label_lower
+        post_save.connect(self._invalidate, sender=model, dispatch_uid=uid)
+        post_delete.connect(self._invalidate, sender=model, dispatch_uid=uid)
+
+    @classmethod
+    def for_model(cls, model, options=None):
+        """Get the cache for a model, creating it on first use.
+
+        Arguments:
+            model: a Django model class
+            options: a dict with optional "ttl", "max_entries"
+                and "backend" keys, e.g. a serializer's
+                `Meta.sideload_cache`. Only used on first access.
+        """
+        key = model._meta.label_lower
+        if key not in cls._instances:
+            with cls._lock:
+                if key not in cls._instances:
+                    options = options if isinstance(options, dict) else {}
+                    cls._instances[key] = cls(model, **options)
+        return cls._instances[key]
+
+    @classmethod
+    def clear_all(cls):
+        for cache in list(cls._instances.values()):
+            cache.clear()
+
+    def _invalidate(self, sender, instance, **kwargs):
+        self.delete(instance.pk)
+
+    def _generation(self):
+        if self.generations is None:
+            return None
+        return self.generations.get_many([self.model])[0]
+
+    def _shared_key(self, generation, pk):
+        return '%s%s:%s' % (self.prefix, generation, pk)
+
+    def get_many(self, pks):
+        generation = self._generation()
+        found = {
+            pk: value
+            for pk, (entry_generation, value) in self.local.get_many(pks).items()
+            if entry_generation == generation
+        }
+        missing = [pk for pk in pks if pk not in found]
+        if missing and self.shared is not None:
+            keys = {self._shared_key(generation, pk): pk for pk in missing}
+            shared = {
+                keys[key]: value
+                for key, value in self.shared.get_many(list(keys)).items()
+            }
+            if shared:
+                self.local.set_many({
+                    pk: (generation, value) for pk, value in shared.items()
+                })
+                found.update(shared)
+        return {pk: copy.copy(value) for pk, value in found.items()}
+
+    def set_many(self, instances):
+        generation = self._generation()
+        values = {pk: copy.copy(value) for pk, value in instances.items()}
+        self.local.set_many({
+            pk: (generation, value) for pk, value in values.items()
+        })
+        if self.shared is not None:
+            self.shared.set_many(
+                {
+                    self._shared_key(generation, pk): value
+                    for pk, value in values.items()
+                },
+                timeout=self.ttl,
+            )
+
+    def delete(self, pk):
+        self.local.delete(pk)
+        if self.generations is not None:
+            self.generations.bump(self.model)
+
+    def clear(self):
+        self.local.clear()
+        if self.generations is not None:
+            self.generations.bump(self.model)
+
+
+class Generations(object):
+    """Per-model data generation counters, bumped by model signals.
+
+    Counters live in the shared Django cache named by `backend` or,
+    if unset, in process memory. Only the models passed to `connect`
+    are watched. Writes that bypass model signals
+    (e.g. `QuerySet.update`) have to call `bump` themselves.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, backend=None):
+        self.shared = get_shared_cache(backend)
+        self.local = {}
+        self._connected = set()
+
+    def connect(self, models):
+        """Bump the counters of `models` on every write, from now on."""
+        with self._lock:
+            for model in models:
+                if model in self._connected:
+                    continue
+                uid = 'drest-generations-%s-%s' % (
+                    id(self), model._meta.label_lower
+                )
+                post_save.connect(self._on_write, sender=model, dispatch_uid=uid)
+                post_delete.connect(
+                    self._on_write, sender=model, dispatch_uid=uid
+                )
+                # the sender of m2m_changed is the through model
+                m2m_changed.connect(
+                    self._on_m2m_write, sender=model, dispatch_uid=uid
+                )
+                self._connected.add(model)
+
+    def _on_write(self, sender, **kwargs):
+        self.bump(sender)
+
+    def _on_m2m_write(self, sender, instance, model, action, **kwargs):
+        if action.startswith('post_'):
+            self.bump(sender)
+            self.bump(instance.__class__)
+            self.bump(model)
+
+    def _key(self, model):
+        return 'drest:generation:%s' % model._meta.label_lower
+
+    def bump(self, model):
+        if self.shared is None:
+            with self._lock:
+                key = self._key(model)
+                self.local[key] = self.local.get(key, 0) + 1
+            return
+        key = self._key(model)
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self._initialize(key)
+
+    def _initialize(self, key):
+        # start from the current time rather than 0, so that counters
+        # evicted from the cache do not repeat earlier generations
+        self.shared.add(key, time.time_ns(), None)
+
+    def get_many(self, models):
+        """Get the generations of models, in order."""
+        keys = [self._key(model) for model in models]
+        if self.shared is None:
+            return [self.local.get(key, 0) for key in keys]
+        values = self.shared.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            for key in missing:
+                self._initialize(key)
+            values.update(self.shared.get_many(missing))
+        return [values.get(key) for key in keys]
+
+
+class ResultCache(object):
+    """A cache of computed results that are invalidated by data generations.
+
+    Each result is stored with the generations of the models it
+    depends on, and is only served while they are unchanged.
+
+    Arguments:
+        ttl: number of seconds results are cached for.
+        backend: optional name of a shared Django cache.
+        stale_while_revalidate: if set, outdated results are served
+            while one caller recomputes them.
+    """
+
+    LEASE_TIMEOUT = 30
+
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, ttl, backend=None, stale_while_revalidate=False):
+        self.ttl = ttl
+        self.shared = get_shared_cache(backend)
+        self.local = LocalCache(ttl=ttl, max_entries=1000)
+        self.leases = LocalCache(ttl=self.LEASE_TIMEOUT)
+        self.stale_while_revalidate = stale_while_revalidate
+        self.generations = Generations(backend)
+
+    @classmethod
+    def for_settings(cls):
+        """Get the cache configured by the COMBINE_CACHE_* settings."""
+        options = (
+            settings.COMBINE_CACHE_TTL,
+            settings.COMBINE_CACHE_BACKEND,
+            settings.COMBINE_CACHE_STALE_WHILE_REVALIDATE
+        )
+        if options not in cls._instances:
+            with cls._lock:
+                if options not in cls._instances:
+                    cls._instances[options] = cls(*options)
+        return cls._instances[options]
+
+    def _get(self, key):
+        if self.shared is None:
+            return self.local.get(key)
+        return self.shared.get(key)
+
+    def _set(self, key, value):
+        if self.shared is None:
+            self.local.set(key, value)
+        else:
+            self.shared.set(key, value, self.ttl)
+
+    def _lease(self, key):
+        key = '%s:lease' % key
+        if self.shared is None:
+            return self.leases.add(key, True)
+        return self.shared.add(key, True, self.LEASE_TIMEOUT)
+
+    def _release(self, key):
+        key = '%s:lease' % key
+        if self.shared is None:
+            self.leases.delete(key)
+        else:
+            self.shared.delete(key)
+
+    def get_or_compute(self, key, models, compute):
+        """Get a cached result, or compute and cache it.
+
+        Arguments:
+            key: a string identifying the result.
+            models: the models whose data the result depends on.
+            compute: a callable that takes no arguments; its result must
+                be picklable if a shared cache is used.
+        """
+        key = 'drest:result:%s' % key
+        self.generations.connect(models)
+        generations = self.generations.get_many(models)
+        entry = self._get(key)
+        if entry is not None and entry[0] == generations:
+            return entry[1]
+
+        leased = False
+        if entry is not None and self.stale_while_revalidate:
+            leased = self._lease(key)
+            if not leased:
+                # another caller is recomputing it
+                return entry[1]
+        try:
+            # generations are read first, so a write during the computation
+            # leaves the result outdated rather than wrongly current
+            result = compute()
+            self._set(key, (generations, result))
+        finally:
+            if leased:
+                self._release(key)
+        return result
+
+
+def invalidate_model(model, pks=None):
+    """Invalidate cached data after a write that bypasses model signals.
+
+    Bumps the data generation of `model` for cached combine results,
+    and drops its instances from the sideload cache.
+
+    Arguments:
+        model: the model whose rows were written,
+            e.g. by `QuerySet.update` or `bulk_create`
+        pks: the primary keys of the written rows, if known;
+            if not, every cached instance of `model` is dropped
+    """
+    caches_ = list(ResultCache._instances.values())
+    if settings.COMBINE_CACHE_BACKEND:
+        caches_.append(ResultCache.for_settings())
+    for cache in caches_:
+        cache.generations.bump(model)
+
+    sideloads = SideloadCache._instances.get(model._meta.label_lower)
+    if sideloads is not None:
+        if pks is None or sideloads.generations is not None:
+            # shared entries are dropped all at once
+            sideloads.clear()
+        else:
+            for pk in pks:
+                sideloads.delete(pk)
@@ -0,0 +1,107 @@
+"""This module contains request coalescing utilities."""
+import threading
+import time
+import uuid
+
+from dynamic_rest.cache import get_shared_cache
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls that share a key into a single call.
+
+    Within a process, the first caller for a key (the leader) runs the
+    computation while later callers wait for it to finish and share
+    its result. Across processes, the leader can take a short lease in a
+    shared Django cache; leaders in other processes then wait for the
+    lease holder to publish its result in that cache.
+
+    Waiting is bounded by a timeout, after which a waiter
+    runs the computation itself. The same happens if the computation
+    fails, so errors are never shared between callers.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, timeout=30, backend=None):
+        """Call `fn`, or wait for an identical in-flight call to finish.
+
+        Arguments:
+            key: a string identifying equivalent calls.
+            fn: a callable that takes no arguments; its result must
+                be picklable if `backend` is set.
+            timeout: maximum number of seconds to wait for another call.
+            backend: optional name of a Django cache used to coalesce
+                calls across processes.
+
+        Returns:
+            A tuple of (result, shared), where `shared` is True if the
+            result was computed by another caller.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(timeout) and not flight.failed:
+                return flight.result, True
+            return fn(), False
+
+        try:
+            flight.result, shared = self._do_shared(key, fn, timeout, backend)
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result, shared
+
+    def _do_shared(self, key, fn, timeout, backend):
+        cache = get_shared_cache(backend)
+        if cache is None:
+            return fn(), False
+
+        lease_key = 'drest:flight:lease:%s' % key
+        flight_id = uuid.uuid4().hex
+        if cache.add(lease_key, flight_id, timeout):
+            try:
+                result = fn()
+                cache.set('drest:flight:result:%s' % flight_id, result, timeout)
+            finally:
+                cache.delete(lease_key)
+            return result, False
+
+        # another process holds the lease: wait for it to publish
+        holder = cache.get(lease_key)
+        deadline = time.monotonic() + timeout
+        while holder is not None:
+            result = cache.get('drest:flight:result:%s' % holder)
+            if result is not None:
+                return result, True
+            if time.monotonic() >= deadline:
+                break
+            if cache.get(lease_key) != holder:
+                # released without a result, e.g. after an error
+                if cache.get('drest:flight:result:%s' % holder) is None:
+                    break
+                continue
+            time.sleep(self.POLL_INTERVAL)
+        return fn(), False
+
+
+single_flight = SingleFlight()
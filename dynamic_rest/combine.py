@@ -0,0 +1,555 @@
+"""This module contains helpers for the combine feature."""
+import math
+import re
+from collections import namedtuple
+from decimal import Decimal
+from functools import lru_cache
+
+from django.db import NotSupportedError, connections
+from django.db.models import (
+    DecimalField, F, FloatField, Func, IntegerField
+)
+from django.db.models.functions import Mod, Random
+from django.db.models.sql.datastructures import BaseTable
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# the key of the flag set on the rows of the groups
+# outside of the top combine.limit groups
+OTHER = '_other'
+
+# minimum number of rows for which NumPy reductions are used
+NUMPY_MIN_ROWS = 1000
+
+# the smallest fraction of rows that can be sampled
+MIN_SAMPLE = 1e-6
+
+NUMPY_FUNCTIONS = ('sum', 'min', 'max', 'avg', 'count')
+
+FILL_MODES = ('zero', 'null', 'previous')
+
+# the step between two buckets, as a PostgreSQL interval
+# and an SQLite date modifier
+FILL_STEPS = {
+    'year': ('1 year', '+1 year'),
+    'quarter': ('3 months', '+3 months'),
+    'month': ('1 month', '+1 month'),
+    'week': ('7 days', '+7 days'),
+    'day': ('1 day', '+1 day'),
+    'hour': ('1 hour', '+1 hour'),
+    'minute': ('1 minute', '+1 minute'),
+    'second': ('1 second', '+1 second')
+}
+
+DATE_BUCKETS = ('year', 'quarter', 'month', 'week', 'day')
+
+
+class WindowAggregate(Func):
+    """An aggregate function that can be computed over a window of
+    already-aggregated values, e.g. SUM(COUNT(x)) OVER (...).
+
+    Django's own aggregates refuse to reference other aggregates.
+    """
+
+    window_compatible = True
+
+
+class SampledTable(BaseTable):
+    """A base table read with TABLESAMPLE SYSTEM, on PostgreSQL."""
+
+    def __init__(self, table_name, alias, percent):
+        super(SampledTable, self).__init__(table_name, alias)
+        self.percent = percent
+
+    def as_sql(self, compiler, connection):
+        sql, params = super(SampledTable, self).as_sql(compiler, connection)
+        return '%s TABLESAMPLE SYSTEM (%%s)' % sql, [*params, self.percent]
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            self.table_name,
+            change_map.get(self.table_alias, self.table_alias),
+            self.percent
+        )
+
+    @property
+    def identity(self):
+        return self.__class__, self.table_name, self.table_alias, self.percent
+
+
+def sample_queryset(queryset, fraction):
+    """Sample a fraction of the rows of a queryset.
+
+    PostgreSQL samples table pages with TABLESAMPLE. Other databases
+    keep rows with an integer primary key divisible by round(1 / fraction),
+    or else rows picked at random.
+
+    Returns:
+        A tuple of (queryset, fraction), where `fraction` is
+        the expected fraction of rows that are kept.
+    """
+    if fraction >= 1:
+        return queryset, 1
+    fraction = max(fraction, MIN_SAMPLE)
+    queryset = queryset.all()
+    if connections[queryset.db].vendor == 'postgresql':
+        query = queryset.query
+        alias = query.get_initial_alias()
+        table = query.alias_map[alias]
+        query.alias_map[alias] = SampledTable(
+            table.table_name, alias, fraction * 100
+        )
+        return queryset, fraction
+
+    pk = queryset.model._meta.pk
+    if pk.is_relation:
+        pk = pk.target_field
+    if isinstance(pk, IntegerField):
+        modulo = max(1, int(round(1 / fraction)))
+        return (
+            queryset.alias(_sample=Mod(F('pk'), modulo)).filter(_sample=0),
+            1 / modulo
+        )
+    return queryset.alias(_sample=Random()).filter(_sample__lt=fraction), fraction
+
+
+def sampling_error(fraction, total, squares):
+    """Estimate the relative error of a sum scaled up from a sample.
+
+    Arguments:
+        fraction: the fraction of rows sampled
+        total: the scaled-up sum, or count
+        squares: the sum of squared values in the sample,
+            or the sample size for a count
+
+    Returns:
+        The relative error at 95% confidence, or None if
+        the total is zero or unknown.
+    """
+    if not total or squares is None:
+        return None
+    deviation = math.sqrt((1 - fraction) * float(squares)) / fraction
+    return 1.96 * deviation / abs(float(total))
+
+
+class TooManyBuckets(ValueError):
+    """Raised when a time series would have too many buckets to fill."""
+
+
+def fill_series(queryset, bucket, over, dimensions, mode, max_buckets=None):
+    """Run a grouped queryset with a row for every bucket of a time series.
+
+    The buckets between the first and last one are generated in SQL,
+    with `generate_series` on PostgreSQL or a recursive CTE on SQLite,
+    crossed with every group of the other dimensions, and left-joined
+    to the grouped rows.
+
+    Arguments:
+        queryset: a grouped `values` queryset
+        bucket: the bucket function, e.g. "month"
+        over: name of the bucket column
+        dimensions: names of the other grouping columns
+        mode: how the measures of missing buckets are filled:
+            "zero" for numeric measures, "null", or "previous"
+            to carry forward the value of the previous bucket
+        max_buckets: the maximum number of buckets, or None
+
+    Returns:
+        A list of rows, ordered by bucket and dimensions.
+        Rows without a bucket are kept, but not filled.
+
+    Raises:
+        TooManyBuckets: if the series has more than `max_buckets`
+            buckets; at most one more is generated.
+    """
+    connection = connections[queryset.db]
+    vendor = connection.vendor
+    if vendor not in ('postgresql', 'sqlite'):
+        raise NotSupportedError(
+            f'Cannot fill time series on {connection.display_name}'
+        )
+
+    compiler = queryset.order_by().query.get_compiler(queryset.db)
+    sql, params = compiler.as_sql()
+    fields = [column[0] for column in compiler.select]
+    columns = [column[2] for column in compiler.select]
+    qn = connection.ops.quote_name
+    b = qn(over)
+    dims = [qn(d) for d in dimensions]
+
+    interval, modifier = FILL_STEPS[bucket]
+    if vendor == 'postgresql':
+        series = (
+            f"SELECT generate_series(lo, hi, interval '{interval}')"
+            f"{'::date' if bucket in DATE_BUCKETS else ''} "
+            f"FROM (SELECT MIN({b}) AS lo, MAX({b}) AS hi FROM agg) bounds"
+        )
+        same = 'IS NOT DISTINCT FROM'
+    else:
+        function = 'date' if bucket in DATE_BUCKETS else 'datetime'
+        series = (
+            f"SELECT MIN({b}) FROM agg UNION ALL "
+            f"SELECT {function}(b, '{modifier}') FROM series "
+            f"WHERE b < (SELECT MAX({b}) FROM agg)"
+        )
+        same = 'IS'
+    if max_buckets is not None:
+        # one more than allowed, to tell that there are too many;
+        # on SQLite, this also stops the recursion
+        series += f' LIMIT {int(max_buckets) + 1}'
+
+    selected = []
+    filled = []
+    for column, field in zip(columns, fields):
+        name = qn(column)
+        if column == over:
+            selected.append(f'series.b AS {name}')
+            filled.append(name)
+        elif column in dimensions:
+            selected.append(f'groups.{name} AS {name}')
+            filled.append(name)
+        else:
+            selected.append(f'agg.{name} AS {name}')
+            if mode == 'previous':
+                # every group has one grouped row, followed by missing ones
+                filled.append(
+                    f'MAX({name}) OVER (PARTITION BY {", ".join(dims + ["grp"])})'
+                )
+            elif mode == 'zero' and isinstance(
+                field.output_field, (DecimalField, FloatField, IntegerField)
+            ):
+                filled.append(f'COALESCE({name}, 0)')
+            else:
+                filled.append(name)
+    if mode == 'previous':
+        partition = ', '.join(f'groups.{d}' for d in dims)
+        partition = f'PARTITION BY {partition} ' if dims else ''
+        selected.append(f'COUNT(agg.{b}) OVER ({partition}ORDER BY series.b) AS grp')
+
+    joins = ''.join(f' AND agg.{d} {same} groups.{d}' for d in dims)
+    ctes = [f'agg AS ({sql})', f'series (b) AS ({series})']
+    if dims:
+        ctes.append(f'groups AS (SELECT DISTINCT {", ".join(dims)} FROM agg)')
+    order = ', '.join(str(columns.index(c) + 1) for c in [over, *dimensions])
+    sql = (
+        f'WITH RECURSIVE {", ".join(ctes)}, '
+        f'filled AS (SELECT {", ".join(selected)} FROM series'
+        f'{" CROSS JOIN groups" if dims else ""} '
+        f'LEFT JOIN agg ON agg.{b} = series.b{joins} '
+        f'WHERE series.b IS NOT NULL) '
+        f'SELECT {", ".join(filled)} FROM filled '
+        f'UNION ALL SELECT {", ".join(qn(c) for c in columns)} '
+        f'FROM agg WHERE {b} IS NULL '
+        f'ORDER BY {order}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    if max_buckets is not None:
+        index = columns.index(over)
+        buckets = {row[index] for row in rows if row[index] is not None}
+        if len(buckets) > max_buckets:
+            raise TooManyBuckets(
+                f'Cannot fill more than {max_buckets} buckets'
+            )
+    converters = compiler.get_converters(fields)
+    if converters:
+        rows = compiler.apply_converters(rows, converters)
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def percent_of(total, this):
+    """Return `this` as a percentage of `total`."""
+    if not total:
+        return None
+    return Decimal('100.0') * (this if this is not None else 0) / total
+
+
+def group_index(rows, dimensions):
+    """Group rows by the values of the given dimensions, in one pass.
+
+    Arguments:
+        rows: a list of dicts
+        dimensions: a list of keys
+
+    Returns:
+        A dict mapping each tuple of dimension values
+        to the indices of the rows with those values.
+    """
+    groups = {}
+    for i, row in enumerate(rows):
+        key = tuple(row.get(dimension) for dimension in dimensions)
+        groups.setdefault(key, []).append(i)
+    return groups
+
+
+def _reduce_numpy(function, groups, values):
+    """Reduce each group of values with NumPy.
+
+    Returns:
+        A list of results, one per group, or None if
+        the values cannot be reduced with NumPy.
+    """
+    flat = []
+    counts = []
+    for indices in groups:
+        count = 0
+        for i in indices:
+            value = values[i]
+            if value is None:
+                continue
+            if type(value) not in (int, float):
+                return None
+            flat.append(value)
+            count += 1
+        if not count and function != 'sum' and function != 'count':
+            # let the Python implementation handle empty groups
+            return None
+        counts.append(count)
+
+    if function == 'count':
+        return counts
+
+    array = numpy.array(flat)
+    if array.dtype.kind not in 'if':
+        return None
+    integral = array.dtype.kind == 'i'
+
+    nonempty = [i for i, count in enumerate(counts) if count]
+    starts = numpy.cumsum([0] + counts)[:-1][nonempty]
+    ufunc = numpy.minimum if function == 'min' else (
+        numpy.maximum if function == 'max' else numpy.add
+    )
+    reduced = ufunc.reduceat(array, starts).tolist() if len(flat) else []
+
+    results = [0] * len(counts)
+    for i, value in zip(nonempty, reduced):
+        if function == 'avg':
+            count = counts[i]
+            if integral and value % count == 0:
+                value = value // count
+            else:
+                value = value / count
+        results[i] = value
+    return results
+
+
+def post_aggregate(rows, dimensions, key, function, ref, python):
+    """Compute a post-aggregate over grouped combine rows.
+
+    Rows are grouped by their values for `dimensions`; the function
+    is computed once per group and stored under `key` on every row.
+
+    Arguments:
+        rows: a list of dicts, updated in place
+        dimensions: the keys to group by; no keys means a single group
+        key: the key to store results under
+        function: the name of the function, e.g. "sum" or "percent"
+        ref: the key of the values to aggregate
+        python: the pure-Python implementation of the function
+    """
+    groups = list(group_index(rows, dimensions).values())
+    values = [row.get(ref) for row in rows]
+
+    if function == 'percent':
+        for indices in groups:
+            total = sum(values[i] for i in indices if values[i] is not None)
+            for i in indices:
+                rows[i][key] = percent_of(total, values[i])
+        return
+
+    results = None
+    if (
+        numpy is not None
+        and function in NUMPY_FUNCTIONS
+        and len(rows) >= NUMPY_MIN_ROWS
+    ):
+        results = _reduce_numpy(function, groups, values)
+
+    if results is None:
+        # None usually throws off statistic functions
+        results = [
+            python([values[i] for i in indices if values[i] is not None])
+            for indices in groups
+        ]
+
+    for indices, result in zip(groups, results):
+        for i in indices:
+            rows[i][key] = result
+
+
+class CombineSyntaxError(ValueError):
+    """Raised when a combine expression cannot be parsed."""
+
+
+# AST nodes for combine expressions
+Literal = namedtuple('Literal', ['value'])
+Identifier = namedtuple('Identifier', ['name'])
+Call = namedtuple('Call', ['name', 'args'])
+BinOp = namedtuple('BinOp', ['op', 'left', 'right'])
+Negate = namedtuple('Negate', ['operand'])
+# a top-level expression, e.g. "sum(a) / 2 as x"
+# text is the source text without the alias
+Expression = namedtuple('Expression', ['node', 'alias', 'text'])
+
+TOKEN_REGEX = re.compile(r'''
+    (?P<space>\s+)
+    |(?P<number>(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+))
+    |(?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+    |(?P<op>[-+*/(),])
+''', re.VERBOSE)
+
+# binding power of infix operators
+PRECEDENCE = {
+    '+': 10,
+    '-': 10,
+    '*': 20,
+    '/': 20
+}
+
+
+def tokenize(text):
+    """Split a combine expression into (kind, value, position) tokens."""
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_REGEX.match(text, position)
+        if not match:
+            raise CombineSyntaxError(
+                f"Unexpected character at position {position}: '{text[position]}'"
+            )
+        kind = match.lastgroup
+        if kind != 'space':
+            tokens.append((kind, match.group(kind), position))
+        position = match.end()
+    tokens.append(('end', None, len(text)))
+    return tokens
+
+
+class Parser(object):
+    """A Pratt parser for combine expressions.
+
+    Grammar:
+        expressions := expression ("," expression)*
+        expression := infix ("as" name)?
+        infix := prefix (operator infix)*, by precedence
+        prefix := number | name | name "(" arguments ")"
+                | "(" infix ")" | "-" prefix
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, kind, value=None):
+        token = self.next()
+        if token[0] != kind or (value is not None and token[1] != value):
+            expected = value or kind
+            raise CombineSyntaxError(
+                f"Expecting '{expected}' at position {token[2]}, "
+                f"saw: '{token[1] or 'end'}'"
+            )
+        return token
+
+    def parse(self):
+        expressions = [self.parse_expression()]
+        while self.peek()[1] == ',':
+            self.next()
+            expressions.append(self.parse_expression())
+        self.expect('end')
+        return expressions
+
+    def parse_expression(self):
+        start = self.peek()[2]
+        node = self.parse_infix(0)
+        end = self.peek()[2]
+        alias = None
+        kind, value, _ = self.peek()
+        if kind == 'name' and value.lower() == 'as':
+            self.next()
+            alias = self.parse_alias()
+        return Expression(node, alias, self.text[start:end].strip())
+
+    def parse_alias(self):
+        # aliases extend to the next top-level comma
+        start = self.peek()[2]
+        while self.peek()[0] != 'end' and self.peek()[1] != ',':
+            self.next()
+        alias = self.text[start:self.peek()[2]].strip()
+        if not alias:
+            raise CombineSyntaxError('Expecting an alias after "as"')
+        return alias
+
+    def parse_infix(self, precedence):
+        left = self.parse_prefix()
+        while True:
+            kind, value, _ = self.peek()
+            power = PRECEDENCE.get(value) if kind == 'op' else None
+            if power is None or power <= precedence:
+                return left
+            self.next()
+            left = BinOp(value, left, self.parse_infix(power))
+
+    def parse_prefix(self):
+        kind, value, position = self.next()
+        if kind == 'number':
+            return Literal(float(value) if '.' in value else int(value))
+        if kind == 'op' and value == '-':
+            operand = self.parse_prefix()
+            if isinstance(operand, Literal):
+                return Literal(-operand.value)
+            return Negate(operand)
+        if kind == 'op' and value == '(':
+            node = self.parse_infix(0)
+            self.expect('op', ')')
+            return node
+        if kind == 'name':
+            if self.peek()[1] == '(':
+                self.next()
+                args = []
+                if self.peek()[1] != ')':
+                    args.append(self.parse_infix(0))
+                    while self.peek()[1] == ',':
+                        self.next()
+                        args.append(self.parse_infix(0))
+                self.expect('op', ')')
+                return Call(value.lower(), tuple(args))
+            return Identifier(value)
+        raise CombineSyntaxError(
+            f"Expecting a value at position {position}, saw: '{value or 'end'}'"
+        )
+
+
+@lru_cache(maxsize=1024)
+def parse(text):
+    """Parse a combine expression string into a tuple of `Expression`s.
+
+    Results are cached by expression string.
+    """
+    return tuple(Parser(text).parse())
+
+
+def walk(node):
+    """Yield a node and all of its descendants."""
+    yield node
+    if isinstance(node, Call):
+        for arg in node.args:
+            yield from walk(arg)
+    elif isinstance(node, BinOp):
+        yield from walk(node.left)
+        yield from walk(node.right)
+    elif isinstance(node, Negate):
+        yield from walk(node.operand)
@@ -4,7 +4,8 @@ from django.utils.module_loading import import_string
 
 
 IMPORT_STRINGS = {
-    'API_GET_HOME'
+    'API_GET_HOME',
+    'JOB_EXECUTOR'
 }
 
 DYNAMIC_REST = {
@@ -52,6 +53,33 @@ DYNAMIC_REST = {
     # ADMIN_ICON_PACK: the admin icon pack, either fa or mdi
     'ADMIN_ICON_PACK': 'mdi',
 
+    # BULK_BATCH_SIZE: number of rows written per statement by bulk upserts,
+    # and per transaction by CSV imports
+    'BULK_BATCH_SIZE': 1000,
+
+    # COMBINE_APPROX_SAMPLE: fraction of rows sampled by combine.approx=true
+    'COMBINE_APPROX_SAMPLE': 0.01,
+
+    # COMBINE_CACHE_BACKEND: name of a Django cache shared between processes
+    # for combine results and data generations. When unset, results are
+    # only cached in process memory and only see writes in that process.
+    'COMBINE_CACHE_BACKEND': None,
+
+    # COMBINE_CACHE_STALE_WHILE_REVALIDATE: serve outdated combine results
+    # while one request recomputes them
+    'COMBINE_CACHE_STALE_WHILE_REVALIDATE': False,
+
+    # COMBINE_CACHE_TTL: number of seconds combine results are cached for
+    'COMBINE_CACHE_TTL': 300,
+
+    # COMBINE_MAX_BUCKETS: maximum number of time buckets that
+    # combine.fill generates; longer series are rejected
+    'COMBINE_MAX_BUCKETS': 10000,
+
+    # CSV_IMPORT_MAX_ERRORS: maximum number of row errors returned
+    # by a CSV import; further failed rows are only counted
+    'CSV_IMPORT_MAX_ERRORS': 100,
+
     'CURSOR_QUERY_PARAM': 'cursor',
 
     'CURSOR_ORDER_QUERY_PARAM': 'cursor.order',
@@ -63,6 +91,14 @@ DYNAMIC_REST = {
     # `deferred=False` is explicitly set on the field.
     'DEFER_MANY_RELATIONS': False,
 
+    # ENABLE_CONCURRENT_PREFETCH: run the prefetches of a root-level queryset
+    # concurrently, each with its own database connection.
+    # Prefetches run sequentially inside transactions.
+    'ENABLE_CONCURRENT_PREFETCH': False,
+
+    # CONCURRENT_PREFETCH_WORKERS: maximum number of concurrent prefetches
+    'CONCURRENT_PREFETCH_WORKERS': 4,
+
     # ENABLE_FILTERED_RELATION: should FilteredRelation be used for more accurate filtering
     # through related fields
     # downside it has some bugs in Django < 5
@@ -78,6 +114,16 @@ DYNAMIC_REST = {
     # ENABLE_BULK_UPDATE: enable/disable update in bulk
     'ENABLE_BULK_UPDATE': True,
 
+    # ENABLE_COMBINE_CACHE: cache combine results until the data
+    # of a model they depend on changes.
+    # Can be overridden at the viewset level.
+    'ENABLE_COMBINE_CACHE': False,
+
+    # ENABLE_REQUEST_COALESCING: share the rendered response of an in-flight
+    # GET request with identical concurrent requests.
+    # Can be overridden at the viewset level.
+    'ENABLE_REQUEST_COALESCING': False,
+
     # ENABLE_LINKS: enable/disable relationship links
     'ENABLE_LINKS': True,
 
@@ -105,6 +151,30 @@ DYNAMIC_REST = {
     # that disables counting during PageNumber pagination
     'EXCLUDE_COUNT_QUERY_PARAM': 'exclude_count',
 
+    # JOB_BACKEND: name of a Django cache that stores background jobs.
+    # When unset, jobs are stored in process memory, and can only be run
+    # by the default thread executor and looked up in the same process.
+    'JOB_BACKEND': None,
+
+    # JOB_EXECUTOR: import path of the `dynamic_rest.jobs.JobExecutor`
+    # class that runs background jobs
+    'JOB_EXECUTOR': 'dynamic_rest.jobs.ThreadJobExecutor',
+
+    # JOB_MAX_RESPONSE_SIZE: maximum size, in bytes, of the JSON response
+    # to a chunk that a job records; larger ones are recorded without data
+    'JOB_MAX_RESPONSE_SIZE': 10000,
+
+    # JOB_MIN_ROWS: minimum number of rows for a bulk request with
+    # `Prefer: respond-async` to run as a background job;
+    # smaller requests run right away
+    'JOB_MIN_ROWS': 100,
+
+    # JOB_TTL: number of seconds background jobs are kept for
+    'JOB_TTL': 86400,
+
+    # JOB_WORKERS: number of threads of the default job executor
+    'JOB_WORKERS': 2,
+
     # MAX_PAGE_SIZE: global setting for max page size.
     # Can be overriden at the viewset level.
     'MAX_PAGE_SIZE': None,
@@ -129,6 +199,25 @@ DYNAMIC_REST = {
     # PAGE_SIZE_QUERY_PARAM: global setting for the page size query parameter.
     # Can be overriden at the viewset level.
     'PAGE_SIZE_QUERY_PARAM': 'per_page',
+
+    # REQUEST_COALESCING_BACKEND: name of a Django cache used to coalesce
+    # requests across processes; by default, only requests within
+    # a process are coalesced.
+    'REQUEST_COALESCING_BACKEND': None,
+
+    # REQUEST_COALESCING_TIMEOUT: maximum number of seconds to wait for an
+    # identical in-flight request before computing the response anyway.
+    'REQUEST_COALESCING_TIMEOUT': 30,
+
+    # SIDELOAD_CACHE_BACKEND: name of a Django cache shared between
+    # processes by serializers with `Meta.sideload_cache` set.
+    # When unset, sideloads are only cached in process memory.
+    'SIDELOAD_CACHE_BACKEND': None,
+
+    # STREAMING_CHUNK_SIZE: number of rows fetched from the database cursor
+    # at a time by streaming renderers, e.g. format=csv or format=ndjson.
+    # Prefetches run once per chunk.
+    'STREAMING_CHUNK_SIZE': 2000,
 }
 
 
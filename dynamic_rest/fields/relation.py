@@ -3,10 +3,12 @@ import pickle
 
 from rest_framework.serializers import CreateOnlyDefault, CurrentUserDefault
 from django.utils.functional import cached_property
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.exceptions import (
     APIException,
     NotFound,
-    ParseError
+    ParseError,
+    ValidationError
 )
 from rest_framework import fields
 from dynamic_rest.conf import settings
@@ -20,6 +22,90 @@ from .base import (
 from dynamic_rest.base import DynamicBase
 
 
+class RelationResolver(object):
+    """Looks up related objects by primary key, one query per model.
+
+    Ids are gathered from a whole payload with `collect` (or `add`),
+    and fetched with a single `in_bulk` per related model the first
+    time any of them is needed. Pass one as the "relation_resolver"
+    serializer context to share it across the rows of a bulk request.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.found = {}
+        self.missing = {}
+
+    def _to_pk(self, model, value):
+        try:
+            return model._meta.pk.to_python(value)
+        except DjangoValidationError:
+            return None
+
+    def add(self, model, values):
+        pending = self.pending.setdefault(model, set())
+        for value in values:
+            if value is None or value == '' or isinstance(value, model):
+                continue
+            try:
+                pending.add(self._to_pk(model, value))
+            except TypeError:
+                # unhashable, e.g. nested data
+                continue
+
+    def collect(self, serializer, rows):
+        """Gather the related ids of every relation field in `rows`."""
+        for field in serializer.fields.values():
+            if not isinstance(field, DynamicRelationField) or field.read_only:
+                continue
+            model = field.get_model()
+            if model is None:
+                continue
+            values = []
+            for row in rows:
+                if not hasattr(row, 'get'):
+                    continue
+                value = field.get_value(row)
+                if isinstance(value, (list, tuple)):
+                    values.extend(value)
+                elif value is not fields.empty:
+                    values.append(value)
+            self.add(model, values)
+
+    def get_many(self, model, values):
+        """Look up related objects.
+
+        Returns:
+            A tuple of (objects, missing): the objects in the order of
+            `values`, and the values that matched no object.
+        """
+        self.add(model, values)
+        found = self.found.setdefault(model, {})
+        missing = self.missing.setdefault(model, set())
+        pending = self.pending.pop(model, set()) - set(found) - missing
+        pending.discard(None)
+        if pending:
+            fetched = model._default_manager.in_bulk(list(pending))
+            found.update(fetched)
+            missing.update(pending - set(fetched))
+
+        objects = []
+        not_found = []
+        for value in values:
+            if isinstance(value, model):
+                objects.append(value)
+                continue
+            try:
+                obj = found.get(self._to_pk(model, value))
+            except TypeError:
+                obj = None
+            if obj is None:
+                not_found.append(value)
+            else:
+                objects.append(obj)
+        return objects, not_found
+
+
 class DynamicRelationField(WithRelationalFieldMixin, DynamicField):
 
     """Field proxy for a nested serializer.
@@ -386,19 +472,40 @@ class DynamicRelationField(WithRelationalFieldMixin, DynamicField):
                 )
             )
 
+    def get_relation_resolver(self):
+        """Get the request's shared `RelationResolver`, if any."""
+        resolver = self.context.get('relation_resolver')
+        return resolver if resolver is not None else RelationResolver()
+
     def to_internal_value_single(self, data):
         """Return the underlying object, given the serialized form."""
         model = self.get_model()
         if isinstance(data, model):
             return data
-        try:
-            instance = model.objects.get(pk=data)
-        except model.DoesNotExist:
+        objects, missing = self.get_relation_resolver().get_many(model, [data])
+        if missing:
             raise NotFound(
                 '"%s" with ID "%s" not found' %
                 (model.__name__, data)
             )
-        return instance
+        return objects[0]
+
+    def to_internal_value_many(self, data):
+        """Return the underlying objects, given a list of serialized forms.
+
+        All of the objects are looked up at once, and every missing ID
+        is reported in one validation error.
+        """
+        model = self.get_model()
+        objects, missing = self.get_relation_resolver().get_many(model, data)
+        if missing:
+            raise ValidationError(
+                '"%s" with IDs %s not found' % (
+                    model.__name__,
+                    ', '.join('"%s"' % value for value in missing)
+                )
+            )
+        return objects
 
     def run_validation(self, data):
         return super(DynamicRelationField, self).run_validation(data)
@@ -408,11 +515,7 @@ class DynamicRelationField(WithRelationalFieldMixin, DynamicField):
         if self.kwargs['many']:
             if not isinstance(data, list):
                 raise ParseError('"%s" value must be a list' % self.field_name)
-            return [
-                self.to_internal_value_single(
-                    instance,
-                ) for instance in data
-            ]
+            return self.to_internal_value_many(data)
         return self.to_internal_value_single(data)
 
     @property
@@ -1,6 +1,7 @@
 """This module contains custom filter backends."""
 
 import json
+from asgiref.sync import sync_to_async
 from django.core.exceptions import ValidationError as InternalValidationError
 from django.core.exceptions import ImproperlyConfigured
 from django.db import models
@@ -10,10 +11,17 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.filters import BaseFilterBackend, OrderingFilter
 
 from dynamic_rest.utils import is_truthy, has_joins
+from dynamic_rest.cache import SideloadCache
 from dynamic_rest.conf import settings
 from dynamic_rest.datastructures import TreeMap
 from dynamic_rest import fields as dfields
 from dynamic_rest.meta import Meta, get_related_model
+from dynamic_rest.prefetch import (
+    CachedSideload,
+    add_cached_sideloads,
+    resolve_cached_sideloads,
+    set_concurrent_prefetch
+)
 
 from dynamic_rest.django_utils import get_filter_kwargs
 
@@ -563,9 +571,20 @@ class DynamicFilterBackend(WithGetSerializerClass, BaseFilterBackend):
             required = requirements.pop(source, None)
 
             query_name = Meta.get_query_name(original_field.model_field)
+            related_filters = filters.get(query_name, {})
+            sideload_cache = self._get_sideload_cache(
+                field, meta, source, related_queryset, related_filters
+            )
+            if sideload_cache:
+                # cached instances are shared across requests,
+                # so they must be loaded with all of their fields
+                if required is None:
+                    required = TreeMap()
+                required["*"] = TreeMap()
+
             prefetch_queryset = self._build_queryset(
                 serializer=field,
-                filters=filters.get(query_name, {}),
+                filters=related_filters,
                 queryset=related_queryset,
                 requirements=required,
             )
@@ -575,10 +594,55 @@ class DynamicFilterBackend(WithGetSerializerClass, BaseFilterBackend):
             # the same source. This could break in some cases,
             # but is mostly an issue on writes when we use all
             # fields by default.
-            prefetches[source] = Prefetch(source, queryset=prefetch_queryset)
+            if sideload_cache:
+                prefetches[source] = CachedSideload(
+                    source, prefetch_queryset, sideload_cache
+                )
+            else:
+                prefetches[source] = Prefetch(source, queryset=prefetch_queryset)
 
         return prefetches
 
+    def _get_sideload_cache(self, serializer, meta, source, queryset, filters):
+        """Get the sideload cache for a related serializer, if usable.
+
+        Only unfiltered forward foreign keys to serializers that
+        declare `Meta.sideload_cache` can be served from the cache,
+        and only to users with full read access.
+        """
+        options = getattr(serializer.Meta, "sideload_cache", None)
+        if not options or queryset is not None or filters:
+            return None
+        if hasattr(serializer, "filter_queryset"):
+            return None
+        access = self._get_read_access(serializer)
+        if access is not None and not access.full_access:
+            return None
+
+        model_field = meta.get_field(source)
+        if not (
+            getattr(model_field, "many_to_one", False)
+            and model_field.concrete
+            and model_field.target_field.primary_key
+        ):
+            return None
+
+        return SideloadCache.for_model(serializer.get_model(), options)
+
+    def _get_read_access(self, serializer):
+        """Get the request user's read access to a related serializer.
+
+        Returns:
+            A permissions `Filter`, or None if the serializer
+            does not restrict access for this user.
+        """
+        get_user_permissions = getattr(serializer, "get_user_permissions", None)
+        user = getattr(self.request, "user", None)
+        if get_user_permissions is None or user is None:
+            return None
+        permissions = get_user_permissions(user)
+        return permissions.read if permissions else None
+
     def _get_implicit_requirements(self, fields, requirements):
         """Extract internal prefetch requirements from serializer fields."""
         for _, field in fields.items():
@@ -695,6 +759,22 @@ class DynamicFilterBackend(WithGetSerializerClass, BaseFilterBackend):
                     err_msg = f"Invalid filter: {str(e)}"
                 raise ValidationError(err_msg)
 
+        if not is_root_level:
+            # rows of related serializers that the user
+            # cannot read are never fetched
+            access = self._get_read_access(serializer)
+            if access is not None and not access.full_access:
+                if access.no_access:
+                    queryset = queryset.none()
+                else:
+                    # in a subquery, so that joins of the permission filter
+                    # are not merged with the joins of the prefetch
+                    queryset = queryset.filter(
+                        pk__in=model._default_manager.filter(
+                            access.filters
+                        ).values("pk")
+                    )
+
         # A serializer can have this optional function
         # to dynamically apply additional filters on
         # any queries that will use that serializer
@@ -705,16 +785,58 @@ class DynamicFilterBackend(WithGetSerializerClass, BaseFilterBackend):
             queryset = serializer.filter_queryset(queryset)
 
         # add prefetches and remove duplicates if necessary
-        prefetch = prefetches.values()
+        prefetch = [
+            p for p in prefetches.values() if not isinstance(p, CachedSideload)
+        ]
         queryset = queryset.prefetch_related(*prefetch)
         if has_joins(queryset) or not is_root_level:
             queryset = queryset.distinct()
 
+        # sideloads served from the cache are resolved
+        # once the queryset has been evaluated
+        queryset = add_cached_sideloads(
+            queryset,
+            [p for p in prefetches.values() if isinstance(p, CachedSideload)],
+        )
+
+        # sibling prefetches are independent once root rows are known
+        if is_root_level and len(prefetch) > 1 and settings.ENABLE_CONCURRENT_PREFETCH:
+            queryset = set_concurrent_prefetch(
+                queryset, settings.CONCURRENT_PREFETCH_WORKERS
+            )
+
         if self.DEBUG:
             queryset._using_prefetches = prefetches
         return queryset
 
 
+class AsyncDynamicFilterBackend(DynamicFilterBackend):
+    """A DynamicFilterBackend for views that run under ASGI.
+
+    Querysets are built exactly as in `DynamicFilterBackend`;
+    this backend adds coroutines to evaluate them with the async ORM.
+
+    Attributes:
+        chunk_size: number of rows fetched (and prefetched) per chunk.
+    """
+
+    chunk_size = 2000
+
+    async def afilter_queryset(self, request, queryset, view):
+        # building a queryset is lazy and does not hit the database
+        return self.filter_queryset(request, queryset, view)
+
+    async def aevaluate(self, queryset):
+        """Evaluate a queryset built by this backend."""
+        instances = [
+            instance
+            async for instance in queryset.aiterator(chunk_size=self.chunk_size)
+        ]
+        if getattr(queryset, "_cached_sideloads", None):
+            await sync_to_async(resolve_cached_sideloads)(queryset, instances)
+        return instances
+
+
 class DynamicSortingFilter(WithGetSerializerClass, OrderingFilter):
     """Subclass of DRF's OrderingFilter.
 
@@ -0,0 +1,391 @@
+"""This module contains background jobs for large bulk writes."""
+import copy
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import exceptions, viewsets
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from dynamic_rest.cache import LocalCache, get_shared_cache
+from dynamic_rest.compat import NoReverseMatch, reverse
+from dynamic_rest.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# the URL name of `JobViewSet` when registered as "jobs"
+JOB_URL_NAME = 'jobs-detail'
+
+# request headers that are not replayed: jobs run as the user
+# who queued them, and the payload is re-encoded
+SKIPPED_HEADERS = (
+    'HTTP_AUTHORIZATION',
+    'HTTP_COOKIE',
+    'HTTP_X_CSRFTOKEN',
+    'HTTP_CONTENT_LENGTH',
+    'HTTP_CONTENT_TYPE'
+)
+
+JOB_FIELDS = (
+    'id',
+    'status',
+    'method',
+    'total',
+    'processed',
+    'results',
+    'errors',
+    'created',
+    'finished'
+)
+
+
+class JobStore(object):
+    """Stores job records, as plain dicts keyed by job id.
+
+    Records live in the Django cache named by `JOB_BACKEND`, or,
+    if unset, in process memory, where only jobs run by a thread
+    of the same process can update them. The request that a job
+    replays is stored once, apart from its record, which is
+    rewritten as the job runs.
+    """
+
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __init__(self, ttl, backend=None):
+        self.ttl = ttl
+        self.shared = get_shared_cache(backend)
+        self.local = LocalCache(ttl=ttl)
+        self._claim_lock = threading.Lock()
+
+    @classmethod
+    def for_settings(cls):
+        """Get the store configured by the JOB_* settings."""
+        options = (settings.JOB_TTL, settings.JOB_BACKEND)
+        if options not in cls._instances:
+            with cls._lock:
+                if options not in cls._instances:
+                    cls._instances[options] = cls(*options)
+        return cls._instances[options]
+
+    def _key(self, job_id):
+        return 'drest:job:%s' % job_id
+
+    def get(self, job_id):
+        key = self._key(job_id)
+        if self.shared is None:
+            # records are copied so that readers never see partial updates
+            return copy.deepcopy(self.local.get(key))
+        return self.shared.get(key)
+
+    def get_payload(self, job_id):
+        key = '%s:payload' % self._key(job_id)
+        if self.shared is None:
+            # payloads are only read once stored
+            return self.local.get(key)
+        return self.shared.get(key)
+
+    def set_payload(self, job_id, payload):
+        key = '%s:payload' % self._key(job_id)
+        if self.shared is None:
+            self.local.set(key, payload)
+        else:
+            self.shared.set(key, payload, self.ttl)
+
+    def claim(self, job_id):
+        """Claim a job for a worker.
+
+        Returns:
+            True for the first caller only, so that a job that is
+            submitted (or retried) more than once runs once.
+        """
+        key = '%s:claim' % self._key(job_id)
+        if self.shared is None:
+            with self._claim_lock:
+                return self.local.add(key, True)
+        return self.shared.add(key, True, self.ttl)
+
+    def set(self, job):
+        key = self._key(job['id'])
+        if self.shared is None:
+            self.local.set(key, copy.deepcopy(job))
+        else:
+            self.shared.set(key, job, self.ttl)
+
+
+class JobExecutor(object):
+    """Runs queued jobs.
+
+    Subclasses implement `submit`. Executors backed by an external queue
+    should pass the job id to a worker that calls `run_job(job_id)`,
+    and need a `JOB_BACKEND` shared with the web processes.
+    """
+
+    def submit(self, job_id):
+        raise NotImplementedError()
+
+
+class InlineJobExecutor(JobExecutor):
+    """Runs jobs right away, in the calling thread.
+
+    Useful for tests and development.
+    """
+
+    def submit(self, job_id):
+        run_job(job_id)
+
+
+class ThreadJobExecutor(JobExecutor):
+    """Runs jobs in a thread pool of `JOB_WORKERS` threads."""
+
+    _pools = {}
+    _lock = threading.Lock()
+
+    def get_pool(self):
+        max_workers = settings.JOB_WORKERS
+        with self._lock:
+            if max_workers not in self._pools:
+                self._pools[max_workers] = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix='drest-job'
+                )
+            return self._pools[max_workers]
+
+    def _run(self, job_id):
+        try:
+            run_job(job_id)
+        finally:
+            # worker threads hold their own connections
+            connections.close_all()
+
+    def submit(self, job_id):
+        self.get_pool().submit(self._run, job_id)
+
+
+_executors = {}
+
+
+def get_job_executor():
+    """Get an instance of the `JOB_EXECUTOR` class."""
+    executor_class = settings.JOB_EXECUTOR
+    if executor_class not in _executors:
+        _executors[executor_class] = executor_class()
+    return _executors[executor_class]
+
+
+def get_job_url(job_id):
+    """Get the URL of a job, or None if `JobViewSet` is not registered."""
+    try:
+        return reverse(JOB_URL_NAME, kwargs={'pk': job_id})
+    except NoReverseMatch:
+        return None
+
+
+def get_job_data(job):
+    """Get the public representation of a job record."""
+    data = {field: job[field] for field in JOB_FIELDS}
+    data['url'] = get_job_url(job['id'])
+    return data
+
+
+def _get_meta(request):
+    """Get the parts of a request's environment that jobs replay.
+
+    These are the server, scheme and headers, e.g. for host routing,
+    content negotiation or versioning; `respond-async` is dropped from
+    the `Prefer` header, so that replayed chunks run right away.
+    """
+    meta = {
+        name: value for name, value in request.META.items()
+        if name.startswith('HTTP_') and name not in SKIPPED_HEADERS
+    }
+    for name in ('SERVER_NAME', 'SERVER_PORT', 'SCRIPT_NAME', 'REMOTE_ADDR'):
+        if name in request.META:
+            meta[name] = str(request.META[name])
+    meta['wsgi.url_scheme'] = request.scheme
+    prefer = [
+        preference for preference in meta.pop('HTTP_PREFER', '').split(',')
+        if preference.strip() and
+        preference.split(';')[0].strip().lower() != 'respond-async'
+    ]
+    if prefer:
+        meta['HTTP_PREFER'] = ','.join(prefer)
+    return meta
+
+
+def _build_request(method, meta, path_info, query, data):
+    body = json.dumps(data).encode('utf-8')
+    environ = dict(meta)
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body)
+    })
+    return WSGIRequest(environ)
+
+
+def create_job(viewset, request, data):
+    """Store a job that replays a bulk request in the background.
+
+    Arguments:
+        viewset: the viewset instance handling the request
+        request: the request
+        data: the rows of the bulk payload
+
+    Returns:
+        The job record.
+    """
+    viewset_class = type(viewset)
+    user = request.user
+    job = {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'method': request.method,
+        'total': len(data),
+        'processed': 0,
+        'results': [],
+        'errors': [],
+        'created': timezone.now().isoformat(),
+        'finished': None,
+        'user': user.pk if user and user.is_authenticated else None
+    }
+    store = JobStore.for_settings()
+    store.set_payload(job['id'], {
+        'viewset': '%s.%s' % (
+            viewset_class.__module__, viewset_class.__qualname__
+        ),
+        'actions': viewset.action_map,
+        'kwargs': viewset.kwargs,
+        'path': request.path_info,
+        'query': request.META.get('QUERY_STRING', ''),
+        'meta': _get_meta(request),
+        'data': data
+    })
+    store.set(job)
+    return job
+
+
+def _get_user(pk):
+    if pk is None:
+        return AnonymousUser()
+    return get_user_model()._default_manager.get(pk=pk)
+
+
+def _record(entry, data):
+    """Add the data of a response to the entry of its chunk, if it is small."""
+    content = JSONRenderer().render(data) if data is not None else b''
+    if len(content) > settings.JOB_MAX_RESPONSE_SIZE:
+        entry['data'] = None
+        entry['truncated'] = True
+    else:
+        entry['data'] = json.loads(content) if content else None
+    return entry
+
+
+def run_job(job_id):
+    """Run a queued job.
+
+    The stored request is replayed as the user who made it, with the
+    same host and headers, in chunks of `BULK_BATCH_SIZE` rows, each in
+    its own transaction. Jobs only run once, even if submitted again.
+    The job's progress, and the response to each chunk, are saved as it runs:
+    successful responses go to "results" and failed ones to "errors",
+    each with the range of rows it covers. Responses larger than
+    `JOB_MAX_RESPONSE_SIZE` are recorded without their data.
+    """
+    store = JobStore.for_settings()
+    job = store.get(job_id)
+    if job is None or job['status'] != 'queued' or not store.claim(job_id):
+        return
+
+    spec = store.get_payload(job_id)
+    if spec is None:
+        # e.g. expired, or too large for the cache backend
+        job['status'] = 'failed'
+        job['errors'].append({
+            'rows': [0, job['total']],
+            'detail': 'The request of this job could not be found.'
+        })
+        job['finished'] = timezone.now().isoformat()
+        store.set(job)
+        return
+
+    job['status'] = 'running'
+    store.set(job)
+    rows = spec['data']
+    batch_size = settings.BULK_BATCH_SIZE
+    offset = 0
+    try:
+        view = import_string(spec['viewset']).as_view(spec['actions'])
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        user = _get_user(job['user'])
+        while offset < len(rows):
+            chunk = rows[offset:offset + batch_size]
+            request = _build_request(
+                job['method'],
+                spec['meta'],
+                spec['path'],
+                spec['query'],
+                chunk
+            )
+            request._force_auth_user = user
+            with transaction.atomic():
+                response = view(request, **spec['kwargs'])
+            entry = _record({
+                'rows': [offset, offset + len(chunk)],
+                'status': response.status_code
+            }, response.data)
+            if response.status_code >= 400:
+                job['errors'].append(entry)
+            else:
+                job['results'].append(entry)
+            offset += len(chunk)
+            job['processed'] = offset
+            store.set(job)
+        job['status'] = 'completed'
+    except Exception as e:
+        logger.exception('Job %s failed', job_id)
+        job['status'] = 'failed'
+        job['errors'].append({
+            'rows': [offset, len(rows)],
+            'detail': str(e)
+        })
+    job['finished'] = timezone.now().isoformat()
+    store.set(job)
+
+
+class JobViewSet(viewsets.ViewSet):
+    """Exposes the progress, errors and results of background jobs.
+
+    Jobs are only visible to the user who queued them, and to staff.
+    Register it as "jobs" so that queued jobs link to it, e.g.:
+
+        router.register(r'jobs', JobViewSet)
+    """
+
+    def retrieve(self, request, pk=None):
+        job = JobStore.for_settings().get(pk)
+        if job is None:
+            raise exceptions.NotFound()
+        user = request.user
+        if job['user'] is not None and not (
+            user.is_authenticated
+            and (user.pk == job['user'] or user.is_staff)
+        ):
+            raise exceptions.NotFound()
+        return Response({'job': get_job_data(job)})
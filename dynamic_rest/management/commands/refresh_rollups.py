@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import get_resolver
+
+from dynamic_rest.rollups import get_rollups
+
+
+def get_viewsets(patterns):
+    """Get the viewset classes routed by URL patterns, in order."""
+    viewsets = []
+    for pattern in patterns:
+        if hasattr(pattern, 'url_patterns'):
+            found = get_viewsets(pattern.url_patterns)
+        else:
+            found = [getattr(pattern.callback, 'cls', None)]
+        for viewset in found:
+            if viewset is not None and viewset not in viewsets:
+                viewsets.append(viewset)
+    return viewsets
+
+
+class Command(BaseCommand):
+    help = 'Build or refresh the rollup tables declared by viewsets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help='Only refresh rollups with these names.'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rebuild tables from scratch instead of refreshing them.'
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='The database to refresh rollups in.'
+        )
+
+    def handle(self, *args, **options):
+        viewsets = get_viewsets(get_resolver().url_patterns)
+        names = set(options['names'])
+        rollups = [
+            rollup
+            for viewset in viewsets
+            for rollup in get_rollups(viewset)
+            if not names or rollup.name in names
+        ]
+        missing = names - {rollup.name for rollup in rollups}
+        if missing:
+            raise CommandError(
+                'Unknown rollups: %s' % ', '.join(sorted(missing))
+            )
+
+        for rollup in rollups:
+            if options['rebuild']:
+                rollup.build(using=options['database'])
+            else:
+                rollup.refresh(using=options['database'])
+            self.stdout.write('Refreshed %s' % rollup.table)
@@ -1,6 +1,7 @@
 """Module containing Django meta helpers."""
 from itertools import chain
 
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
 
 from dynamic_rest.related import RelatedObject
@@ -180,3 +181,23 @@ def get_model_field(model, field_name):
 
 def is_field_remote(model, field_name):
     return Meta(model).is_field_remote(field_name)
+
+
+def is_unique(model, field_names):
+    """Whether a set of model fields has an unconditional unique constraint."""
+    meta = model._meta
+    names = set(field_names)
+    if len(names) == 1:
+        try:
+            if meta.get_field(next(iter(names))).unique:
+                return True
+        except FieldDoesNotExist:
+            return False
+    if any(set(together) == names for together in meta.unique_together):
+        return True
+    return any(
+        isinstance(constraint, models.UniqueConstraint)
+        and constraint.condition is None
+        and set(constraint.fields) == names
+        for constraint in meta.constraints
+    )
@@ -2,6 +2,7 @@
 import base64
 from collections import OrderedDict
 
+from asgiref.sync import sync_to_async
 from django.utils.functional import cached_property
 from django.core.paginator import InvalidPage
 
@@ -85,10 +86,12 @@ class DynamicPageNumberPagination(PageNumberPagination):
         cursor = request.query_params.get(self.cursor_query_param)
         return cursor
 
-    def paginate_queryset(self, queryset, request, **_):
-        """
-        Paginate a queryset if required, either returning a
-        page object, or `None` if pagination is not configured for this view.
+    def create_paginator(self, queryset, request):
+        """Create a paginator, without resolving the requested page.
+
+        Returns:
+            A tuple of (paginator, page_size), or `None` if
+            pagination is not configured for this view.
         """
         if 'exclude_count' in self.__dict__:
             self.__dict__.pop('exclude_count')
@@ -113,17 +116,34 @@ class DynamicPageNumberPagination(PageNumberPagination):
             paginator = self.django_paginator_class(
                 queryset, page_size, exclude_count=self.exclude_count
             )
+        return paginator, page_size
+
+    def get_paginator(self, queryset, request):
+        """Get a paginator and the requested page index.
+
+        Returns:
+            A tuple of (paginator, index, page_size), or `None` if
+            pagination is not configured for this view.
+        """
+        paginator = self.create_paginator(queryset, request)
+        if paginator is None:
+            return None
 
+        paginator, page_size = paginator
+        cursor = self.get_cursor(request)
         index = self.get_page_number(request, paginator) if not cursor else cursor
+        return paginator, index, page_size
+
+    def get_page(self, paginator, index):
         try:
-            self.page = paginator.page(index)
+            return paginator.page(index)
         except InvalidPage as exc:
             msg = self.invalid_page_message.format(
                 page_number=index, message=str(exc)
             )
             raise NotFound(msg)
 
-        result = list(self.page)
+    def get_page_results(self, result, page_size):
         if self.exclude_count:
             if len(result) > page_size:
                 # if exclude_count is set, we fetch one extra item
@@ -132,3 +152,44 @@ class DynamicPageNumberPagination(PageNumberPagination):
             else:
                 self.more_pages = False
         return result
+
+    def paginate_queryset(self, queryset, request, **_):
+        """
+        Paginate a queryset if required, either returning a
+        page object, or `None` if pagination is not configured for this view.
+        """
+        paginator = self.get_paginator(queryset, request)
+        if paginator is None:
+            return None
+
+        paginator, index, page_size = paginator
+        self.page = self.get_page(paginator, index)
+        return self.get_page_results(list(self.page), page_size)
+
+    async def apaginate_queryset(self, queryset, request, evaluate, **_):
+        """Paginate a queryset with the async ORM.
+
+        Arguments:
+            queryset: a queryset
+            request: a request
+            evaluate: a coroutine function that takes a queryset
+                and returns a list of instances
+        """
+        paginator = self.create_paginator(queryset, request)
+        if paginator is None:
+            return None
+
+        paginator, page_size = paginator
+        cursor = self.get_cursor(request)
+        if cursor:
+            # cursor pages are evaluated eagerly
+            self.page = await sync_to_async(self.get_page)(paginator, cursor)
+            return self.get_page_results(list(self.page), page_size)
+
+        if not self.exclude_count:
+            # resolved before the page number, which can depend on it
+            paginator.count = await paginator.object_list.acount()
+        index = self.get_page_number(request, paginator)
+        self.page = self.get_page(paginator, index)
+        self.page.object_list = await evaluate(self.page.object_list)
+        return self.get_page_results(list(self.page), page_size)
@@ -4,12 +4,68 @@ from rest_framework import exceptions
 from rest_framework.fields import flatten_choices_dict, to_choices_dict
 from django.utils.functional import cached_property
 
+from dynamic_rest.cache import LocalCache
+
 
 class Me(object):
     def __repr__(self):
         return "<the current user>"
 
 
+class MyPk(object):
+    """Placeholder for the primary key of the current user."""
+
+    def __repr__(self):
+        return "<the current user's pk>"
+
+
+def is_me(value):
+    return isinstance(value, Me) or value is Me
+
+
+def compile_filter(spec):
+    """Compile a filter spec into a `Q` template.
+
+    `Me` values are left in place, to be bound to a user with `bind_filter`.
+    Booleans and other access-granting specs are returned as they are.
+    """
+    if spec is True or spec is False or spec is None or spec == {}:
+        return spec
+    if isinstance(spec, Q):
+        return spec
+    if is_me(spec):
+        return Q(pk=MyPk)
+    if isinstance(spec, dict):
+        return Q(**{k: Me if is_me(v) else v for k, v in spec.items()})
+    raise Exception("Not sure how to deal with: %s" % spec)
+
+
+def bind_filter(q, user):
+    """Replace the placeholders of a `Q` template with a user's values.
+
+    Nodes without placeholders are shared with the template.
+    """
+    children = []
+    changed = False
+    for child in q.children:
+        if isinstance(child, Q):
+            bound = bind_filter(child, user)
+        elif not isinstance(child, tuple):
+            # e.g. an `Exists` expression
+            bound = child
+        elif is_me(child[1]):
+            bound = (child[0], user)
+        elif child[1] is MyPk:
+            bound = (child[0], user.pk)
+        else:
+            bound = child
+        changed = changed or bound is not child
+        children.append(bound)
+    if not changed:
+        return q
+    return Q.create(children, connector=q.connector, negated=q.negated)
+
+
 class Filter(object):
     def __repr__(self):
         return str(self.spec)
@@ -195,16 +251,92 @@ class Role(object):
         )
 
 
+class CompiledPermissions(object):
+    """The permissions of a set of roles, compiled once for all their users.
+
+    Filters are ORed together into `Q` templates, which are bound
+    to each user's values on use. Callable specs depend on the user,
+    so actions that use them are evaluated on every request instead.
+
+    Arguments:
+        spec: a `Meta.permissions` dict
+        roles: the names of the roles held
+        allowed: the actions allowed by the view
+    """
+
+    _cache = LocalCache(max_entries=1000)
+
+    def __init__(self, spec, roles, allowed):
+        self.spec = spec
+        self.roles = [v for k, v in spec.items() if k in roles]
+        self.allowed = allowed
+        self.compiled = {
+            name: self._compile(name)
+            for name in Permissions.ALL_METHODS | {"fields"}
+        }
+
+    @classmethod
+    def get(cls, spec, roles, allowed, key=None):
+        """Get the compiled permissions of a set of roles.
+
+        Arguments:
+            spec: a `Meta.permissions` dict
+            roles: a frozenset of the names of the roles held
+            allowed: the actions allowed by the view
+            key: optional owner of the spec, e.g. a serializer class
+        """
+        allowed = frozenset(allowed)
+        cache_key = (key if key is not None else id(spec), roles, allowed)
+        compiled = cls._cache.get(cache_key)
+        if compiled is None or compiled.spec is not spec:
+            compiled = cls(spec, roles, allowed)
+            cls._cache.set(cache_key, compiled)
+        return compiled
+
+    def _compile(self, name):
+        if name != "fields" and name not in self.allowed:
+            # method not allowed at the view level
+            return Filter.NO_ACCESS
+
+        result = None
+        for role in self.roles:
+            spec = role.get(name, None if name == "fields" else False)
+            while isinstance(spec, Filter):
+                spec = spec.spec
+            if callable(spec):
+                return None
+            if name == "fields":
+                f = Fields.NO_ACCESS if spec is None else Fields(spec)
+            else:
+                f = Filter(compile_filter(spec))
+            result = f if result is None else result | f
+        return result if result is not None else Filter.NO_ACCESS
+
+    def bind(self, name, user):
+        """Get the filter of an action for a user."""
+        compiled = self.compiled[name]
+        if compiled is None:
+            result = None
+            for spec in self.roles:
+                f = getattr(Role(spec, user), name)
+                result = f if result is None else result | f
+            return result
+        if name == "fields" or compiled.full_access or compiled.no_access:
+            return compiled
+        return Filter(bind_filter(compiled.filters, user), user)
+
+
 class Permissions(object):
     ALL_METHODS = {"read", "list", "create", "update", "delete"}
 
     def __repr__(self):
         return str(self.spec)
 
-    def __init__(self, spec, user, allowed=None):
+    def __init__(self, spec, user, allowed=None, key=None):
         self.allowed = self.ALL_METHODS if allowed is None else allowed
         self.spec = spec
         self.user = user
+        self.key = key
 
     def has_role(self, role):
         if role == "*":
@@ -217,6 +349,16 @@ class Permissions(object):
         user = self.user
         return [Role(v, user) for k, v in self.spec.items() if self.has_role(k)]
 
+    @cached_property
+    def role_names(self):
+        return frozenset(k for k in self.spec if self.has_role(k))
+
+    @cached_property
+    def compiled(self):
+        return CompiledPermissions.get(
+            self.spec, self.role_names, self.allowed, key=self.key
+        )
+
     @cached_property
     def fields(self):
         return self.get("fields")
@@ -242,20 +384,7 @@ class Permissions(object):
         return self.get("create")
 
     def get(self, name):
-        if name != "fields" and name not in self.allowed:
-            # method not allowed at the view level
-            return Filter.NO_ACCESS
-
-        roles = self.roles
-        f = None
-        for role in roles:
-            r = getattr(role, name)
-            if f is None:
-                f = r
-            else:
-                f |= r
-
-        result = f if f is not None else Filter.NO_ACCESS
+        result = self.compiled.bind(name, self.user)
 
         # if self.user.is_superuser and result.no_access and name != 'fields':
         #    # unless blocked by view.http_method_names, superuser has full access
@@ -274,7 +403,41 @@ class Permissions(object):
         }
 
 
+class CreateChecks(object):
+    """Filtered create checks, deferred and run in batches.
+
+    Bulk creation records the primary keys of created instances here
+    instead of checking them one at a time; `verify` then counts the
+    permitted ones with one query per batch.
+    """
+
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self.pending = {}
+
+    def add(self, model, filters, pk):
+        self.pending.setdefault((model, filters), []).append(pk)
+
+    def verify(self):
+        """Raise PermissionDenied unless every recorded instance passes."""
+        pending, self.pending = self.pending, {}
+        for (model, filters), pks in pending.items():
+            pks = list(set(pks))
+            for i in range(0, len(pks), self.BATCH_SIZE):
+                batch = pks[i:i + self.BATCH_SIZE]
+                if (
+                    model._default_manager.filter(filters)
+                    .filter(pk__in=batch)
+                    .count()
+                ) != len(batch):
+                    raise exceptions.PermissionDenied()
+
+
 class PermissionsSerializerMixin(object):
+    # set to a `CreateChecks` to defer filtered create checks
+    create_checks = None
+
     def initialized(self, **kwargs):
         super(PermissionsSerializerMixin, self).initialized(**kwargs)
         if not kwargs.get("nested", False):
@@ -306,7 +469,7 @@ class PermissionsSerializerMixin(object):
 
         permissions = getattr(cls.get_meta(), "permissions", None)
         if permissions:
-            return Permissions(permissions, user, allowed=allowed)
+            return Permissions(permissions, user, allowed=allowed, key=cls)
 
         return None
 
@@ -345,7 +508,9 @@ class PermissionsSerializerMixin(object):
                 else:
                     # check filters
                     model = self.get_model()
-                    if model:
+                    if model and self.create_checks is not None:
+                        self.create_checks.add(model, access.filters, instance.pk)
+                    elif model:
                         if (
                             not model.objects.filter(access.filters)
                             .filter(pk=str(instance.pk))
@@ -368,6 +533,7 @@ class PermissionsViewSetMixin(object):
             return Permissions(
                 permissions,
                 user,
+                key=cls.serializer_class
             )
 
         return None
@@ -0,0 +1,220 @@
+"""This module contains queryset extensions used when prefetching."""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import ModelIterable
+
+
+class CachedSideload(object):
+    """A forward foreign-key sideload that is served from a `SideloadCache`.
+
+    Used in place of a `Prefetch` for related serializers that declare
+    `Meta.sideload_cache`: related objects are looked up by primary key
+    in the cache and only the misses are fetched from the database.
+
+    Arguments:
+        source: name of the foreign key on the parent model
+        queryset: queryset for the related model, possibly carrying
+            nested prefetches
+        cache: a `SideloadCache` for the related model
+    """
+
+    def __init__(self, source, queryset, cache):
+        self.source = source
+        self.queryset = queryset
+        self.cache = cache
+
+    def resolve(self, instances):
+        if not instances:
+            return
+
+        field = instances[0]._meta.get_field(self.source)
+        attname = field.attname
+        pks = {getattr(instance, attname) for instance in instances}
+        pks.discard(None)
+        if not pks:
+            return
+
+        related = self.cache.get_many(list(pks))
+        missing = [pk for pk in pks if pk not in related]
+        if missing:
+            fetched = self.queryset.prefetch_related(None).in_bulk(missing)
+            self.cache.set_many(fetched)
+            related.update(fetched)
+
+        lookups = self.queryset._prefetch_related_lookups
+        if lookups and related:
+            prefetch_related_objects(list(related.values()), *lookups)
+
+        for instance in instances:
+            obj = related.get(getattr(instance, attname))
+            if obj is not None:
+                field.set_cached_value(instance, obj)
+
+
+def _prefetch_branch(instances, lookups):
+    try:
+        prefetch_related_objects(instances, *lookups)
+    finally:
+        # worker threads hold their own connections; like request
+        # handlers, they keep them for up to CONN_MAX_AGE, and they
+        # are dropped when the thread exits
+        close_old_connections()
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_prefetch_executor(max_workers):
+    """Get a shared thread pool used to run prefetches concurrently."""
+    with _executors_lock:
+        if max_workers not in _executors:
+            _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix='drest-prefetch'
+            )
+        return _executors[max_workers]
+
+
+def prefetch_related_objects_concurrently(
+    instances, lookups, max_workers, using=DEFAULT_DB_ALIAS
+):
+    """Like `prefetch_related_objects`, but prefetch independent branches
+    on a bounded thread pool.
+
+    Lookups are grouped by their first relation, and each group
+    runs in a worker thread with its own, persistent (as configured by
+    CONN_MAX_AGE) database connection.
+    Inside a transaction, other connections cannot see its writes,
+    so prefetching falls back to running sequentially.
+    """
+    branches = OrderedDict()
+    for lookup in lookups:
+        path = lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        branches.setdefault(path.split(LOOKUP_SEP)[0], []).append(lookup)
+
+    if (
+        len(branches) < 2
+        or not instances
+        or connections[using].in_atomic_block
+    ):
+        prefetch_related_objects(instances, *lookups)
+        return
+
+    # initialize the caches that prefetching writes to,
+    # so that concurrent branches do not race to create them
+    for instance in instances:
+        instance._state.fields_cache
+        if not hasattr(instance, '_prefetched_objects_cache'):
+            instance._prefetched_objects_cache = {}
+
+    executor = get_prefetch_executor(max_workers)
+    futures = [
+        executor.submit(_prefetch_branch, instances, branch)
+        for branch in branches.values()
+    ]
+    for future in futures:
+        future.result()
+
+
+class DynamicQuerySetMixin(object):
+    """QuerySet mixin for querysets built by `DynamicFilterBackend`.
+
+    Resolves `CachedSideload`s on evaluation, and optionally
+    runs root-level prefetches concurrently.
+    """
+
+    _cached_sideloads = ()
+    _prefetch_workers = None
+
+    def _clone(self):
+        clone = super(DynamicQuerySetMixin, self)._clone()
+        clone._cached_sideloads = self._cached_sideloads
+        clone._prefetch_workers = self._prefetch_workers
+        return clone
+
+    def _fetch_all(self):
+        fetching = self._result_cache is None
+        super(DynamicQuerySetMixin, self)._fetch_all()
+        if (
+            fetching
+            and self._cached_sideloads
+            and issubclass(self._iterable_class, ModelIterable)
+        ):
+            resolve_cached_sideloads(self, self._result_cache)
+
+    def _prefetch_related_objects(self):
+        if not self._prefetch_workers:
+            return super(DynamicQuerySetMixin, self)._prefetch_related_objects()
+
+        prefetch_related_objects_concurrently(
+            self._result_cache,
+            self._prefetch_related_lookups,
+            self._prefetch_workers,
+            using=self.db
+        )
+        self._prefetch_done = True
+
+
+def resolve_cached_sideloads(queryset, instances):
+    """Resolve the cached sideloads of `queryset` onto `instances`.
+
+    This is done automatically when a queryset is evaluated, but not
+    when it is iterated with `iterator` or `aiterator`.
+    """
+    for sideload in getattr(queryset, '_cached_sideloads', ()):
+        sideload.resolve(instances)
+
+
+_queryset_classes = {}
+
+
+def _get_queryset_class(base):
+    if issubclass(base, DynamicQuerySetMixin):
+        return base
+    if base not in _queryset_classes:
+        _queryset_classes[base] = type(
+            'Dynamic%s' % base.__name__,
+            (DynamicQuerySetMixin, base),
+            {}
+        )
+    return _queryset_classes[base]
+
+
+def _as_dynamic(queryset):
+    queryset = queryset._chain()
+    queryset.__class__ = _get_queryset_class(queryset.__class__)
+    return queryset
+
+
+def add_cached_sideloads(queryset, sideloads):
+    """Return a copy of `queryset` that resolves `sideloads` when evaluated.
+
+    Arguments:
+        queryset: a QuerySet
+        sideloads: a list of `CachedSideload` instances
+    """
+    if not sideloads:
+        return queryset
+    queryset = _as_dynamic(queryset)
+    queryset._cached_sideloads = tuple(queryset._cached_sideloads) + tuple(
+        sideloads
+    )
+    return queryset
+
+
+def set_concurrent_prefetch(queryset, max_workers):
+    """Return a copy of `queryset` that prefetches concurrently.
+
+    Arguments:
+        queryset: a QuerySet
+        max_workers: maximum number of prefetches to run at once
+    """
+    queryset = _as_dynamic(queryset)
+    queryset._prefetch_workers = max_workers
+    return queryset
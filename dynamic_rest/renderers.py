@@ -1,10 +1,19 @@
 """This module contains custom renderer classes."""
 import copy
-from rest_framework.renderers import HTMLFormRenderer, ClassLookupDict
+import csv
+import json
+from io import StringIO
+from itertools import chain, islice
+
+from rest_framework.renderers import (
+    BaseRenderer, HTMLFormRenderer, ClassLookupDict, JSONRenderer
+)
+from rest_framework.utils import encoders
 from django.utils.html import mark_safe
 from dynamic_rest.compat import reverse, NoReverseMatch
 from rest_framework.renderers import AdminRenderer
 from dynamic_rest.conf import settings
+from dynamic_rest.utils import clean
 from dynamic_rest import fields
 
 
@@ -374,3 +383,211 @@ class DynamicAdminRenderer(AdminRenderer):
             )
         else:
             return None
+
+
+def flatten(data, prefix=''):
+    """Flatten nested dicts into one dict with dotted keys.
+
+    For example, {"location": {"name": "x"}} becomes {"location.name": "x"}.
+    """
+    result = {}
+    for key, value in data.items():
+        key = '%s%s' % (prefix, key)
+        if isinstance(value, dict):
+            result.update(flatten(value, key + '.'))
+        else:
+            result[key] = value
+    return result
+
+
+def get_path(data, path):
+    """Get the value at a path of keys in nested dicts, or None."""
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class StreamingRenderer(BaseRenderer):
+    """Base class for renderers that write one row at a time.
+
+    List and `combine` views pass rows to `render_rows` and stream
+    the result; other responses go through `render` as usual.
+    """
+
+    charset = 'utf-8'
+    streaming = True
+    # combine results are rendered as flat rows
+    flat = True
+    # rows are written out in chunks of about this many characters
+    BUFFER_SIZE = 65536
+
+    def get_rows(self, data):
+        serializer = getattr(data, 'serializer', None)
+        if serializer is not None and hasattr(serializer, 'disable_envelope'):
+            serializer.disable_envelope()
+            data = serializer.data
+        if isinstance(data, dict):
+            return [data]
+        return data
+
+    def get_columns(self, data):
+        serializer = getattr(data, 'serializer', None)
+        if serializer is not None and hasattr(serializer, 'get_columns'):
+            return serializer.get_columns()
+        return None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        columns = self.get_columns(data)
+        return b''.join(self.render_rows(self.get_rows(data), columns))
+
+    def render_rows(self, rows, columns=None):
+        """Render an iterable of rows into an iterable of bytes.
+
+        Arguments:
+            rows: An iterable of dicts.
+            columns: Dotted column names, e.g. from the serializer's
+                `get_columns`, or None to take them from the rows.
+        """
+        raise NotImplementedError()
+
+    def _buffered(self, lines):
+        buffer = []
+        size = 0
+        for line in lines:
+            buffer.append(line)
+            size += len(line)
+            if size >= self.BUFFER_SIZE:
+                yield ''.join(buffer).encode(self.charset)
+                buffer = []
+                size = 0
+        if buffer:
+            yield ''.join(buffer).encode(self.charset)
+
+
+class DynamicCSVRenderer(StreamingRenderer):
+    """Render rows as CSV, with nested objects flattened into dotted columns.
+
+    Columns are given by the serializer, or taken from the first
+    `HEADER_ROWS` rows without one, e.g. for `combine` results.
+    Lists, such as many-relations, and other values that are not
+    flattened are written as JSON in a single cell.
+    """
+
+    media_type = 'text/csv'
+    format = 'csv'
+    HEADER_ROWS = 1000
+
+    def format_value(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, dict, bool)):
+            return json.dumps(clean(value), cls=encoders.JSONEncoder)
+        return clean(value)
+
+    def render_rows(self, rows, columns=None):
+        return self._buffered(self._lines(rows, columns))
+
+    def _lines(self, rows, columns=None):
+        if columns:
+            # look up each column by its path, rather than flattening
+            # the row, so that values such as JSON fields stay in one cell
+            paths = [column.split('.') for column in columns]
+            rows = ([get_path(row, path) for path in paths] for row in rows)
+        else:
+            rows = (
+                flatten(row) if isinstance(row, dict) else {'detail': row}
+                for row in rows
+            )
+            head = list(islice(rows, self.HEADER_ROWS))
+            columns = list(dict.fromkeys(key for row in head for key in row))
+            rows = (
+                [row.get(column) for column in columns]
+                for row in chain(head, rows)
+            )
+        line = StringIO()
+        writer = csv.writer(line)
+
+        def write(values):
+            writer.writerow(values)
+            text = line.getvalue()
+            line.seek(0)
+            line.truncate()
+            return text
+
+        yield write(columns)
+        for row in rows:
+            yield write([self.format_value(value) for value in row])
+
+
+class DynamicNDJSONRenderer(StreamingRenderer):
+    """Render rows as newline-delimited JSON, one object per line."""
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render_rows(self, rows, columns=None):
+        return self._buffered(
+            json.dumps(
+                row, cls=encoders.JSONEncoder, ensure_ascii=False
+            ) + '\n'
+            for row in rows
+        )
+
+
+class DynamicColumnarRenderer(JSONRenderer):
+    """Render lists of objects as columns.
+
+    Each list of objects in a response, i.e. the primary resource and
+    each sideloaded resource, becomes a schema of column names and one
+    array of values per column. Nested objects are flattened into dotted
+    columns. String columns with few distinct values are dictionary-encoded:
+    the schema lists the distinct values, and the column holds
+    their indexes.
+    """
+
+    format = 'columnar'
+    # combine results are rendered as flat rows
+    flat = True
+    # maximum number of distinct values per value for dictionary encoding
+    DICTIONARY_RATIO = 0.5
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if isinstance(data, dict) and not getattr(response, 'exception', False):
+            data = {
+                key: self.get_columns(value) if self.is_rows(value) else value
+                for key, value in data.items()
+            }
+        return super(DynamicColumnarRenderer, self).render(
+            data, accepted_media_type, renderer_context
+        )
+
+    def is_rows(self, value):
+        return isinstance(value, list) and all(
+            isinstance(row, dict) for row in value
+        )
+
+    def get_columns(self, rows):
+        rows = [flatten(row) for row in rows]
+        schema = []
+        columns = []
+        for name in dict.fromkeys(key for row in rows for key in row):
+            column = [row.get(name) for row in rows]
+            field = {'name': name}
+            values = [value for value in column if value is not None]
+            if values and all(isinstance(value, str) for value in values):
+                dictionary = list(dict.fromkeys(values))
+                if len(dictionary) <= self.DICTIONARY_RATIO * len(column):
+                    indexes = {value: i for i, value in enumerate(dictionary)}
+                    field['dictionary'] = dictionary
+                    column = [
+                        None if value is None else indexes[value]
+                        for value in column
+                    ]
+            schema.append(field)
+            columns.append(column)
+        return {'schema': schema, 'columns': columns}
@@ -0,0 +1,306 @@
+"""This module contains materialized rollups for the combine feature."""
+import hashlib
+import json
+
+from django.apps.registry import Apps
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from dynamic_rest.cache import LocalCache
+from dynamic_rest.combine import Call, Identifier, parse
+
+ROLLUP_FUNCTIONS = {
+    'sum': Sum,
+    'count': Count,
+    'min': Min,
+    'max': Max
+}
+
+STATE_TABLE = 'drest_rollup_state'
+
+# rollups are kept out of the global app registry
+_apps = Apps()
+
+
+def _column(output_field):
+    """Build a nullable column that can store values of `output_field`."""
+    if output_field.is_relation:
+        output_field = output_field.target_field
+    internal_type = output_field.get_internal_type()
+    if internal_type in ('AutoField', 'SmallAutoField', 'BigAutoField'):
+        return getattr(models, internal_type.replace('Auto', 'Integer'))(
+            null=True
+        )
+    _, path, args, kwargs = output_field.deconstruct()
+    options = {'null': True}
+    for option in ('max_length', 'max_digits', 'decimal_places'):
+        if option in kwargs:
+            options[option] = kwargs[option]
+    field_class = getattr(models, internal_type, None)
+    if field_class is None:
+        field_class = output_field.__class__
+    return field_class(**options)
+
+
+def _model(name, table, fields):
+    attrs = dict(fields)
+    attrs['__module__'] = __name__
+    attrs['Meta'] = type('Meta', (), {
+        'apps': _apps,
+        'app_label': 'dynamic_rest',
+        'db_table': table,
+        'managed': False
+    })
+    return type(name, (models.Model,), attrs)
+
+
+RollupState = _model('RollupState', STATE_TABLE, {
+    'name': models.CharField(max_length=255, primary_key=True),
+    'watermark': models.TextField(null=True),
+    'refreshed': models.DateTimeField()
+})
+
+
+def _create_table(model, using):
+    connection = connections[using]
+    if model._meta.db_table in connection.introspection.table_names():
+        return
+    with connection.schema_editor() as editor:
+        editor.create_model(model)
+
+
+class Rollup(object):
+    """A summary table of `combine` aggregates over a viewset's model.
+
+    Rows are grouped by every dimension, so the table can answer
+    `combine` requests over any subset of them. Tables are built and
+    refreshed by the `refresh_rollups` management command, and are only
+    as fresh as the last refresh.
+
+    Arguments:
+        viewset: the viewset class declaring the rollup
+        by: a list of `combine.by` expressions, e.g. "account"
+        over: a list of `combine.over` expressions, e.g. "day(created)"
+        values: a list of sums, counts, minimums or maximums of fields,
+            e.g. "sum(amount)"; averages are answered from a sum and
+            a count of the same field
+        watermark: optional field that increases whenever a row is
+            added or changed, e.g. an auto_now timestamp; if set,
+            refreshes only recompute groups that have new rows
+        name: optional name for the table, defaults to a hash
+            of the definition
+    """
+
+    def __init__(
+        self, viewset, by=None, over=None, values=None, watermark=None,
+        name=None
+    ):
+        self.viewset = viewset
+        self.by = list(by or [])
+        self.over = list(over or [])
+        self.watermark = watermark
+        self.serializer = viewset.serializer_class()
+        self.source_model = self.serializer.get_model()
+
+        self.dimensions = [
+            ex.node for text in self.by + self.over for ex in parse(text)
+        ]
+        if not self.dimensions:
+            raise ValueError('A rollup needs at least one dimension')
+        for node in self.dimensions:
+            if isinstance(node, Call) and node.name == 'auto':
+                raise ValueError('Rollups do not support auto() dimensions')
+
+        self.values = []
+        for text in values or []:
+            for ex in parse(text):
+                node = ex.node
+                if not (
+                    isinstance(node, Call)
+                    and node.name in ROLLUP_FUNCTIONS
+                    and len(node.args) == 1
+                    and isinstance(node.args[0], Identifier)
+                ):
+                    raise ValueError(
+                        f'Cannot roll up "{ex.text}": expecting a sum, '
+                        'count, min or max of a field'
+                    )
+                self.values.append((node.name, node.args[0].name.lower()))
+        if not self.values:
+            raise ValueError('A rollup needs at least one value')
+
+        if not name:
+            definition = json.dumps([
+                self.source_model._meta.label_lower,
+                self.by,
+                self.over,
+                self.values
+            ])
+            name = hashlib.sha1(definition.encode('utf-8')).hexdigest()[:12]
+        self.name = name
+        self.table = 'drest_rollup_%s' % name
+        self._model = None
+        self._built = LocalCache(ttl=60)
+
+    def __repr__(self):
+        return '<Rollup %s>' % self.table
+
+    def get_dimension(self, node):
+        """Get the column of a dimension, or None."""
+        try:
+            return 'd%d' % self.dimensions.index(node)
+        except ValueError:
+            return None
+
+    def get_value(self, function, field):
+        """Get the column of an aggregate, or None."""
+        try:
+            return 'v%d' % self.values.index((function, field))
+        except ValueError:
+            return None
+
+    def get_source(self, queryset=None):
+        """Get the grouped aggregates of the source rows.
+
+        Arguments:
+            queryset: optional queryset of source rows
+        """
+        viewset = self.viewset()
+        if queryset is None:
+            queryset = self.source_model._default_manager.all()
+        dimensions = {}
+        for i, node in enumerate(self.dimensions):
+            dimensions['d%d' % i] = viewset._compile_combine_node(
+                node, self.serializer, {}
+            )
+        aggregates = {}
+        for i, (function, field) in enumerate(self.values):
+            target = viewset._resolve_combine_field(self.serializer, field)
+            aggregates['v%d' % i] = ROLLUP_FUNCTIONS[function](target or field)
+        return (
+            queryset
+            .annotate(**dimensions)
+            .values(*dimensions)
+            .annotate(**aggregates)
+            .order_by()
+        )
+
+    def get_model(self):
+        """Get the model of the summary table."""
+        if self._model is None:
+            annotations = self.get_source().query.annotations
+            fields = {
+                name: _column(annotations[name].output_field)
+                for name in annotations
+            }
+            model_name = 'Rollup_%s' % self.name
+            model = _apps.all_models['dynamic_rest'].get(model_name.lower())
+            self._model = model or _model(model_name, self.table, fields)
+        return self._model
+
+    def get_watermark_field(self):
+        if not self.watermark:
+            return None
+        return self.viewset()._resolve_combine_field(
+            self.serializer, self.watermark
+        ) or self.watermark
+
+    def get_state(self, using=DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        if STATE_TABLE not in connection.introspection.table_names():
+            return None
+        return RollupState.objects.using(using).filter(name=self.name).first()
+
+    def is_built(self, using=DEFAULT_DB_ALIAS):
+        """Whether the table has been built; checked at most once a minute."""
+        built = self._built.get(using)
+        if built is None:
+            built = self.get_state(using) is not None
+            self._built.set(using, built)
+        return built
+
+    def _insert(self, queryset, using):
+        model = self.get_model()
+        model.objects.using(using).bulk_create(
+            (model(**row) for row in queryset.iterator()),
+            batch_size=1000
+        )
+
+    def _save_state(self, watermark, using):
+        RollupState.objects.using(using).update_or_create(
+            name=self.name,
+            defaults={
+                'watermark': None if watermark is None else str(watermark),
+                'refreshed': timezone.now()
+            }
+        )
+        self._built.delete(using)
+
+    def build(self, using=DEFAULT_DB_ALIAS):
+        """Build the summary table from scratch."""
+        model = self.get_model()
+        _create_table(RollupState, using)
+        _create_table(model, using)
+
+        watermark_field = self.get_watermark_field()
+        with transaction.atomic(using=using):
+            watermark = None
+            if watermark_field:
+                # taken first: later rows are picked up by the next refresh
+                watermark = self.source_model._default_manager.using(
+                    using
+                ).aggregate(_max=Max(watermark_field))['_max']
+            model.objects.using(using).all().delete()
+            self._insert(self.get_source().using(using), using)
+            self._save_state(watermark, using)
+
+    def refresh(self, using=DEFAULT_DB_ALIAS):
+        """Bring the summary table up to date.
+
+        With a watermark, only the groups that share their first
+        `over` (or `by`) dimension with a new or changed row are
+        recomputed. Rows deleted from the source, and rows moved out of
+        a group (i.e. whose dimension values changed), are only removed
+        from their previous group by a full build.
+        """
+        state = self.get_state(using)
+        watermark_field = self.get_watermark_field()
+        if state is None or not watermark_field or state.watermark is None:
+            return self.build(using=using)
+
+        model = self.get_model()
+        manager = self.source_model._default_manager.using(using)
+        index = len(self.by) if self.over else 0
+        key = 'd%d' % index
+
+        with transaction.atomic(using=using):
+            watermark = manager.aggregate(_max=Max(watermark_field))['_max']
+            changed = manager.filter(
+                **{watermark_field + '__gt': state.watermark}
+            ).annotate(**{
+                key: self.viewset()._compile_combine_node(
+                    self.dimensions[index], self.serializer, {}
+                )
+            })
+            keys = set(changed.values_list(key, flat=True).distinct())
+            if keys:
+                groups = models.Q(**{key + '__in': keys - {None}})
+                if None in keys:
+                    groups |= models.Q(**{key + '__isnull': True})
+                model.objects.using(using).filter(groups).delete()
+                self._insert(self.get_source(manager.all()).filter(groups), using)
+            self._save_state(watermark, using)
+
+
+_rollups = {}
+
+
+def get_rollups(viewset):
+    """Get the `Rollup`s declared by a viewset class."""
+    if viewset not in _rollups:
+        _rollups[viewset] = [
+            Rollup(viewset, **options)
+            for options in getattr(viewset, 'rollups', None) or []
+        ]
+    return _rollups[viewset]
@@ -11,6 +11,7 @@ from django.utils.functional import cached_property
 from rest_framework import exceptions, serializers
 from rest_framework.fields import SkipField, empty
 from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from rest_framework.exceptions import ValidationError
 from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
 
@@ -22,6 +23,7 @@ from dynamic_rest.links import merge_link_object
 from dynamic_rest.meta import Meta, get_model_table, get_model_field, get_related_model
 from dynamic_rest.processors import SideloadingProcessor
 from dynamic_rest.tagged import tag_dict
+from dynamic_rest.validators import BulkUniqueness
 from dynamic_rest.base import DynamicBase
 
 
@@ -106,6 +108,9 @@ class DynamicListSerializer(WithResourceKeyMixin, serializers.ListSerializer):
     def get_link_fields(self):
         return self.child.get_link_fields()
 
+    def get_columns(self, prefix=""):
+        return self.child.get_columns(prefix)
+
     def get_id_fields(self):
         return self.child.get_id_fields()
 
@@ -202,6 +207,34 @@ class DynamicListSerializer(WithResourceKeyMixin, serializers.ListSerializer):
             )
         return self._processed_data
 
+    def to_internal_value(self, data):
+        """Validate every row, checking unique constraints for all at once."""
+        lookup_attr = getattr(self.child.Meta, "update_lookup_field", "id")
+        model = self.get_model()
+        if model is None or (
+            self.instance is not None and lookup_attr not in ("pk", model._meta.pk.name)
+        ):
+            return super(DynamicListSerializer, self).to_internal_value(data)
+
+        uniqueness = BulkUniqueness()
+        uniqueness.prepare(self.child)
+        value = super(DynamicListSerializer, self).to_internal_value(data)
+        updating = self.instance is not None
+        unique_errors = uniqueness.validate(
+            [(attrs, attrs.get(lookup_attr) if updating else None) for attrs in value]
+        )
+        if any(unique_errors):
+            if api_settings.LIST_SERIALIZER_ERRORS_AS_DICT:
+                errors = {
+                    index: detail
+                    for index, detail in enumerate(unique_errors)
+                    if detail
+                }
+            else:
+                errors = [detail or {} for detail in unique_errors]
+            raise ValidationError(errors)
+        return value
+
     def update(self, queryset, validated_data):
         lookup_attr = getattr(self.child.Meta, "update_lookup_field", "id")
 
@@ -1140,6 +1173,39 @@ class WithDynamicSerializerMixin(
 
         return self._link_fields
 
+    def get_columns(self, prefix=""):
+        """Get the dotted column names of this serializer's representation.
+
+        Embedded objects, such as included relations, become one column
+        per field, e.g. "location.name"; many-relations stay one column.
+        """
+        columns = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            column = prefix + name
+            if (
+                isinstance(field, _fields.DynamicRelationField)
+                and not field.many
+                and field._is_dynamic
+                and not field.serializer.id_only()
+            ):
+                columns.extend(field.serializer.get_columns(column + "."))
+            else:
+                columns.append(column)
+
+        query_params = self.get_request_attribute("query_params", {})
+        if settings.ENABLE_LINKS and "exclude_links" not in query_params:
+            links = []
+            if settings.ENABLE_HOST_RELATIVE_LINKS and settings.ENABLE_SELF_LINKS:
+                links.append("self")
+            if settings.ENABLE_RELATED_LINKS:
+                links.extend(self.get_link_fields())
+            columns.extend("%slinks.%s" % (prefix, name) for name in links)
+        if self.debug:
+            columns.extend(("%s_meta.id" % prefix, "%s_meta.type" % prefix))
+        return columns
+
     @cached_property
     def _readable_fields(self):
         # NOTE: Copied from DRF, exists in 3.2.x but not 3.1
@@ -1392,9 +1458,11 @@ class WithDynamicSerializerMixin(
                 raise exceptions.ValidationError(self.errors)
 
         view = self._context.get("view")
-        if update and view:
+        get_preference = getattr(view, "get_return_preference", None)
+        if update and view and not (get_preference and get_preference()):
             # Reload the object on update
-            # to get around prefetch cache issues
+            # to get around prefetch cache issues,
+            # unless the response is not built from all of its fields
             instance = self.instance = view.get_object()
         return instance
 
@@ -11,6 +11,13 @@ from dynamic_rest.compat import resolve
 from dynamic_rest.meta import Meta
 
 
+def get_content(response):
+    """Get the decoded body of a response, which may be streaming."""
+    if response.streaming:
+        return b''.join(response.streaming_content).decode('utf-8')
+    return response.content.decode('utf-8')
+
+
 class ViewSetTestCase(TestCase):
     """Base class that makes it easy to test dynamic viewsets.
 
@@ -191,7 +198,7 @@ class ViewSetTestCase(TestCase):
                     'GET %s failed with %d: %s' % (
                         url,
                         response.status_code,
-                        response.content.decode('utf-8')
+                        get_content(response)
                     )
                 )
 
@@ -228,7 +235,7 @@ class ViewSetTestCase(TestCase):
                     'GET %s failed with %d:\n%s' % (
                         url,
                         response.status_code,
-                        response.content.decode('utf-8')
+                        get_content(response)
                     )
                 )
 
@@ -259,10 +266,10 @@ class ViewSetTestCase(TestCase):
                 'POST %s failed with %d:\n%s' % (
                     url,
                     response.status_code,
-                    response.content.decode('utf-8')
+                    get_content(response)
                 )
             )
-            content = response.content.decode('utf-8')
+            content = get_content(response)
             if format == 'json':
                 content = json.loads(content)
                 model = self.get_model()
@@ -309,7 +316,7 @@ class ViewSetTestCase(TestCase):
                 'PUT %s failed with %d:\n%s' % (
                     url,
                     response.status_code,
-                    response.content.decode('utf-8')
+                    get_content(response)
                 )
             )
 
@@ -334,7 +341,7 @@ class ViewSetTestCase(TestCase):
                 'DELETE %s failed with %d: %s' % (
                     url,
                     response.status_code,
-                    response.content.decode('utf-8')
+                    get_content(response)
                 )
             )
             model = self.get_model()
@@ -123,6 +123,27 @@ def urljoin(*args):
     return url
 
 
+def parse_prefer(request):
+    """Parse the Prefer header of a request (RFC 7240).
+
+    Returns:
+        A dict of preferences, e.g. {'respond-async': True, 'return': 'minimal'}
+    """
+    preferences = {}
+    header = request.META.get('HTTP_PREFER', '')
+    for preference in header.split(','):
+        # parameters after ";" are not used
+        preference = preference.split(';')[0].strip()
+        if not preference:
+            continue
+        name, _, value = preference.partition('=')
+        name = name.strip().lower()
+        if name not in preferences:
+            value = value.strip().strip('"')
+            preferences[name] = value or True
+    return preferences
+
+
 def clean(data):
     if isinstance(data, list):
         return [clean(item) for item in data]
@@ -0,0 +1,198 @@
+"""This module contains validation utilities for bulk requests."""
+import operator
+from functools import reduce
+
+from django.db import models
+from django.db.models import Q
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
+
+
+def _key(value):
+    return value.pk if isinstance(value, models.Model) else value
+
+
+def get_key(attrs, sources):
+    """Get the values of `sources` in `attrs`, with instances as their pks."""
+    return tuple(_key(attrs[source]) for source in sources)
+
+
+def find_existing(queryset, sources, keys, batch_size=500):
+    """Find the saved rows whose `sources` match any of `keys`.
+
+    Arguments:
+        queryset: the rows to look in
+        sources: a list of model field names
+        keys: tuples of values, in the order of `sources`
+        batch_size: maximum number of keys per query
+
+    Yields:
+        (pk, key) tuples
+    """
+    keys = list(keys)
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i:i + batch_size]
+        if len(sources) == 1:
+            rows = queryset.filter(
+                **{'%s__in' % sources[0]: [key[0] for key in batch]}
+            ).values_list('pk', sources[0])
+            for pk, value in rows:
+                yield pk, (value,)
+        else:
+            condition = reduce(operator.or_, (
+                Q(**dict(zip(sources, key))) for key in batch
+            ))
+            rows = queryset.filter(condition).values_list('pk', *sources)
+            for row in rows:
+                yield row[0], tuple(row[1:])
+
+
+class _Constraint(object):
+
+    def __init__(self, validator, names, sources, error_key, message):
+        self.validator = validator
+        self.names = names
+        self.sources = sources
+        self.error_key = error_key
+        self.message = message
+
+
+class BulkUniqueness(object):
+    """Checks the unique constraints of a serializer across many rows at once.
+
+    DRF's `UniqueValidator` and `UniqueTogetherValidator` each run a
+    query per row. `prepare` takes them off a row's serializer, and
+    `validate` then checks every row with one query per constraint
+    (per batch), plus an in-memory check for duplicates within the
+    payload. Validators with conditions or non-exact lookups are
+    left to run on each row.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self.constraints = None
+
+    def _covers_field(self, validator, field):
+        return (
+            isinstance(validator, UniqueValidator)
+            and validator.lookup == 'exact'
+            and len(field.source_attrs) == 1
+        )
+
+    def _covers_together(self, validator, serializer):
+        return (
+            isinstance(validator, UniqueTogetherValidator)
+            and type(validator).__call__ is UniqueTogetherValidator.__call__
+            and validator.condition is None
+            and not validator.condition_fields
+            and validator.nulls_distinct is not False
+            and all(name in serializer.fields for name in validator.fields)
+        )
+
+    def prepare(self, serializer):
+        """Remove the validators that `validate` covers from `serializer`.
+
+        Arguments:
+            serializer: a row serializer, e.g. the child of a list serializer
+        """
+        constraints = []
+        # fields that are not copied per serializer must be left alone
+        shared = getattr(serializer, 'get_all_fields', dict)()
+        for name, field in serializer.fields.items():
+            if field.read_only or shared.get(name) is field:
+                continue
+            covered = [
+                v for v in field.validators if self._covers_field(v, field)
+            ]
+            if not covered:
+                continue
+            field.validators = [
+                v for v in field.validators
+                if not any(v is c for c in covered)
+            ]
+            for validator in covered:
+                constraints.append(_Constraint(
+                    validator, [name], [field.source], name, validator.message
+                ))
+
+        covered = [
+            v for v in serializer.validators
+            if self._covers_together(v, serializer)
+        ]
+        if covered:
+            serializer.validators = [
+                v for v in serializer.validators
+                if not any(v is c for c in covered)
+            ]
+            for validator in covered:
+                constraints.append(_Constraint(
+                    validator,
+                    list(validator.fields),
+                    [serializer.fields[name].source for name in validator.fields],
+                    api_settings.NON_FIELD_ERRORS_KEY,
+                    validator.message.format(
+                        field_names=', '.join(validator.fields)
+                    )
+                ))
+
+        if self.constraints is None:
+            self.constraints = constraints
+
+    def validate(self, rows):
+        """Check rows against the constraints taken off their serializers.
+
+        Arguments:
+            rows: a list of (attrs, pk) tuples, where `attrs` is a row's
+                validated data and `pk` is the primary key of the instance
+                it updates, or None for new instances.
+
+        Returns:
+            A list with the errors of each row, or None for valid rows.
+        """
+        errors = [None] * len(rows)
+        for constraint in self.constraints or ():
+            code = getattr(constraint.validator, 'code', 'unique')
+            keyed = {}
+            for index, (attrs, pk) in enumerate(rows):
+                if any(source not in attrs for source in constraint.sources):
+                    if pk is None and len(constraint.sources) > 1:
+                        # DRF requires every field of a unique set
+                        errors[index] = errors[index] or {}
+                        for name, source in zip(
+                            constraint.names, constraint.sources
+                        ):
+                            if source not in attrs:
+                                errors[index][name] = [ErrorDetail(
+                                    constraint.validator.missing_message,
+                                    code='required'
+                                )]
+                    continue
+                key = get_key(attrs, constraint.sources)
+                if any(value is None for value in key):
+                    continue
+                keyed.setdefault(key, []).append((index, pk))
+
+            conflicts = set()
+            for key, entries in keyed.items():
+                if len(entries) > 1:
+                    # duplicates within the payload: the first one wins
+                    conflicts.update(index for index, _ in entries[1:])
+            existing = find_existing(
+                constraint.validator.queryset,
+                constraint.sources,
+                keyed,
+                self.BATCH_SIZE
+            )
+            for existing_pk, key in existing:
+                for index, pk in keyed.get(key, ()):
+                    if pk is None or str(pk) != str(existing_pk):
+                        conflicts.add(index)
+
+            for index in sorted(conflicts):
+                errors[index] = errors[index] or {}
+                errors[index].setdefault(constraint.error_key, []).append(
+                    ErrorDetail(constraint.message, code=code)
+                )
+        return errors
@@ -1,57 +1,107 @@
 """This module contains custom viewset classes."""
 import csv
+import datetime
+import hashlib
 import re
 import json
 import operator as op
-from decimal import Decimal
 import statistics
 
-from io import StringIO
+from functools import update_wrapper
+from io import TextIOWrapper
 import inflection
 
-from django.http import QueryDict
-from django.db.models import Sum, Min, Max, Avg, Count, F
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.http import Http404, HttpResponse, QueryDict, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.db.models import (
+    Sum, Min, Max, Avg, Count, F, Q, Case, When, Value, Window
+)
 from django.db.models.functions import (
-    Trunc, Length, Lower, Upper, Cast
+    Trunc, Length, Lower, Upper, Cast, Concat, NullIf
 )
-from django.db import models
+from django.apps import apps
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.db import NotSupportedError, connections, models, transaction
 from rest_framework import exceptions, status, viewsets
+from rest_framework.permissions import BasePermission
 from rest_framework.response import Response
 from rest_framework.request import is_form_media_type
 
-from dynamic_rest.permissions import PermissionsViewSetMixin
+from dynamic_rest.cache import (
+    ResultCache,
+    invalidate_model
+)
+from dynamic_rest.permissions import CreateChecks, PermissionsViewSetMixin
+from dynamic_rest.prefetch import resolve_cached_sideloads
+from dynamic_rest.coalesce import single_flight
+from dynamic_rest.combine import (
+    BinOp,
+    Call,
+    CombineSyntaxError,
+    FILL_MODES,
+    FILL_STEPS,
+    Identifier,
+    OTHER,
+    Literal,
+    MIN_SAMPLE,
+    Negate,
+    TooManyBuckets,
+    WindowAggregate,
+    fill_series,
+    parse,
+    percent_of,
+    post_aggregate,
+    sample_queryset,
+    sampling_error,
+    walk
+)
 from dynamic_rest.conf import settings
-from dynamic_rest.filters import DynamicFilterBackend, DynamicSortingFilter
+from dynamic_rest.fields.relation import RelationResolver
+from dynamic_rest.jobs import create_job, get_job_data, get_job_executor
+from dynamic_rest.filters import (
+    AsyncDynamicFilterBackend,
+    DynamicFilterBackend,
+    DynamicSortingFilter
+)
 from dynamic_rest.metadata import DynamicMetadata
 from dynamic_rest.pagination import DynamicPageNumberPagination
 from dynamic_rest.processors import SideloadingProcessor
-from dynamic_rest.utils import is_truthy, clean, has_joins
+from dynamic_rest.rollups import get_rollups
+from dynamic_rest.serializers import WithDynamicSerializerMixin
+from dynamic_rest.utils import is_truthy, clean, has_joins, parse_prefer
+from dynamic_rest.validators import BulkUniqueness, find_existing, get_key
 from dynamic_rest.condition import evaluate
-from .meta import Meta
+from .meta import Meta, get_model_field, is_model_field, is_unique
 
 
 UPDATE_REQUEST_METHODS = ('PUT', 'PATCH', 'POST')
 DELETE_REQUEST_METHOD = 'DELETE'
+RETURN_PREFERENCES = ('minimal', 'ids', 'representation')
+# filter backends that only apply request filters, which rollups replicate
+ROLLUP_FILTER_BACKENDS = (
+    DynamicFilterBackend, AsyncDynamicFilterBackend, DynamicSortingFilter
+)
+# the error of valid rows that are not imported with an invalid row
+SKIPPED_ROW = 'Not written: another row of its batch is invalid.'
 
 class REGEX:
-    arithmetic_operator = '[/*+-]'
-    arithmetic_operator_capture = '([/*+-])'
-    identifier = '[a-z][ A-Za-z0-9_.]*'
     word_number = r'^([a-zA-Z]+)([0-9]+)$'
-    literal = '(?:[0-9][0-9.]*|[-][0-9][0-9.]*)'
-    basic = f'(?:{identifier}|{literal})'
-    function_expression = fr'\s*({basic})\s*\(\s*({basic})\s*\)(?: as \s*({basic})\s*)?'
-    identifier_expression = fr'\s*({basic})\s*(?: as \s*({basic})\s*)'
 
 def percent(l, this=None):
-    s = sum(l)
-    return Decimal('100.0') * (this if this is not None else 0)/ s if s else None
+    return percent_of(sum(l), this)
 
 def remove_underscore(key):
     return key.replace('_', '', 1)
 
+def iter_remove_underscores(items):
+    for item in items:
+        yield {remove_underscore(key): value for key, value in item.items()}
+
 def remove_underscores(items):
-    return [{remove_underscore(key): value for key, value in item.items()} for item in items]
+    return list(iter_remove_underscores(items))
 
 def literalize(x):
     try:
@@ -91,6 +141,17 @@ class QueryParams(QueryDict):
             self.appendlist(key, value)
 
 
+class _Unshared(Exception):
+    """Carries a response that should not be shared between requests."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class _NotCovered(Exception):
+    """Raised when a rollup cannot answer a combine request."""
+
+
 class WithDynamicViewSetBase(object):
 
     """A viewset that can support dynamic API features.
@@ -101,6 +162,10 @@ class WithDynamicViewSetBase(object):
     """
 
     SET_REQUEST_ON_SAVE = settings.SET_REQUEST_ON_SAVE
+    ENABLE_REQUEST_COALESCING = settings.ENABLE_REQUEST_COALESCING
+    ENABLE_COMBINE_CACHE = settings.ENABLE_COMBINE_CACHE
+    # resolved combine fields, by (serializer class, name)
+    _combine_fields = {}
 
     DEBUG = 'debug'
     SIDELOADING = 'sideloading'
@@ -117,6 +182,13 @@ class WithDynamicViewSetBase(object):
     metadata_class = DynamicMetadata
     features = (DEBUG, INCLUDE, EXCLUDE, FILTER, PAGE, PER_PAGE, SORT, SIDELOADING, COMBINE)
     meta = None
+    # name of a model field that changes whenever a record changes,
+    # e.g. an auto_now timestamp; enables conditional GET
+    updated_field = None
+    # summary tables that can answer combine requests, e.g.
+    # [{'by': ['account'], 'over': ['day(created)'], 'values': ['sum(amount)']}]
+    # see dynamic_rest.rollups.Rollup for the available options
+    rollups = None
     filter_backends = (DynamicFilterBackend, DynamicSortingFilter)
 
     def initialize_request(self, request, *args, **kargs):
@@ -401,6 +473,19 @@ class WithDynamicViewSetBase(object):
         else:
             return False
 
+    def get_return_preference(self):
+        """Get the preferred response to a write, set by `Prefer: return=...`.
+
+        Returns:
+            "minimal" for no content, "ids" for the primary keys of the
+            written instances, "representation" for their requested
+            fields, built without reloading them, or None.
+        """
+        if not self.is_update():
+            return None
+        preference = parse_prefer(self.request).get('return')
+        return preference if preference in RETURN_PREFERENCES else None
+
     def get_pk(self):
         pk = None
         if self.is_get():
@@ -436,6 +521,49 @@ class WithDynamicViewSetBase(object):
             return self.request.accepted_renderer.format
         return None
 
+    def get_streaming_renderer(self):
+        """Get the accepted renderer if it streams rows, e.g. for format=csv."""
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return renderer if getattr(renderer, 'streaming', False) else None
+
+    def stream(self, rows, renderer, columns=None):
+        """Stream rows to the client through a streaming renderer.
+
+        `columns` are the rows' dotted column names, if they are known
+        up front, e.g. from the serializer.
+        """
+        response = StreamingHttpResponse(
+            renderer.render_rows(rows, columns),
+            content_type='%s; charset=%s' % (renderer.media_type, renderer.charset)
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            self.serializer_class().get_plural_name(),
+            renderer.format
+        )
+        return response
+
+    def iter_serialized(self, queryset, serializer=None):
+        """Serialize a queryset one row at a time, without pagination.
+
+        Rows are read from a server-side cursor in chunks of
+        `STREAMING_CHUNK_SIZE`; sideloads are embedded in each row and
+        prefetched once per chunk.
+        """
+        if serializer is None:
+            serializer = self.get_serializer(many=True, envelope=False).child
+        chunk_size = settings.STREAMING_CHUNK_SIZE
+        chunk = []
+        for instance in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(instance)
+            if len(chunk) == chunk_size:
+                resolve_cached_sideloads(queryset, chunk)
+                for instance in chunk:
+                    yield serializer.to_representation(instance)
+                chunk = []
+        resolve_cached_sideloads(queryset, chunk)
+        for instance in chunk:
+            yield serializer.to_representation(instance)
+
     def get_serializer(self, *args, **kwargs):
         list_fields = None
         if self.is_list():
@@ -453,7 +581,7 @@ class WithDynamicViewSetBase(object):
             # default to list
             kwargs['only_fields'] = list_fields
         if settings.ALL_FIELDS_ON_UPDATE:
-            if self.is_update():
+            if self.is_update() and not self.get_return_preference():
                 kwargs['include_fields'] = '*'
         serializer = super(WithDynamicViewSetBase, self).get_serializer(*args, **kwargs)
         if hasattr(serializer, 'initialized'):
@@ -581,22 +709,176 @@ class WithDynamicViewSetBase(object):
         combine = self.get_request_feature(self.COMBINE)
         if combine:
             return self.combine(request, combine, **kwargs)
-        return super(WithDynamicViewSetBase, self).list(request, **kwargs)
-
-    def _compute_bucket_function(self, model_field, queryset=None):
-        if model_field is None:
-            return None
-        if queryset is None:
+        renderer = self.get_streaming_renderer()
+        if renderer:
             queryset = self.filter_queryset(self.get_queryset())
-        aggs = queryset.aggregate(_min=Min(model_field), _max=Max(model_field))
-        min_value = aggs['_min']
-        max_value = aggs['_max']
-        try:
-            delta = max_value - min_value
-        except Exception:
-            # cannot be subtracted or null values
-            return None
+            serializer = self.get_serializer(many=True, envelope=False).child
+            return self.stream(
+                self.iter_serialized(queryset, serializer),
+                renderer,
+                serializer.get_columns()
+            )
+        return self._conditional(
+            lambda: self.filter_queryset(self.get_queryset()),
+            lambda: super(WithDynamicViewSetBase, self).list(request, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self._conditional(
+            lambda: self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ),
+            lambda: super(WithDynamicViewSetBase, self).retrieve(
+                request, *args, **kwargs
+            ),
+            required=True
+        )
+
+    def get_request_signature(self, *extra):
+        """Get a digest that identifies equivalent requests.
+
+        Two requests share a signature if they have the same method,
+        path, query parameters and format, and are made by the same user,
+        which also accounts for per-user permissions.
+
+        Arguments:
+            extra: additional JSON-serializable values to include.
+        """
+        user = getattr(self.request, 'user', None)
+        signature = json.dumps([
+            self.request.method,
+            self.request.path,
+            sorted(self.request.query_params.lists()),
+            self.get_format(),
+            getattr(user, 'pk', None),
+        ] + list(extra), default=str)
+        return hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+    def get_updated_field(self):
+        """Get the model field used to compute validators, if any."""
+        if self.updated_field:
+            return self.updated_field
+        serializer_class = self.get_serializer_class()
+        meta = getattr(serializer_class, 'get_meta', lambda: None)()
+        return getattr(meta, 'updated_field', None)
+
+    def get_validators(self, queryset, updated_field):
+        """Compute the ETag and Last-Modified validators for a request.
+
+        Validators are computed from a single aggregate query over
+        the filtered queryset, combined with a signature of the request
+        (path, query parameters, format and user), so that
+        they change whenever the queryset's own rows do. Changes to
+        related rows that are included or sideloaded are not covered.
+
+        Arguments:
+            queryset: the filtered queryset backing the response.
+            updated_field: a model field that changes with every write.
+
+        Returns:
+            A tuple of (etag, last_modified, count).
+        """
+        state = queryset.aggregate(
+            _updated=Max(updated_field),
+            _count=Count('pk')
+        )
+        updated = state['_updated']
+        count = state['_count']
+
+        etag = '"%s"' % self.get_request_signature(count, updated)
+
+        last_modified = None
+        if isinstance(updated, datetime.datetime):
+            last_modified = int(updated.timestamp())
+        return etag, last_modified, count
+
+    def _conditional(self, get_queryset, get_response, required=False):
+        """Return a 304 response if the client's copy is fresh.
+
+        Otherwise, call `get_response` and add validators to it.
+        If request coalescing is enabled, the response is shared
+        with identical concurrent requests.
+
+        Arguments:
+            get_queryset: a callable that returns the filtered queryset
+                backing the response.
+            get_response: a callable that returns the full response.
+            required: if True, only respond conditionally when
+                the queryset is not empty (e.g. for detail views).
+                Otherwise (e.g. for lists), no Last-Modified is set:
+                deleting a row, or a row leaving the filters, does not
+                change the latest update time.
+        """
+        if self.ENABLE_REQUEST_COALESCING:
+            get_response = self._coalesced(get_response)
 
+        updated_field = self.get_updated_field()
+        if not updated_field or self.request.method not in ('GET', 'HEAD'):
+            return get_response()
+
+        etag, last_modified, count = self.get_validators(
+            get_queryset(), updated_field
+        )
+        if required and not count:
+            return get_response()
+        if not required:
+            last_modified = None
+
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def _coalesced(self, get_response):
+        """Wrap `get_response` to share its result with identical requests.
+
+        Concurrent requests with the same signature wait for a single
+        in-flight computation and reuse its rendered content and headers.
+        Only successful responses are shared.
+        """
+        if self.get_format() == 'admin':
+            # the admin renderer depends on the request context
+            return get_response
+
+        def render():
+            response = self.finalize_response(self.request, get_response())
+            if response.status_code != 200:
+                # raised to opt out of sharing the response
+                raise _Unshared(response)
+            response.render()
+            return (
+                response.status_code,
+                response.content,
+                list(response.items())
+            )
+
+        def get_coalesced_response():
+            try:
+                (status_code, content, headers), _ = single_flight.do(
+                    self.get_request_signature(),
+                    render,
+                    timeout=settings.REQUEST_COALESCING_TIMEOUT,
+                    backend=settings.REQUEST_COALESCING_BACKEND
+                )
+            except _Unshared as e:
+                return e.response
+            response = HttpResponse(content, status=status_code)
+            for name, value in headers:
+                response[name] = value
+            return response
+
+        return get_coalesced_response
+
+    def _get_bucket_function(self, delta):
         try:
             seconds = delta.total_seconds()
         except Exception:
@@ -633,134 +915,170 @@ class WithDynamicViewSetBase(object):
             # 4+ years
             return 'year'
 
+    def _compute_bucket_functions(self, model_fields, queryset=None):
+        """Compute the bucket function of each field, in one query.
 
-    def _parse_combine_expression(self, expression, serializer=None, queryset=None, cast=None):
-        serializer = serializer or self.get_serializer()
+        Returns:
+            A dict mapping each model field path to a bucket function
+            name like "day", or None if the field has no usable range.
+        """
+        model_fields = [f for f in dict.fromkeys(model_fields) if f]
+        if not model_fields:
+            return {}
+        if queryset is None:
+            queryset = self.filter_queryset(self.get_queryset())
+        aggregates = {}
+        for i, model_field in enumerate(model_fields):
+            aggregates[f'_min{i}'] = Min(model_field)
+            aggregates[f'_max{i}'] = Max(model_field)
+        aggs = queryset.aggregate(**aggregates)
+
+        result = {}
+        for i, model_field in enumerate(model_fields):
+            try:
+                delta = aggs[f'_max{i}'] - aggs[f'_min{i}']
+            except Exception:
+                # cannot be subtracted or null values
+                result[model_field] = None
+            else:
+                result[model_field] = self._get_bucket_function(delta)
+        return result
+
+    def _compute_bucket_function(self, model_field, queryset=None):
+        if model_field is None:
+            return None
+        return self._compute_bucket_functions(
+            [model_field], queryset=queryset
+        ).get(model_field)
+
+    def _resolve_combine_field(self, serializer, name):
+        """Resolve an API field path to a model field path, or None.
+
+        Resolutions are cached by serializer class; names that do not
+        resolve are not, so that clients cannot grow the cache.
+        """
+        key = (serializer.__class__, name)
+        if key not in self._combine_fields:
+            try:
+                model_fields, _ = serializer.resolve(name)
+            except Exception:
+                return None
+            self._combine_fields[key] = '__'.join([
+                Meta.get_query_name(f) for f in model_fields
+            ])
+        return self._combine_fields[key]
+
+    def _parse_combine_expressions(self, expression):
+        """Parse combine query parameter values into `Expression`s."""
         if not expression:
             raise exceptions.ValidationError(
                 "No value provided for combine query parameter"
             )
         if isinstance(expression, str):
-            # strip whitespace
-            expression = expression.strip()
-            if ',' in expression:
-                # a, b
-                expression = [x.strip() for x in expression.split(',')]
-
-        if isinstance(expression, list):
-            result = [self._parse_combine_expression(x) for x in expression]
-            return result if len(expression) > 1 else result[0]
-
-        key = expression
+            expression = [expression]
 
-        if ' as ' in expression.lower():
+        result = []
+        for text in expression:
             try:
-                expression, key = re.split(' as ', expression, flags=re.IGNORECASE)
-            except ValueError:
-                raise exceptions.ValidationError(f"Invalid expression: '{expression}'")
-
-        arithmetic = re.search(REGEX.arithmetic_operator, expression)
-        if arithmetic:
-            arithmetic = arithmetic.group(0)
-            splits = re.split(REGEX.arithmetic_operator_capture, expression)
-            variables = []
-            operators = []
-            if len(splits) < 3:
-                raise exceptions.ValidationError(f"Arithmetic exception: invalid expression: '{expression}'")
-            for i, split in enumerate(splits):
-                split = split.strip()
-                if i % 2 == 0:
-                    if split in self.ARITHMETIC_FUNCTIONS:
-                        raise exceptions.ValidationError(f"Arithmetic exception: expecting a variable at position {i}, saw: '{split}'")
-                    cast = None
-                    if (i < len(splits) - 1 and splits[i+1] == '/') or (i > 0 and splits[i-1] == '/'):
-                        # treat as float
-                        cast = models.FloatField()
-                    variables.append(self._parse_combine_expression(split, serializer=serializer, cast=cast))
-                else:
-                    if split not in self.ARITHMETIC_FUNCTIONS:
-                        raise exceptions.ValidationError(f"Arithmetic exception: Expecting an operator at position {i}, saw: '{split}'")
-                    operators.append(split)
-
-            combined = None
-            for i, operator in enumerate(operators):
-                # TODO: handle MDAS order
-                # for now, the order is left-to-right :)
-                lhs = variables[i]['value'] if combined is None else combined
-                rhs = variables[i+1]['value']
-                fn = self.ARITHMETIC_FUNCTIONS[operator]
-                combined = fn(lhs, rhs)
-
-            result = {'key': key, 'value': combined, 'expression': expression}
-            return result
-
-        operator = value = None
-        match = re.match(REGEX.function_expression, expression, flags=re.IGNORECASE)
-        if match:
-            # sum(b.c)
-            operator = match.group(1).lower()
-            value = match.group(2).lower()
-            if match.group(3):
-                # sum(b.c) as x
-                key = match.group(3)
+                result.extend(parse(text.strip()))
+            except CombineSyntaxError as e:
+                raise exceptions.ValidationError(
+                    f"Invalid expression: '{text}': {e}"
+                )
+        return result
+
+    def _get_auto_fields(self, expressions, serializer):
+        """Get the model fields bucketed by `auto` in the given expressions."""
+        fields = []
+        for expression in expressions:
+            if not expression:
+                continue
+            for ex in self._parse_combine_expressions(expression):
+                for node in walk(ex.node):
+                    if (
+                        isinstance(node, Call)
+                        and node.name == 'auto'
+                        and len(node.args) == 1
+                        and isinstance(node.args[0], Identifier)
+                    ):
+                        fields.append(self._resolve_combine_field(
+                            serializer, node.args[0].name.lower()
+                        ))
+        return fields
+
+    def _compile_combine_node(
+        self, node, serializer, buckets, cast=None, scale=None
+    ):
+        """Compile an expression AST node into a value or Django expression.
+
+        If `scale` is set, sums and counts are multiplied by it,
+        e.g. to scale them up from a sample.
+        """
+        if isinstance(node, Literal):
+            value = node.value
+        elif isinstance(node, Identifier):
+            model_field = self._resolve_combine_field(serializer, node.name)
+            # F(field) or a literal value
+            value = F(model_field) if model_field else literalize(node.name)
+        elif isinstance(node, Negate):
+            value = -self._compile_combine_node(
+                node.operand, serializer, buckets, scale=scale
+            )
+        elif isinstance(node, BinOp):
+            # treat operands of a division as floats
+            operand_cast = models.FloatField() if node.op == '/' else None
+            lhs = self._compile_combine_node(
+                node.left, serializer, buckets, cast=operand_cast, scale=scale
+            )
+            rhs = self._compile_combine_node(
+                node.right, serializer, buckets, cast=operand_cast, scale=scale
+            )
+            return self.ARITHMETIC_FUNCTIONS[node.op](lhs, rhs)
         else:
-            match = re.match(REGEX.identifier_expression, expression, flags=re.IGNORECASE)
-            if match:
-                # b.c as x
-                value = match.group(1)
-                key = match.group(2)
-            else:
-                # b.c
-                value = expression
+            value = self._compile_combine_call(
+                node, serializer, buckets, scale=scale
+            )
 
-        model_field = target = None
-        if re.match(REGEX.identifier, value):
-            try:
-                model_fields, _ = serializer.resolve(value)
-            except Exception:
-                target = value
-            else:
-                target = model_field = '__'.join([
-                    Meta.get_query_name(f) for f in model_fields
-                ])
+        if cast:
+            value = Cast(value, cast)
+        return value
+
+    def _compile_combine_call(self, node, serializer, buckets, scale=None):
+        operator = node.name
+        if len(node.args) != 1:
+            raise exceptions.ValidationError(
+                f'Expecting one argument for "{operator}"'
+            )
+        arg = node.args[0]
+        model_field = None
+        if isinstance(arg, Identifier):
+            target = arg.name.lower()
+            model_field = self._resolve_combine_field(serializer, target)
+            target = model_field or target
         else:
-            target = value
+            target = self._compile_combine_node(
+                arg, serializer, buckets, scale=scale
+            )
 
-        options = {}
-        args = []
-        fn = fn_cast = None
-        if not operator:
-            if model_field:
-                fn = F
-                # F(field)
-            else:
-                # literal value
-                fn = lambda x, *_, **__: literalize(x)
+        if operator == 'auto':
+            # automatic buckets (date/time only)
+            fn = buckets.get(model_field) or 'month'
+            fn = self.COMBINE_FUNCTIONS.get(fn, None)
         else:
-            if operator == 'auto':
-                # automatic buckets (date/time only)
-                fn = self._compute_bucket_function(model_field, queryset=queryset) or 'month'
-                fn = self.COMBINE_FUNCTIONS.get(fn, None)
-            else:
-                fn = self.COMBINE_FUNCTIONS.get(operator, None)
-
-            if not fn:
-                match = re.match(REGEX.word_number, operator)
-                if match:
-                    word = match.group(1)
-                    number = int(match.group(2))
-                    if word in self.COMBINE_FUNCTIONS:
-                        if not isinstance(self.COMBINE_FUNCTIONS[word], dict) or 'python' not in self.COMBINE_FUNCTIONS[word]:
-                            raise exceptions.ValidationError(
-                                f'Cannot post-aggregate using {operator}'
-                            )
-                        # sum0/sum1 = sum given field by dimension 0 / 1
-                        return {'value': None, 'key': key, 'then': [word, number, target], 'expression': expression}
+            fn = self.COMBINE_FUNCTIONS.get(operator, None)
 
+        if not fn:
+            if self._get_post_aggregate(node, serializer):
                 raise exceptions.ValidationError(
-                    f'Unknown function: "{operator}"'
+                    f'Cannot use post-aggregate {operator} in an arithmetic expression'
                 )
+            raise exceptions.ValidationError(
+                f'Unknown function: "{operator}"'
+            )
 
+        options = {}
+        args = []
+        fn_cast = None
         if isinstance(fn, dict):
             options = fn.get('options', options)
             args = fn.get('args', args)
@@ -768,11 +1086,107 @@ class WithDynamicViewSetBase(object):
             fn = fn['function']
 
         value = fn(target, *args, **options)
-        if cast:
-            value = Cast(value, cast)
-        elif fn_cast:
-            value = Cast(value, cast)
-        return {'key': key, 'value': value, 'expression': expression}
+        if fn_cast:
+            value = Cast(value, fn_cast)
+        if scale and operator in ('sum', 'count'):
+            value = Cast(value, models.FloatField()) * scale
+        elif scale and operator == 'distinct':
+            raise exceptions.ValidationError(
+                'Cannot approximate distinct counts in an arithmetic expression'
+            )
+        return value
+
+    def _get_post_aggregate(self, node, serializer):
+        """Get a post-aggregate call like sum0(x) as [word, number, target]."""
+        if not isinstance(node, Call) or len(node.args) != 1:
+            return None
+        match = re.match(REGEX.word_number, node.name)
+        if not match:
+            return None
+        word = match.group(1)
+        number = int(match.group(2))
+        if word not in self.COMBINE_FUNCTIONS:
+            return None
+        function = self.COMBINE_FUNCTIONS[word]
+        if not isinstance(function, dict) or 'python' not in function:
+            raise exceptions.ValidationError(
+                f'Cannot post-aggregate using {node.name}'
+            )
+        arg = node.args[0]
+        if not isinstance(arg, Identifier):
+            raise exceptions.ValidationError(
+                f'Expecting a name for post-aggregate {node.name}'
+            )
+        target = arg.name.lower()
+        target = self._resolve_combine_field(serializer, target) or target
+        return [word, number, target]
+
+    def _parse_combine_expression(
+        self, expression, serializer=None, queryset=None, cast=None,
+        buckets=None, scale=None
+    ):
+        """Parse and compile combine expressions.
+
+        Arguments:
+            expression: a string like "sum(a) / count(b) as x, max(c)",
+                or a list of such strings
+            serializer: the serializer used to resolve field names
+            queryset: the queryset used to compute `auto` buckets
+            cast: optional field to cast each value to
+            buckets: precomputed `auto` buckets, by model field
+            scale: optional factor for sums and counts, for sampling
+
+        Returns:
+            A dict, or a list of dicts if there are many expressions,
+            each with "key", "value" and "expression"; post-aggregates
+            like sum0(x) have no value and a "then" instead.
+            When scaling, a plain sum, count or distinct count of a field
+            also has a "sample" of (function, field).
+        """
+        serializer = serializer or self.get_serializer()
+        expressions = self._parse_combine_expressions(expression)
+        if buckets is None:
+            buckets = self._compute_bucket_functions(
+                self._get_auto_fields([expression], serializer),
+                queryset=queryset
+            )
+
+        result = []
+        for ex in expressions:
+            key = ex.alias or ex.text
+            then = self._get_post_aggregate(ex.node, serializer)
+            if then:
+                # sum0/sum1 = sum given field by dimension 0 / 1
+                result.append(
+                    {'value': None, 'key': key, 'then': then, 'expression': ex.text}
+                )
+                continue
+            sample = None
+            node = ex.node
+            if (
+                scale
+                and isinstance(node, Call)
+                and node.name in ('sum', 'count', 'distinct')
+                and len(node.args) == 1
+                and isinstance(node.args[0], Identifier)
+            ):
+                name = node.args[0].name.lower()
+                sample = (
+                    node.name,
+                    self._resolve_combine_field(serializer, name) or name
+                )
+            value = self._compile_combine_node(
+                node,
+                serializer,
+                buckets,
+                cast=cast,
+                # distinct counts are estimated separately
+                scale=None if sample and sample[0] == 'distinct' else scale
+            )
+            result.append({'key': key, 'value': value, 'expression': ex.text})
+            if sample:
+                result[-1]['sample'] = sample
+        return result if len(result) > 1 else result[0]
 
     ARITHMETIC_FUNCTIONS = {
         '/': op.truediv,
@@ -783,23 +1197,28 @@ class WithDynamicViewSetBase(object):
     COMBINE_FUNCTIONS = {
         'sum': {
             'function': Sum,
-            'python': sum
+            'python': sum,
+            'window': 'SUM'
         },
         'min': {
             'function': Min,
-            'python': min
+            'python': min,
+            'window': 'MIN'
         },
         'max': {
             'function': Max,
-            'python': max
+            'python': max,
+            'window': 'MAX'
         },
         'avg': {
             'function': Avg,
-            'python': statistics.mean
+            'python': statistics.mean,
+            'window': 'AVG'
         },
         'count': {
             'function': Count,
-            'python': len
+            'python': len,
+            'window': 'COUNT'
         },
         'distinct': {
             'function': Count,
@@ -809,7 +1228,8 @@ class WithDynamicViewSetBase(object):
             }
         },
         'percent': {
-            'python': percent
+            'python': percent,
+            'window': 'SUM'
         },
         'year': {
             'function': Trunc,
@@ -862,45 +1282,555 @@ class WithDynamicViewSetBase(object):
         # 'trim': Trim,
         'upper': Upper
     }
+
+    def _compile_window_post_aggregates(
+        self, queryset, thens, aggregations, dimensions
+    ):
+        """Compile post-aggregates into window functions, if supported.
+
+        A post-aggregate like `sum1(x)` becomes `SUM(x) OVER (PARTITION BY d0)`,
+        computed by the database alongside the grouped rows.
+
+        Arguments:
+            queryset: the grouped queryset
+            thens: list of post-aggregates as (key, function, dimension, ref)
+            aggregations: dict of aggregate annotations
+            dimensions: list of dimension annotations
+
+        Returns:
+            A tuple of (windows, percents, thens): window annotations,
+            (key, ref) pairs for percentages to compute from their windowed
+            totals, and the post-aggregates left to compute in Python.
+        """
+        if not thens or not connections[queryset.db].features.supports_over_clause:
+            return {}, [], thens
+
+        windows = {}
+        percents = []
+        remaining = []
+        for then in thens:
+            key, function, dimension, ref = then
+            window = self.COMBINE_FUNCTIONS[function].get('window')
+            if not window or '_' + ref not in aggregations:
+                # e.g. post-aggregates of post-aggregates
+                remaining.append(then)
+                continue
+            options = {'output_field': models.FloatField()} if window == 'AVG' else {}
+            partition = [F(d) for d in dimensions[:dimension]]
+            windows['_' + key] = Window(
+                WindowAggregate(F('_' + ref), function=window, **options),
+                partition_by=partition or None
+            )
+            if function == 'percent':
+                percents.append((key, ref))
+        return windows, percents, remaining
+
+    def get_combine_rollup(self, serializer, expression, by, over, order=None):
+        """Compile a combine request against a rollup, if one covers it.
+
+        A rollup covers a request if it has every requested dimension and
+        aggregate, and filters are equality filters on its dimensions.
+        Requests whose rows may be scoped, e.g. by permissions, a filtered
+        base queryset, custom filter backends or a serializer's
+        `filter_queryset`, are never answered from rollups.
+
+        Returns:
+            A tuple of (queryset, expressions, by, over, order) for the
+            rollup's table, or None.
+        """
+        rollups = get_rollups(self.__class__)
+        if not rollups:
+            return None
+        permissions = getattr(self, 'permissions', None)
+        if permissions and not permissions.list.full_access:
+            return None
+        if (
+            type(self).filter_queryset is not viewsets.ModelViewSet.filter_queryset
+            or any(
+                backend not in ROLLUP_FILTER_BACKENDS
+                for backend in self.filter_backends
+            )
+            or hasattr(serializer, 'filter_queryset')
+        ):
+            return None
+        base_queryset = self.get_queryset()
+        if base_queryset.query.where:
+            return None
+
+        filters = self.get_request_feature(self.FILTER)
+        expressions = self._parse_combine_expressions(expression)
+        by_nodes = self._parse_combine_expressions(by) if by else []
+        over_nodes = self._parse_combine_expressions(over) if over else []
+        order_nodes = self._parse_combine_expressions(order) if order else []
+        for rollup in rollups:
+            try:
+                queryset = rollup.get_model().objects.using(base_queryset.db)
+                for key, values in filters.items():
+                    name, _, operator = key.partition('.')
+                    column = rollup.get_dimension(Identifier(name))
+                    if not column or operator not in ('', 'eq', 'in'):
+                        raise _NotCovered()
+                    if operator == 'in' or len(values) > 1:
+                        queryset = queryset.filter(**{column + '__in': values})
+                    else:
+                        queryset = queryset.filter(**{column: values[0]})
+
+                dimensions = []
+                for nodes in (by_nodes, over_nodes):
+                    dimensions.append([])
+                    for ex in nodes:
+                        column = rollup.get_dimension(ex.node)
+                        if not column:
+                            raise _NotCovered()
+                        dimensions[-1].append({
+                            'key': ex.alias or ex.text,
+                            'value': F(column),
+                            'expression': ex.text
+                        })
+
+                compiled = []
+                for ex in expressions:
+                    key = ex.alias or ex.text
+                    then = self._get_post_aggregate(ex.node, serializer)
+                    if then:
+                        compiled.append({
+                            'value': None,
+                            'key': key,
+                            'then': then,
+                            'expression': ex.text
+                        })
+                        continue
+                    value = self._compile_rollup_node(ex.node, rollup)
+                    compiled.append({'key': key, 'value': value, 'expression': ex.text})
+                compiled_order = [
+                    {
+                        'key': ex.alias or ex.text,
+                        'value': self._compile_rollup_node(ex.node, rollup),
+                        'expression': ex.text
+                    }
+                    for ex in order_nodes
+                ]
+            except _NotCovered:
+                continue
+            if rollup.is_built(base_queryset.db):
+                if len(compiled_order) == 1:
+                    compiled_order = compiled_order[0]
+                return (
+                    queryset,
+                    compiled,
+                    dimensions[0],
+                    dimensions[1],
+                    compiled_order or None
+                )
+        return None
+
+    def _compile_rollup_node(self, node, rollup):
+        """Compile an expression AST node into an aggregate of rollup columns."""
+        if isinstance(node, Literal):
+            return node.value
+        if isinstance(node, Negate):
+            return -self._compile_rollup_node(node.operand, rollup)
+        if isinstance(node, BinOp):
+            lhs = self._compile_rollup_node(node.left, rollup)
+            rhs = self._compile_rollup_node(node.right, rollup)
+            if node.op == '/':
+                # treat operands of a division as floats
+                lhs = Cast(lhs, models.FloatField())
+                rhs = Cast(rhs, models.FloatField())
+            return self.ARITHMETIC_FUNCTIONS[node.op](lhs, rhs)
+        if (
+            not isinstance(node, Call)
+            or len(node.args) != 1
+            or not isinstance(node.args[0], Identifier)
+        ):
+            raise _NotCovered()
+
+        field = node.args[0].name.lower()
+        if node.name == 'avg':
+            total = rollup.get_value('sum', field)
+            count = rollup.get_value('count', field)
+            if not total or not count:
+                raise _NotCovered()
+            return Cast(Sum(total), models.FloatField()) / NullIf(Sum(count), 0)
+
+        column = rollup.get_value(node.name, field)
+        if not column:
+            raise _NotCovered()
+        # sums and counts add up, minimums and maximums do not
+        if node.name == 'min':
+            return Min(column)
+        if node.name == 'max':
+            return Max(column)
+        return Sum(column)
+
+    def get_combine_limit(self, combine):
+        """Get the number of groups to return for a combine request, or None."""
+        limit = combine.get('limit')
+        if not limit:
+            return None
+        try:
+            limit = int(limit[-1])
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise exceptions.ValidationError(
+                'combine.limit must be a positive integer'
+            )
+        return limit
+
+    def _limit_combine_groups(self, queryset, annotations, keys, order, limit):
+        """Collapse all but the top `limit` groups into an "other" bucket.
+
+        Groups are ranked by `order` in a subquery of the same query,
+        ties broken by their keys.
+        Rows outside of the top groups get null values for `keys`
+        and a true "_drest_other" annotation.
+
+        Arguments:
+            queryset: the queryset to group
+            annotations: the annotations of the grouping values,
+                updated in place
+            keys: the keys of the values that are ranked
+            order: the aggregate to rank groups by, largest first
+            limit: the number of groups to keep
+
+        Returns:
+            A tuple of (queryset, key), where `key` is the "_drest_key"
+            annotation that the "other" annotations refer to.
+        """
+        if len(keys) == 1:
+            key = annotations[keys[0]]
+        else:
+            parts = []
+            for k in keys:
+                parts.extend([Cast(annotations[k], models.TextField()), Value('\x1f')])
+            key = Concat(*parts[:-1], output_field=models.TextField())
+
+        queryset = queryset.annotate(_drest_key=key)
+        top = (
+            queryset
+            .values('_drest_key')
+            .annotate(_drest_order=order)
+            .order_by(F('_drest_order').desc(nulls_last=True), '_drest_key')
+            .values('_drest_key')[:limit]
+        )
+        other = ~Q(_drest_key__in=top)
+        for k in keys:
+            annotations[k] = Case(When(other, then=Value(None)), default=annotations[k])
+        annotations['_drest_other'] = Case(
+            When(other, then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField()
+        )
+        return queryset, key
+
+    def get_combine_sample(self, combine):
+        """Get the fraction of rows to sample for a combine request, or None.
+
+        Set by `combine.sample=<fraction>`, or `combine.approx=true`
+        for the `COMBINE_APPROX_SAMPLE` fraction.
+        """
+        sample = combine.get('sample')
+        if sample:
+            try:
+                fraction = float(sample[-1])
+            except ValueError:
+                fraction = None
+            if fraction is None or not MIN_SAMPLE <= fraction <= 1:
+                raise exceptions.ValidationError(
+                    'combine.sample must be a fraction between %g and 1'
+                    % MIN_SAMPLE
+                )
+            return fraction
+        approx = combine.get('approx')
+        if approx and is_truthy(approx[-1]):
+            return settings.COMBINE_APPROX_SAMPLE
+        return None
+
+    def get_combine_fill(self, combine, serializer, buckets):
+        """Get the fill mode and time bucket of a combine request, or None.
+
+        Set by `combine.fill=zero|null|previous`, for a single
+        `combine.over` time bucket like "month(created)" or "auto(created)".
+        """
+        fill = combine.get('fill')
+        if not fill:
+            return None
+        mode = fill[-1]
+        if mode not in FILL_MODES:
+            raise exceptions.ValidationError(
+                'combine.fill must be one of: %s' % ', '.join(FILL_MODES)
+            )
+        over = combine.get('over')
+        expressions = self._parse_combine_expressions(over) if over else []
+        node = expressions[0].node if len(expressions) == 1 else None
+        bucket = None
+        if isinstance(node, Call) and len(node.args) == 1:
+            bucket = 'day' if node.name == 'date' else node.name
+            if bucket == 'auto' and isinstance(node.args[0], Identifier):
+                model_field = self._resolve_combine_field(
+                    serializer, node.args[0].name.lower()
+                )
+                bucket = buckets.get(model_field) or 'month'
+        if bucket not in FILL_STEPS:
+            raise exceptions.ValidationError(
+                'combine.fill requires a single time bucket in combine.over'
+            )
+        return mode, bucket
+
+    def _estimate_combine_sample(
+        self, queryset, annotations, values, rows, samples, fraction
+    ):
+        """Estimate the error of a sampled combine, and get its distinct counts.
+
+        Distinct counts cannot be scaled up from a sample, so they are
+        counted exactly, over every row, in one grouped query.
+
+        Arguments:
+            queryset: the unsampled queryset
+            annotations: the annotations of the grouping values
+            values: the keys of the grouping values
+            rows: the sampled results, updated in place
+            samples: (index, key, function, target) of each estimate
+            fraction: the fraction of rows sampled
+
+        Returns:
+            Response meta with the sample fraction and, for each estimate,
+            its relative error at 95% confidence (the largest across groups).
+        """
+        errors = {}
+        distinct = []
+        for i, key, function, target in samples:
+            if function == 'distinct':
+                distinct.append((key, target))
+                continue
+            worst = None
+            for row in rows:
+                error = sampling_error(
+                    fraction, row.get(key), row.pop('sq_%d' % i, None)
+                )
+                if error is not None and (worst is None or error > worst):
+                    worst = error
+            errors[key] = worst
+
+        if distinct:
+            counts = {
+                '_drest_distinct_%d' % j: Count(target, distinct=True)
+                for j, (_, target) in enumerate(distinct)
+            }
+            queryset = queryset.annotate(**annotations).order_by()
+            if values:
+                groups = {
+                    tuple(item[v] for v in values): item
+                    for item in queryset.values(*values).annotate(**counts)
+                }
+            else:
+                groups = {(): queryset.aggregate(**counts)}
+
+            for row in rows:
+                group = groups.get(
+                    tuple(row.get(remove_underscore(v)) for v in values), {}
+                )
+                for j, (key, _) in enumerate(distinct):
+                    row[key] = group.get('_drest_distinct_%d' % j, 0)
+            for key, _ in distinct:
+                errors[key] = 0
+
+        return {'sample': fraction, 'error': errors}
+
+    def get_combine_cache_key(self, combine, queryset):
+        """Get the cache key of a combine request, and its models.
+
+        Requests share a key if their combine expressions parse the same,
+        their other query parameters are equal and they aggregate the
+        same rows, i.e. their filtered querysets compile to the same SQL,
+        so rows scoped by user are never shared between users.
+
+        Returns:
+            A tuple of (key, models), where `models` are the models
+            whose data the result depends on: the queryset's model,
+            every joined model and every model related through
+            a combine expression.
+        """
+        expressions = {}
+        for name, values in sorted(combine.items()):
+            if name in ('', 'by', 'over', 'order'):
+                values = repr(self._parse_combine_expressions(values))
+            expressions[name] = values
+
+        try:
+            sql = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            sql = None
+
+        key = json.dumps([
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.request.path,
+            self.get_format(),
+            expressions,
+            sorted(
+                (name, values)
+                for name, values in self.request.query_params.lists()
+                if name != 'combine' and not name.startswith('combine.')
+            ),
+            sql
+        ], default=str)
+
+        tables = {
+            model._meta.db_table: model
+            for model in apps.get_models(include_auto_created=True)
+        }
+        models_ = {queryset.model: None}
+        for join in queryset.query.alias_map.values():
+            if join.table_name in tables:
+                models_[tables[join.table_name]] = None
+
+        serializer = self.get_serializer()
+        for values in (combine.get(name) for name in ('', 'by', 'over', 'order')):
+            if not values:
+                continue
+            for ex in self._parse_combine_expressions(values):
+                for node in walk(ex.node):
+                    if not isinstance(node, Identifier):
+                        continue
+                    path = self._resolve_combine_field(serializer, node.name.lower())
+                    model = queryset.model
+                    for name in (path or '').split('__'):
+                        try:
+                            field = model._meta.get_field(name)
+                        except Exception:
+                            break
+                        if not field.is_relation or not field.related_model:
+                            break
+                        through = getattr(field, 'through', None) or getattr(
+                            field.remote_field, 'through', None
+                        )
+                        if through is not None:
+                            models_[through] = None
+                        model = field.related_model
+                        models_[model] = None
+
+        return hashlib.sha1(key.encode('utf-8')).hexdigest(), list(models_)
+
     def combine(self, request, combine, **kwargs):
+        renderer = self.get_streaming_renderer()
+        if renderer:
+            return self.stream(
+                self._combine(combine, flat=True, stream=True)['data'], renderer
+            )
+        # some renderers, e.g. for format=columnar, expect flat rows
+        flat = getattr(request.accepted_renderer, 'flat', False)
+        if not self.ENABLE_COMBINE_CACHE:
+            return Response(self._combine(combine, flat=flat), status=200)
+
+        key, models_ = self.get_combine_cache_key(
+            combine, self.filter_queryset(self.get_queryset())
+        )
+        response = ResultCache.for_settings().get_or_compute(
+            key, models_, lambda: self._combine(combine, flat=flat)
+        )
+        return Response(response, status=200)
+
+    def _combine(self, combine, flat=False, stream=False):
         serializer = self.get_serializer()
         expression = combine.get('', None)
         by = combine.get('by', None)
         over = combine.get('over', None)
-        flat = 'flat' in combine.get('format', [])
-        base_queryset = self.filter_queryset(self.get_queryset())
-        if has_joins(base_queryset):
-            # if the base queryset has joins, we may produce inaccurate results if we aggregate
-            # within the same queryset (if the joins can yield multiple output rows for each row
-            # from the base table) -- instead, we replace the base queryset using a subquery approach
-            queryset = base_queryset.model.objects.filter(pk__in=base_queryset.only('pk'))
+        flat = flat or 'flat' in combine.get('format', [])
+        order = combine.get('order', None)
+        limit = self.get_combine_limit(combine)
+        if limit and not by:
+            raise exceptions.ValidationError('combine.limit requires combine.by')
+        if order and not limit and (over or not by):
+            # groups over time buckets are ordered by bucket
+            raise exceptions.ValidationError(
+                'combine.order requires combine.limit, or combine.by '
+                'without combine.over'
+            )
+
+        by_exs = []
+        over_paths = []
+        over_exs = []
+        sample = None
+        buckets = {}
+        rollup = self.get_combine_rollup(
+            serializer, expression, by, over, order
+        )
+        if rollup:
+            queryset, expression, by_exs, over_exs, order = rollup
         else:
-            queryset = base_queryset
+            base_queryset = self.filter_queryset(self.get_queryset())
+            if has_joins(base_queryset):
+                # if the base queryset has joins, we may produce inaccurate
+                # results if we aggregate within the same queryset (if the
+                # joins can yield multiple output rows for each row from the
+                # base table) -- instead, we replace the base queryset using
+                # a subquery approach
+                queryset = base_queryset.model.objects.filter(
+                    pk__in=base_queryset.only('pk')
+                )
+            else:
+                queryset = base_queryset
+
+            # one query for the bounds of every auto(field) bucket
+            buckets = self._compute_bucket_functions(
+                self._get_auto_fields([expression, by, over], serializer),
+                queryset=queryset
+            )
+
+            exact_queryset = queryset
+            scale = None
+            sample = self.get_combine_sample(combine)
+            if sample:
+                queryset, sample = sample_queryset(queryset, sample)
+                if sample < 1:
+                    scale = 1 / sample
+                else:
+                    sample = None
+
+            expression = self._parse_combine_expression(
+                expression, serializer, queryset, buckets=buckets, scale=scale
+            )
+            if by:
+                by_exs = self._parse_combine_expression(
+                    by, serializer, queryset=queryset, buckets=buckets
+                )
+            if over:
+                over_exs = self._parse_combine_expression(
+                    over, serializer, queryset=queryset, buckets=buckets
+                )
+            if order:
+                order = self._parse_combine_expression(
+                    order, serializer, buckets=buckets, scale=scale
+                )
+        fill = self.get_combine_fill(combine, serializer, buckets)
 
-        expression = self._parse_combine_expression(expression, serializer, queryset)
         aggregations = {}
         thens = []
         if not isinstance(expression, list):
             expression = [expression]
+        if not isinstance(by_exs, list):
+            by_exs = [by_exs]
+        if not isinstance(over_exs, list):
+            over_exs = [over_exs]
 
-        by_exs = []
-        over_paths = []
-        over_exs = []
         if by:
-            by_exs = self._parse_combine_expression(by, serializer, queryset=queryset)
-            if not isinstance(by_exs, list):
-                by_exs = [by_exs]
             for ex in by_exs:
                 if not ex['value']:
                     raise exceptions.ValidationError(f'Expression invalid for "by": {ex["expression"]}')
         if over:
-            over_exs = self._parse_combine_expression(over, serializer, queryset=queryset)
-            if not isinstance(over_exs, list):
-                over_exs = [over_exs]
             for ex in over_exs:
                 if not ex['value']:
                     raise exceptions.ValidationError(f'Expression invalid for "over": {ex["expression"]}')
                 over_paths.append(ex['value'])
+        if limit or order:
+            if isinstance(order, list):
+                raise exceptions.ValidationError('Expecting one expression for "order"')
+            # rank by the first expression by default
+            order = order['value'] if order else expression[0]['value']
+            if order is None:
+                raise exceptions.ValidationError('Expression invalid for "order"')
 
         for ex in expression:
             value = ex.get('value')
@@ -910,13 +1840,26 @@ class WithDynamicViewSetBase(object):
             if then is not None:
                 thens.append((ex['key'], *then))
 
+        samples = []
+        if sample:
+            for i, ex in enumerate(expression):
+                if 'sample' not in ex:
+                    continue
+                function, target = ex['sample']
+                samples.append((i, ex['key'], function, target))
+                # for error bounds: sums of squares, and sample sizes
+                if function == 'sum':
+                    aggregations['_sq_%d' % i] = Sum(F(target) * F(target))
+                elif function == 'count':
+                    aggregations['_sq_%d' % i] = Count(target)
+
         flat_data = []
         data = [] if flat else {}
         simple = True
+        values = []
+        annotations = {}
         if by or over:
             data = {}
-            values = []
-            annotations = {}
             for ex in by_exs:
                 by_key = '_' + ex['key']
                 values.append(by_key)
@@ -926,73 +1869,116 @@ class WithDynamicViewSetBase(object):
                 values.append(over_key)
                 annotations[over_key] = ex['value']
 
+            if limit:
+                queryset, key = self._limit_combine_groups(
+                    queryset, annotations, values[:len(by_exs)], order, limit
+                )
+                if sample:
+                    # distinct counts are computed over the unsampled rows
+                    exact_queryset = exact_queryset.annotate(_drest_key=key)
+                values.append('_drest_other')
+
             queryset = (
                 queryset
                 .annotate(**annotations)
                 .values(*values)
                 .annotate(**aggregations)
             )
+            windows, percents = {}, []
+            if not sample and not limit and not fill:
+                # post-aggregates of estimates, or of filled rows,
+                # are computed in Python
+                windows, percents, thens = self._compile_window_post_aggregates(
+                    queryset, thens, aggregations, values
+                )
+            if windows:
+                queryset = queryset.annotate(**windows)
             if over:
                 queryset = queryset.order_by(*over_paths)
+            elif limit:
+                queryset = queryset.annotate(
+                    _drest_order=order
+                ).order_by(
+                    '_drest_other',
+                    F('_drest_order').desc(nulls_last=True),
+                    *values[:len(by_exs)]
+                )
+            elif order:
+                # largest first, as for combine.limit
+                queryset = queryset.alias(_drest_order=order).order_by(
+                    F('_drest_order').desc(nulls_last=True), *values
+                )
             else:
                 # by only without over -> remove default ordering
                 # this improves performance and prevents a grouping bug
                 queryset = queryset.order_by()
 
-            flat_data = remove_underscores(list(queryset))
+            if fill:
+                try:
+                    flat_data = remove_underscores(fill_series(
+                        queryset,
+                        fill[1],
+                        values[len(by_exs)],
+                        values[:len(by_exs)] + values[len(by_exs) + 1:],
+                        fill[0],
+                        max_buckets=settings.COMBINE_MAX_BUCKETS
+                    ))
+                except (NotSupportedError, TooManyBuckets) as e:
+                    raise exceptions.ValidationError(str(e))
+            elif stream and not (limit or sample or thens or percents):
+                # nothing is left to compute in Python:
+                # rows go straight from the cursor to the client
+                flat_data = (
+                    clean(row) for row in iter_remove_underscores(
+                        queryset.iterator(chunk_size=settings.STREAMING_CHUNK_SIZE)
+                    )
+                )
+            else:
+                flat_data = remove_underscores(list(queryset))
+            if limit:
+                for row in flat_data:
+                    row.pop('drest_order', None)
+            for key, ref in percents:
+                # the window computes the total, the ratio is exact
+                for row in flat_data:
+                    row[key] = percent_of(row[key], row.get(ref))
             simple = False
         else:
             # simple aggregation (without "over" or "by")
             flat_data = remove_underscores([queryset.aggregate(**aggregations)])
             data = flat_data[0]
 
+        meta = {}
+        if sample:
+            meta = self._estimate_combine_sample(
+                exact_queryset, annotations, values, flat_data, samples, sample
+            )
+
+        if limit:
+            # a flag, rather than a key value, that cannot be
+            # confused with a group of the same name
+            for row in flat_data:
+                row[OTHER] = row.pop('drest_other')
+
         if not simple and thens:
             dimensions = [x['key'] for x in by_exs + over_exs]
-            for then in thens:
-                # post-aggregates
-                key, function, dimension, ref = then
-                cache_level = 'values' if function == 'percent' else 'data'
-                if dimension > len(dimensions):
-                    dimension = len(dimensions)
-                fn = self.COMBINE_FUNCTIONS[function]['python']
-                cache = {}
-
-                def get_cache_key(row):
-                    if dimension == 0:
-                        return '1'
-                    return tuple(row.get(dimensions[i]) for i in range(dimension))
-
-                def is_grouped(row, other):
-                    return row == other or get_cache_key(row) == get_cache_key(other)
-
-                def get_values(row, cache_key):
-                    if cache_level == 'values' and cache_key in cache:
-                        return cache[cache_key]
-
-                    base = [x.get(ref) for x in flat_data if is_grouped(row, x)]
-                    # None usually throws off statistic functions
-                    result = [x for x in base if x is not None]
-                    if cache_level == 'values':
-                        cache[cache_key] = result
-                    return result
-
-                def get_data(row):
-                    cache_key = get_cache_key(row)
-                    if cache_level == 'data' and cache_key in cache:
-                        return cache[cache_key]
-
-                    vals = get_values(row, cache_key)
-                    if cache_level == 'data':
-                        result = fn(vals)
-                    else:
-                        result = fn(vals, this=row.get(ref))
-                    if cache_level == 'data':
-                        cache[cache_key] = result
-                    return result
-
-                for row in flat_data:
-                    row[key] = get_data(row)
+            for key, function, dimension, ref in thens:
+                # the "other" rows are a group of their own
+                # in every dimension but the total
+                dims = dimensions[:dimension]
+                if limit and dims:
+                    dims.append(OTHER)
+                # post-aggregates, e.g. sum0(x): sum of x by dimension 0
+                post_aggregate(
+                    flat_data,
+                    dims,
+                    key,
+                    function,
+                    ref,
+                    self.COMBINE_FUNCTIONS[function]['python']
+                )
 
+        other = None
         if flat:
             data = flat_data
         elif not simple:
@@ -1013,11 +1999,29 @@ class WithDynamicViewSetBase(object):
             #       ex1:
             #           [over1_0, over1_1, value1]
             #
+            # with combine.limit, the "other" group is returned
+            # separately, without its (null) by values
+
+            rows = flat_data
+            if limit:
+                rows = []
+                other = {}
+                for item in flat_data:
+                    if not item.pop(OTHER):
+                        rows.append(item)
+                        continue
+                    x = [item.get(ex['key']) for ex in over_exs]
+                    for ex in expression:
+                        key = ex['key']
+                        if over:
+                            other.setdefault(key, []).append([*x, item[key]])
+                        else:
+                            other[key] = item[key]
 
             data = {}
             x = None
             bys = None
-            for item in flat_data:
+            for item in rows:
                 bys = []
                 x = []
                 for ex in by_exs:
@@ -1052,10 +2056,14 @@ class WithDynamicViewSetBase(object):
                            [*x, y]
                         )
         response = {'data': clean(data)}
+        if other is not None:
+            response['other'] = clean(other)
         debug = self.get_request_debug()
         if debug:
-            response['meta'] = {'query': str(queryset.query)}
-        return Response(response, status=200)
+            meta['query'] = str(queryset.query)
+        if meta:
+            response['meta'] = meta
+        return response
 
     def list_related(self, request, pk=None, field_name=None):
         """Fetch related object(s), as if sideloaded (used to support
@@ -1145,9 +2153,99 @@ class DynamicModelViewSet(WithDynamicViewSetMixin, viewsets.ModelViewSet):
         return False
 
     def _get_bulk_payload_csv(self, request):
-        file = request.data['file']
-        reader = csv.DictReader(StringIO(file.read().decode('utf-8')))
-        return [r for r in reader]
+        return list(self._iter_csv(request.data['file']))
+
+    def _iter_csv(self, file):
+        """Read the rows of an uploaded CSV file, without loading all of it."""
+        text = TextIOWrapper(file, encoding='utf-8', newline='')
+        try:
+            yield from csv.DictReader(text)
+        finally:
+            # leave the upload open
+            text.detach()
+
+    def _import_csv(self, request):
+        """Create (or upsert) the rows of an uploaded CSV file.
+
+        Rows are read incrementally, and validated and written in batches
+        of `BULK_BATCH_SIZE`, each in its own transaction, so memory use
+        does not grow with the size of the file. Without
+        `ENABLE_BULK_PARTIAL_CREATION`, a batch with an invalid row is
+        not written, but other batches are; its valid rows fail too.
+        A batch with rows the user may not write is not written either,
+        and all of its rows fail.
+
+        Returns:
+            A summary of the created (and updated) rows, and of the
+            failed rows, with the first `CSV_IMPORT_MAX_ERRORS` errors
+            numbered by row. Every row read is counted once.
+        """
+        names = self.get_upsert_fields()
+        sources = None
+        if names:
+            sources = self._get_upsert_sources(self.get_serializer(), names)
+        summary = {'created': 0, 'updated': 0} if names else {'created': 0}
+        failed = 0
+        errors = []
+        batch_size = settings.BULK_BATCH_SIZE
+
+        def process(offset, batch):
+            context = self.get_bulk_serializer_context()
+            context['relation_resolver'].collect(
+                self.get_serializer(context=context), batch
+            )
+            try:
+                with transaction.atomic():
+                    if names:
+                        result, batch_errors = self._upsert_rows(
+                            batch, names, sources, context
+                        )
+                    else:
+                        created, batch_errors = self._create_rows(
+                            batch, context
+                        )
+            except exceptions.PermissionDenied as e:
+                # the batch is rolled back, earlier batches are kept
+                batch_errors = [
+                    (index, {'detail': e.detail, 'source': row})
+                    for index, row in enumerate(batch)
+                ]
+            else:
+                if names:
+                    summary['created'] += result['created']
+                    summary['updated'] += result['updated']
+                else:
+                    summary['created'] += len(created)
+                if batch_errors and not self.ENABLE_BULK_PARTIAL_CREATION:
+                    # the valid rows of the batch were not written either
+                    invalid = {index for index, _ in batch_errors}
+                    batch_errors = sorted(batch_errors + [
+                        (index, {'detail': SKIPPED_ROW, 'source': row})
+                        for index, row in enumerate(batch)
+                        if index not in invalid
+                    ], key=op.itemgetter(0))
+            for index, error in batch_errors:
+                if len(errors) < settings.CSV_IMPORT_MAX_ERRORS:
+                    error['row'] = offset + index + 1
+                    errors.append(error)
+            return len(batch_errors)
+
+        batch = []
+        offset = 0
+        for row in self._iter_csv(request.data['file']):
+            batch.append(row)
+            if len(batch) == batch_size:
+                failed += process(offset, batch)
+                offset += len(batch)
+                batch = []
+        if batch:
+            failed += process(offset, batch)
+
+        summary['failed'] = failed
+        if errors:
+            summary['errors'] = errors
+        code = status.HTTP_201_CREATED if not failed else status.HTTP_400_BAD_REQUEST
+        return Response(summary, status=code)
 
     def _get_bulk_payload_json(self, request):
         plural_name = self.get_serializer_class().get_plural_name()
@@ -1157,17 +2255,180 @@ class DynamicModelViewSet(WithDynamicViewSetMixin, viewsets.ModelViewSet):
             return request.data[plural_name]
         return None
 
+    def _enqueue_bulk(self, request, data):
+        """Run a bulk request as a background job, if the client prefers.
+
+        Requests with `Prefer: respond-async` and at least `JOB_MIN_ROWS`
+        rows are queued once the current transaction commits.
+
+        Returns:
+            A 202 response describing the job, or None if the request
+            should run right away.
+        """
+        if (
+            'respond-async' not in parse_prefer(request)
+            or self._is_csv_upload(request)
+            or len(data) < settings.JOB_MIN_ROWS
+        ):
+            return None
+        job = create_job(self, request, data)
+        transaction.on_commit(lambda: get_job_executor().submit(job['id']))
+        data = get_job_data(job)
+        headers = {'Location': data['url']} if data['url'] else None
+        return Response(
+            {'job': data}, status=status.HTTP_202_ACCEPTED, headers=headers
+        )
+
+    def _get_preferred_response(
+        self, pks, code, many=False, errors=None, headers=None
+    ):
+        """Respond to a write with `Prefer: return=minimal` or `return=ids`.
+
+        Arguments:
+            pks: the primary keys of the written instances
+
+        Returns:
+            A response without the representation of the instances,
+            or None if it was not requested.
+        """
+        preference = self.get_return_preference()
+        if preference == 'minimal':
+            data = None
+        elif preference == 'ids':
+            data = {'ids': list(pks)} if many else {'id': pks[0]}
+        else:
+            return None
+        if errors:
+            data = data or {}
+            data['errors'] = errors
+        response = Response(data, status=code, headers=headers)
+        response['Preference-Applied'] = 'return=%s' % preference
+        return response
+
+    def get_bulk_serializer_context(self):
+        """Get a serializer context shared by the rows of a bulk request.
+
+        Related objects are looked up once for the whole request
+        through its `RelationResolver`.
+        """
+        context = self.get_serializer_context()
+        context['relation_resolver'] = RelationResolver()
+        return context
+
     def _bulk_update(self, data, partial=False):
+        context = self.get_bulk_serializer_context()
         # Restrict the update to the filtered queryset.
         serializer = self.get_serializer(
             self.filter_queryset(self.get_queryset()),
             data=data,
             many=True,
             partial=partial,
+            context=context
+        )
+        context['relation_resolver'].collect(serializer.child, data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return self._get_preferred_response(
+            [instance.pk for instance in serializer.instance],
+            status.HTTP_200_OK,
+            many=True
+        ) or Response(serializer.data, status=status.HTTP_200_OK)
+
+    def _update_one(self, request, partial=False):
+        """Update an instance, without serializing it in the response."""
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance, data=request.data, partial=partial
         )
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self._get_preferred_response(
+            [serializer.instance.pk], status.HTTP_200_OK
+        )
+
+    def _get_column_values(self, serializer):
+        """Get the column assignments of a validated set-based update.
+
+        Returns:
+            A dict of model field names and values, or None if the update
+            has to go through the serializer: when it overrides `update`,
+            has setters, nested or many-relation values, or unique fields,
+            or when the request has to be set on instances or the model
+            overrides `save`.
+        """
+        model = serializer.get_model()
+        if (
+            model is None
+            or type(serializer).update is not WithDynamicSerializerMixin.update
+            or type(self).perform_update is not viewsets.ModelViewSet.perform_update
+            or self.SET_REQUEST_ON_SAVE
+            or serializer.SET_REQUEST_ON_SAVE
+            or getattr(serializer, '_post_save', None)
+            or model.save is not models.Model.save
+        ):
+            return None
+        values = {}
+        for attr, value in serializer.validated_data.items():
+            try:
+                field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                return None
+            if (
+                not field.concrete
+                or field.many_to_many
+                or field.primary_key
+                or field.unique
+                or isinstance(value, dict)
+            ):
+                return None
+            values[field.name] = value
+        if not values:
+            return None
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) and field.name not in values:
+                values[field.name] = field.pre_save(model(), False)
+        return values
+
+    def _update_filtered(self, data, partial=False):
+        """Apply the same changes to every instance in the filtered queryset.
+
+        The payload is validated once. Plain column assignments are
+        written with a single `QuerySet.update`, which responds with the
+        number of updated instances, or as preferred with
+        `Prefer: return=minimal` or `return=ids`; other changes go
+        through the serializer, one instance at a time.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer(data=data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        values = self._get_column_values(serializer)
+        if values is None:
+            lookup_attr = getattr(serializer.Meta, 'update_lookup_field', 'id')
+            rows = [
+                dict(data, **{lookup_attr: key})
+                for key in queryset.order_by().values_list(
+                    lookup_attr, flat=True
+                ).distinct()
+            ]
+            if not rows:
+                return Response({'updated': 0}, status=status.HTTP_200_OK)
+            return self._bulk_update(rows, partial)
+
+        model = queryset.model
+        preference = self.get_return_preference()
+        pks = None
+        with transaction.atomic():
+            if preference == 'ids':
+                pks = list(
+                    queryset.order_by().values_list('pk', flat=True).distinct()
+                )
+                queryset = model._default_manager.filter(pk__in=pks)
+            updated = queryset.update(**values)
+            # QuerySet.update sends no signals
+            invalidate_model(model, pks)
+        return self._get_preferred_response(
+            pks, status.HTTP_200_OK, many=True
+        ) or Response({'updated': updated}, status=status.HTTP_200_OK)
 
     def update(self, request, *args, **kwargs):
         """Either update  a single or many model instances. Use list to
@@ -1193,48 +2454,311 @@ class DynamicModelViewSet(WithDynamicViewSetMixin, viewsets.ModelViewSet):
         [
             {'id': 3, 'fur': 'gold'}
         ]
+
+        A filtered request with a single object updates every instance
+        that matches the filters, and responds with their number:
+
+        PATCH /dogs/?filter{fur.contains}=brown
+        {
+            'fur': 'gold'
+        }
+
+        {
+            'updated': 2
+        }
+
+        With `Prefer: return=minimal`, the response has no content;
+        with `Prefer: return=ids`, it only has the ids of the updated
+        instances, e.g. {"ids": [1, 2]}.
         """
         if self.ENABLE_BULK_UPDATE:
             partial = 'partial' in kwargs
             bulk_payload = self._get_bulk_payload(request)
             if bulk_payload:
-                return self._bulk_update(bulk_payload, partial)
+                return (
+                    self._enqueue_bulk(request, bulk_payload)
+                    or self._bulk_update(bulk_payload, partial)
+                )
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            if (
+                lookup_url_kwarg not in kwargs
+                and isinstance(request.data, dict)
+                and self.get_request_feature(self.FILTER)
+            ):
+                return self._update_filtered(request.data, partial)
+        if self.get_return_preference() in ('minimal', 'ids'):
+            return self._update_one(request, kwargs.get('partial', False))
         return super(DynamicModelViewSet, self).update(request, *args, **kwargs)
 
-    def _create_many(self, data):
-        items = []
+    def _create_rows(self, data, context):
+        """Validate and create rows.
+
+        Returns:
+            A tuple of (created, errors): the serializers of the created
+            instances, and a list of (index, error) tuples in row order.
+        """
         errors = []
-        result = {}
         serializers = []
+        # filtered create access is checked once per batch, not per instance
+        checks = CreateChecks()
 
-        for entry in data:
-            serializer = self.get_serializer(data=entry)
+        # unique constraints are checked for all rows at once
+        uniqueness = BulkUniqueness()
+
+        for index, entry in enumerate(data):
+            serializer = self.get_serializer(data=entry, context=context)
+            serializer.create_checks = checks
+            uniqueness.prepare(serializer)
             try:
                 serializer.is_valid(raise_exception=True)
             except exceptions.ValidationError as e:
-                errors.append({'detail': e.detail, 'source': entry})
+                errors.append((index, {'detail': e.detail, 'source': entry}))
+            else:
+                serializers.append((index, serializer))
+
+        unique_errors = uniqueness.validate(
+            [(serializer.validated_data, None) for _, serializer in serializers]
+        )
+        valid = []
+        for (index, serializer), detail in zip(serializers, unique_errors):
+            if detail:
+                errors.append(
+                    (index, {'detail': detail, 'source': data[index]})
+                )
             else:
-                if self.ENABLE_BULK_PARTIAL_CREATION:
+                valid.append(serializer)
+        errors.sort(key=op.itemgetter(0))
+
+        created = []
+        with transaction.atomic():
+            if self.ENABLE_BULK_PARTIAL_CREATION or not errors:
+                for serializer in valid:
                     self.perform_create(serializer)
-                    items.append(serializer.to_representation(serializer.instance))
-                else:
-                    serializers.append(serializer)
-        if not self.ENABLE_BULK_PARTIAL_CREATION and not errors:
-            for serializer in serializers:
-                self.perform_create(serializer)
-                items.append(serializer.to_representation(serializer.instance))
+                    created.append(serializer)
+            checks.verify()
+        return created, errors
+
+    def _create_many(self, data):
+        context = self.get_bulk_serializer_context()
+        result_serializer = self.get_serializer(context=context)
+        context['relation_resolver'].collect(result_serializer, data)
+
+        created, errors = self._create_rows(data, context)
+        code = status.HTTP_201_CREATED if not errors else status.HTTP_400_BAD_REQUEST
+        response = self._get_preferred_response(
+            [serializer.instance.pk for serializer in created],
+            code,
+            many=True,
+            errors=[error for _, error in errors]
+        )
+        if response:
+            return response
+
+        items = [
+            serializer.to_representation(serializer.instance)
+            for serializer in created
+        ]
 
         # Populate serialized data to the result.
-        result = SideloadingProcessor(self.get_serializer(), items).data
+        result = SideloadingProcessor(result_serializer, items).data
 
         # Include errors if any.
         if errors:
-            result['errors'] = errors
-
-        code = status.HTTP_201_CREATED if not errors else status.HTTP_400_BAD_REQUEST
+            result['errors'] = [error for _, error in errors]
 
         return Response(result, status=code)
 
+    def get_upsert_fields(self):
+        """Get the fields that identify existing rows on a bulk create.
+
+        Set by the `upsert` query parameter (comma-separated field names)
+        or the serializer's `Meta.upsert_fields`. The fields must have a
+        unique constraint on the model.
+
+        Returns:
+            A list of serializer field names, or None.
+        """
+        upsert = self.request.query_params.get('upsert')
+        if upsert:
+            names = [name.strip() for name in upsert.split(',') if name.strip()]
+        else:
+            meta = self.get_serializer_class().get_meta()
+            names = list(getattr(meta, 'upsert_fields', None) or [])
+        return names or None
+
+    def _get_upsert_sources(self, serializer, names):
+        sources = []
+        for name in names:
+            field = serializer.fields.get(name)
+            if field is None or field.read_only:
+                raise exceptions.ValidationError(
+                    'upsert: "%s" is not a writable field' % name
+                )
+            sources.append(field.source)
+        if not is_unique(serializer.get_model(), sources):
+            raise exceptions.ValidationError(
+                'upsert: %s must have a unique constraint' % ', '.join(names)
+            )
+        return sources
+
+    def _check_upsert_permissions(self, model, existing):
+        """Check access to update `existing` pks; return create access."""
+        permissions = self.permissions
+        if not permissions:
+            return None
+        if existing:
+            access = permissions.update
+            if access.no_access:
+                raise exceptions.PermissionDenied()
+            if not access.full_access:
+                pks = list(existing)
+                for i in range(0, len(pks), CreateChecks.BATCH_SIZE):
+                    batch = pks[i:i + CreateChecks.BATCH_SIZE]
+                    if model._default_manager.filter(access.filters).filter(
+                        pk__in=batch
+                    ).count() != len(batch):
+                        raise exceptions.PermissionDenied()
+        access = permissions.create
+        if access.no_access:
+            raise exceptions.PermissionDenied()
+        return access
+
+    def _upsert_rows(self, data, names, sources, context):
+        """Validate and create or update rows with `bulk_create`.
+
+        Rows whose `names` match a saved row update it, other rows are
+        inserted, in batches of `BULK_BATCH_SIZE`. Like `QuerySet.update`,
+        this skips `save`, model signals and serializer `create` hooks;
+        `auto_now` fields are still set, and cached data is invalidated.
+
+        Returns:
+            A tuple of (result, errors): the created and updated counts
+            (and ids, if known), and a list of (index, error) tuples
+            in row order.
+        """
+        errors = []
+        model = self.get_serializer_class().get_model()
+
+        uniqueness = BulkUniqueness()
+        rows = []
+        for index, entry in enumerate(data):
+            row_serializer = self.get_serializer(data=entry, context=context)
+            uniqueness.prepare(row_serializer)
+            try:
+                row_serializer.is_valid(raise_exception=True)
+            except exceptions.ValidationError as e:
+                errors.append((index, {'detail': e.detail, 'source': entry}))
+                continue
+            attrs = row_serializer.validated_data
+            missing = [
+                name for name, source in zip(names, sources)
+                if source not in attrs
+            ]
+            many = [
+                source for source in attrs
+                if not is_model_field(model, source)
+                or get_model_field(model, source).many_to_many
+                or get_model_field(model, source).one_to_many
+            ]
+            if missing or many:
+                detail = {name: ['This field is required.'] for name in missing}
+                detail.update({
+                    source: ['Cannot be set by an upsert.'] for source in many
+                })
+                errors.append((index, {'detail': detail, 'source': entry}))
+                continue
+            rows.append((index, attrs))
+
+        existing = {
+            key: pk for pk, key in find_existing(
+                model._default_manager.all(),
+                sources,
+                {get_key(attrs, sources) for _, attrs in rows},
+                settings.BULK_BATCH_SIZE
+            )
+        }
+        keys = [get_key(attrs, sources) for _, attrs in rows]
+        unique_errors = uniqueness.validate(
+            [(attrs, existing.get(key)) for (_, attrs), key in zip(rows, keys)]
+        )
+        valid = []
+        for (index, attrs), key, detail in zip(rows, keys, unique_errors):
+            if detail:
+                errors.append(
+                    (index, {'detail': detail, 'source': data[index]})
+                )
+            else:
+                valid.append((attrs, key))
+        errors.sort(key=op.itemgetter(0))
+
+        result = {'created': 0, 'updated': 0}
+        if valid and (self.ENABLE_BULK_PARTIAL_CREATION or not errors):
+            updated = {existing[key] for _, key in valid if key in existing}
+            create_access = self._check_upsert_permissions(model, updated)
+            checks = CreateChecks()
+            objs = [model(**attrs) for attrs, _ in valid]
+            with transaction.atomic():
+                # rows are written together with the rows that set
+                # the same fields, so that others are left unchanged
+                batches = {}
+                for obj, (attrs, _) in zip(objs, valid):
+                    batches.setdefault(frozenset(attrs), []).append(obj)
+                for fields, batch in batches.items():
+                    update_fields = [
+                        get_model_field(model, source).name
+                        for source in fields if source not in sources
+                    ]
+                    if update_fields:
+                        update_fields.extend(
+                            field.name for field in model._meta.concrete_fields
+                            if getattr(field, 'auto_now', False)
+                            and field.name not in update_fields
+                        )
+                        model._default_manager.bulk_create(
+                            batch,
+                            batch_size=settings.BULK_BATCH_SIZE,
+                            update_conflicts=True,
+                            unique_fields=sources,
+                            update_fields=update_fields
+                        )
+                    else:
+                        model._default_manager.bulk_create(
+                            batch,
+                            batch_size=settings.BULK_BATCH_SIZE,
+                            ignore_conflicts=True
+                        )
+                if create_access is not None and not create_access.full_access:
+                    for obj, (_, key) in zip(objs, valid):
+                        if key in existing:
+                            continue
+                        if obj.pk is None:
+                            # the database did not return the new pks
+                            raise exceptions.PermissionDenied()
+                        checks.add(model, create_access.filters, obj.pk)
+                    checks.verify()
+                invalidate_model(model, updated)
+            result['updated'] = sum(1 for _, key in valid if key in existing)
+            result['created'] = len(valid) - result['updated']
+            pks = [
+                obj.pk if obj.pk is not None else existing.get(key)
+                for obj, (_, key) in zip(objs, valid)
+            ]
+            if all(pk is not None for pk in pks):
+                result['ids'] = pks
+        return result, errors
+
+    def _upsert_many(self, data, names):
+        context = self.get_bulk_serializer_context()
+        serializer = self.get_serializer(context=context)
+        sources = self._get_upsert_sources(serializer, names)
+        context['relation_resolver'].collect(serializer, data)
+
+        result, errors = self._upsert_rows(data, names, sources, context)
+        if errors:
+            result['errors'] = [error for _, error in errors]
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_200_OK)
+
     def create(self, request, *args, **kwargs):
         """
         Either create a single or many model instances in bulk
@@ -1272,10 +2796,24 @@ class DynamicModelViewSet(WithDynamicViewSetMixin, viewsets.ModelViewSet):
             {"name": "Fido", "age": 2},
             {"name": "Lucky", "age": 3}
         ]
+
+        With `Prefer: return=minimal`, the response has no content;
+        with `Prefer: return=ids`, it only has the ids of the created
+        instances, e.g. {"id": 1} or {"ids": [1, 2]}.
         """
+        if self._is_csv_upload(request):
+            return self._import_csv(request)
         bulk_payload = self._get_bulk_payload(request)
         if bulk_payload:
+            job = self._enqueue_bulk(request, bulk_payload)
+            if job:
+                return job
+            upsert_fields = self.get_upsert_fields()
+            if upsert_fields:
+                return self._upsert_many(bulk_payload, upsert_fields)
             return self._create_many(bulk_payload)
+        if self.get_return_preference() in ('minimal', 'ids'):
+            return self._create_one(request)
         response = super(DynamicModelViewSet, self).create(request, *args, **kwargs)
         serializer = getattr(response.data, 'serializer')
         if serializer and serializer.instance:
@@ -1283,14 +2821,67 @@ class DynamicModelViewSet(WithDynamicViewSetMixin, viewsets.ModelViewSet):
             response['Location'] = url
         return response
 
+    def _create_one(self, request):
+        """Create an instance, without serializing it in the response."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        instance = serializer.instance
+        return self._get_preferred_response(
+            [instance.pk],
+            status.HTTP_201_CREATED,
+            headers={'Location': serializer.get_url(pk=instance.pk)}
+        )
+
+    def _can_fast_destroy(self, model):
+        """Whether bulk deletes can skip loading each instance.
+
+        True unless `perform_destroy` or the model's `delete` is overridden,
+        the request has to be set on instances, or a permission class checks
+        object permissions.
+        """
+        return (
+            type(self).perform_destroy is DynamicModelViewSet.perform_destroy
+            and model.delete is models.Model.delete
+            and not self.SET_REQUEST_ON_SAVE
+            and all(
+                type(permission).has_object_permission
+                is BasePermission.has_object_permission
+                for permission in self.get_permissions()
+            )
+        )
+
     def _destroy_many(self, data):
-        instances = (
-            self.get_queryset().filter(id__in=[d['id'] for d in data]).distinct()
+        ids = [d['id'] for d in data]
+        deleted = set()
+        queryset = self.get_queryset()
+        if self._can_fast_destroy(queryset.model):
+            # the queryset is already restricted to deletable instances
+            pks = list(
+                queryset.filter(pk__in=ids)
+                .order_by()
+                .values_list('pk', flat=True)
+                .distinct()
+            )
+            if pks:
+                queryset.model._default_manager.filter(pk__in=pks).delete()
+            deleted.update(str(pk) for pk in pks)
+        else:
+            for instance in queryset.filter(id__in=ids).distinct():
+                try:
+                    self.check_object_permissions(self.request, instance)
+                except exceptions.PermissionDenied:
+                    continue
+                self.perform_destroy(instance)
+                deleted.add(str(instance.pk))
+
+        rejected = [i for i in ids if str(i) not in deleted]
+        if not rejected:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(
+            {'deleted': len(deleted), 'rejected': rejected},
+            status=status.HTTP_200_OK
         )
-        for instance in instances:
-            self.check_object_permissions(self.request, instance)
-            self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def destroy(self, request, *args, **kwargs):
         """
@@ -1309,10 +2900,21 @@ class DynamicModelViewSet(WithDynamicViewSetMixin, viewsets.ModelViewSet):
             {"id": 1},
             {"id": 2}
         ]
+
+        Bulk deletes respond with 204 if every instance was deleted,
+        or with the ids that were not, e.g.:
+
+        {
+            "deleted": 1,
+            "rejected": [2]
+        }
         """
         bulk_payload = self._get_bulk_payload(request)
         if bulk_payload:
-            return self._destroy_many(bulk_payload)
+            return (
+                self._enqueue_bulk(request, bulk_payload)
+                or self._destroy_many(bulk_payload)
+            )
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
         if lookup_url_kwarg not in kwargs:
             # assume that it is a poorly formatted bulk request
@@ -1328,3 +2930,152 @@ class DynamicModelViewSet(WithDynamicViewSetMixin, viewsets.ModelViewSet):
             )
             setattr(instance, attr, self.request)
         instance.delete()
+
+
+class AsyncDynamicModelViewSet(DynamicModelViewSet):
+    """A DynamicModelViewSet that runs under ASGI.
+
+    List and detail requests build the same querysets as
+    `DynamicModelViewSet`, but evaluate them with the async ORM
+    and serialize them in a thread, so that a worker is not blocked
+    while waiting on the database. Other actions, as well as
+    combine, conditional and coalesced requests, run in a thread.
+    """
+
+    filter_backends = (AsyncDynamicFilterBackend, DynamicSortingFilter)
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super(AsyncDynamicModelViewSet, cls).as_view(actions, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        update_wrapper(async_view, view)
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Dispatch a request, awaiting async handlers.
+
+        Mirrors `APIView.dispatch`; authentication, permission and
+        throttling checks, as well as sync handlers, run in a thread.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def _is_sync_only(self):
+        return bool(
+            self.get_request_feature(self.COMBINE)
+            or self.ENABLE_REQUEST_COALESCING
+            or self.get_updated_field()
+        )
+
+    async def afilter_queryset(self, queryset):
+        for backend in list(self.filter_backends):
+            backend = backend()
+            if hasattr(backend, 'afilter_queryset'):
+                queryset = await backend.afilter_queryset(
+                    self.request, queryset, self
+                )
+            else:
+                queryset = backend.filter_queryset(self.request, queryset, self)
+        return queryset
+
+    async def aevaluate(self, queryset):
+        for backend in self.filter_backends:
+            if hasattr(backend, 'aevaluate'):
+                return await backend().aevaluate(queryset)
+        return await sync_to_async(list)(queryset)
+
+    async def apaginate_queryset(self, queryset):
+        if self.PAGE not in self.features or self.paginator is None:
+            return None
+        if (
+            self.PER_PAGE not in self.features
+            and self.PER_PAGE in self.request.query_params
+        ):
+            # remove per_page if it is disabled
+            self.request.query_params[self.PER_PAGE] = None
+        if not hasattr(self.paginator, 'apaginate_queryset'):
+            return await sync_to_async(self.paginator.paginate_queryset)(
+                queryset, self.request, view=self
+            )
+        return await self.paginator.apaginate_queryset(
+            queryset, self.request, self.aevaluate, view=self
+        )
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        assert lookup_url_kwarg in self.kwargs, (
+            'Expected view %s to be called with a URL keyword argument '
+            'named "%s".' % (self.__class__.__name__, lookup_url_kwarg)
+        )
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        instances = await self.aevaluate(queryset.filter(**filter_kwargs)[:2])
+        if not instances:
+            raise Http404(
+                'No %s matches the given query.' % queryset.model._meta.object_name
+            )
+        if len(instances) > 1:
+            raise queryset.model.MultipleObjectsReturned()
+
+        obj = instances[0]
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def aserialize(self, *args, **kwargs):
+        serializer = self.get_serializer(*args, **kwargs)
+        return await sync_to_async(lambda: serializer.data)()
+
+    async def list(self, request, **kwargs):
+        if self._is_sync_only():
+            return await sync_to_async(
+                super(AsyncDynamicModelViewSet, self).list
+            )(request, **kwargs)
+
+        permissions = self.permissions
+        if permissions and not permissions.list:
+            raise exceptions.PermissionDenied()
+
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            data = await self.aserialize(page, many=True)
+            return self.get_paginated_response(data)
+
+        data = await self.aserialize(await self.aevaluate(queryset), many=True)
+        return Response(data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        if self._is_sync_only():
+            return await sync_to_async(
+                super(AsyncDynamicModelViewSet, self).retrieve
+            )(request, *args, **kwargs)
+
+        instance = await self.aget_object()
+        return Response(await self.aserialize(instance))
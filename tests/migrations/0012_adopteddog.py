@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0011_user_data_alter_user_is_dead'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdoptedDog',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('tests.dog',),
+        ),
+    ]
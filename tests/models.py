@@ -73,6 +73,17 @@ class Dog(models.Model):
     created = models.DateTimeField(auto_now_add=True)
 
 
+class AdoptedDog(Dog):
+    """A dog that is marked as adopted instead of being deleted."""
+
+    class Meta:
+        proxy = True
+
+    def delete(self, *args, **kwargs):
+        self.origin = 'adopted'
+        self.save()
+
+
 class Horse(models.Model):
     name = models.TextField()
     origin = models.TextField()
@@ -15,6 +15,7 @@ from dynamic_rest.serializers import (
 )
 from django.contrib.auth import models as auth
 from django.db.models import Q
+from dynamic_rest.permissions import Me
 from tests.models import (
     Car,
     Cat,
@@ -243,6 +244,18 @@ class UserSerializer(DynamicModelSerializer):
         return len(location.cat_set.all()) if location else 0
 
 
+class PermissionsGroupSerializer(DynamicModelSerializer):
+    class Meta:
+        model = auth.Group
+        name = 'group'
+        fields = ('id', 'name')
+        permissions = {
+            '*': {
+                'read': {'user': Me}
+            }
+        }
+
+
 class PermissionsUserSerializer(
     DynamicModelSerializer
 ):
@@ -255,7 +268,8 @@ class PermissionsUserSerializer(
             'first_name',
             'last_name',
             'username',
-            'is_superuser'
+            'is_superuser',
+            'groups'
         )
         hidden_fields = (
             'is_superuser',
@@ -280,6 +294,9 @@ class PermissionsUserSerializer(
                 'list': True,
                 'update': lambda u: Q(pk=u.pk),
             },
+            'is_staff': {
+                'create': {'last_name': 'staff'},
+            },
             'is_superuser': {
                 'fields': {
                     'is_superuser': {
@@ -293,6 +310,12 @@ class PermissionsUserSerializer(
             },
         }
 
+    groups = DynamicRelationField(
+        'PermissionsGroupSerializer',
+        many=True,
+        deferred=True
+    )
+
 
 class ProfileSerializer(DynamicModelSerializer):
 
@@ -350,6 +373,31 @@ class UserLocationSerializer(UserSerializer):
     groups = DynamicRelationField('GroupSerializer', many=True, embed=True)
 
 
+class CachedLocationSerializer(LocationSerializer):
+    """ Serializer to test sideload caching """
+    class Meta(LocationSerializer.Meta):
+        sideload_cache = {'ttl': 60}
+
+
+class CachedLocationUserSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        pass
+
+    location = DynamicRelationField('CachedLocationSerializer')
+
+
+# serializers of non-canonical views of users, so that these
+# views do not take over the URL of UserSerializer
+class AsyncUserSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        pass
+
+
+class RollupUserSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        pass
+
+
 class DogSerializer(DynamicModelSerializer):
 
     class Meta:
@@ -361,6 +409,11 @@ class DogSerializer(DynamicModelSerializer):
     fur = CharField(source='fur_color')
 
 
+class ConditionalDogSerializer(DogSerializer):
+    class Meta(DogSerializer.Meta):
+        pass
+
+
 class HorseSerializer(DynamicModelSerializer):
 
     class Meta:
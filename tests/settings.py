@@ -53,6 +53,9 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
         'dynamic_rest.renderers.DynamicAdminRenderer',
+        'dynamic_rest.renderers.DynamicCSVRenderer',
+        'dynamic_rest.renderers.DynamicNDJSONRenderer',
+        'dynamic_rest.renderers.DynamicColumnarRenderer',
     ),
 }
 
@@ -6,9 +6,13 @@ from urllib.parse import quote
 from django.test import override_settings
 from rest_framework.test import APITestCase
 
-from tests.models import Cat, Group, Location, Permission, Profile, User, Car, Country
+from tests.models import (
+    Cat, Dog, Group, Location, Permission, Profile, User, Car, Country
+)
+from dynamic_rest.cache import ResultCache, SideloadCache
 from tests.serializers import NestedEphemeralSerializer, PermissionSerializer
 from tests.setup import create_fixture
+from tests.viewsets import ConditionalDogViewSet, UserViewSet
 
 UNICODE_STRING = chr(9629)  # unicode heart
 # UNICODE_URL_STRING = urllib.quote(UNICODE_STRING.encode('utf-8'))
@@ -817,6 +821,86 @@ class TestUsersAPI(APITestCase):
                     ),
                 )
 
+    def test_get_csv(self):
+        with self.assertNumQueries(3):
+            # 1 for User, 1 for Group, 1 for Location
+            response = self.client.get(
+                "/users/?format=csv&include[]=location.*&include[]=groups"
+                "&filter{id.lt}=3"
+            )
+            content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('attachment; filename="users.csv"', response["Content-Disposition"])
+        self.assertEquals(
+            [
+                "id,name,groups,location.id,location.name",
+                '1,0,"[1, 2]",1,0',
+                '2,1,"[1, 2]",1,0',
+            ],
+            content.splitlines(),
+        )
+
+    def test_get_csv_columns_from_serializer(self):
+        # the first user has no location, so its row has no location columns
+        User.objects.filter(id=1).update(location=None)
+        response = self.client.get(
+            "/users/?format=csv&include[]=location.*&filter{id.lt}=3"
+        )
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEquals(200, response.status_code)
+        self.assertEquals(
+            [
+                "id,name,location.id,location.name",
+                "1,0,,",
+                "2,1,1,0",
+            ],
+            content.splitlines(),
+        )
+
+    @override_settings(DYNAMIC_REST={"ENABLE_LINKS": False, "STREAMING_CHUNK_SIZE": 2})
+    def test_get_ndjson(self):
+        with self.assertNumQueries(3):
+            # 1 for User, 1 for Location per chunk of 2 users
+            response = self.client.get("/users/?format=ndjson&include[]=location.")
+            content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEquals(200, response.status_code)
+        self.assertEquals(
+            [
+                {"id": 1, "location": {"id": 1, "name": "0"}, "name": "0"},
+                {"id": 2, "location": {"id": 1, "name": "0"}, "name": "1"},
+                {"id": 3, "location": {"id": 2, "name": "1"}, "name": "2"},
+                {"id": 4, "location": {"id": 3, "name": "2"}, "name": "3"},
+            ],
+            [json.loads(line) for line in content.splitlines()],
+        )
+
+    def test_get_columnar(self):
+        User.objects.filter(id__gt=1).update(name="x")
+        data = self._get_json("/users/?format=columnar&include[]=location.*")
+        self.assertEquals(
+            {
+                "locations": {
+                    "schema": [{"name": "id"}, {"name": "name"}],
+                    "columns": [[1, 2, 3], ["0", "1", "2"]],
+                },
+                "users": {
+                    "schema": [
+                        {"name": "id"},
+                        {"name": "name", "dictionary": ["0", "x"]},
+                        {"name": "location"},
+                    ],
+                    "columns": [[1, 2, 3, 4], [0, 1, 1, 1], [1, 1, 2, 3]],
+                },
+            },
+            data,
+        )
+
+        data = self._get_json("/users/?format=columnar&combine=count(id) as c&combine.by=location")
+        self.assertEquals(
+            {"schema": [{"name": "location"}, {"name": "c"}], "columns": [[1, 2, 3], [2, 1, 1]]},
+            data["data"],
+        )
+
 
 @override_settings(DYNAMIC_REST={"ENABLE_LINKS": False})
 class TestLocationsAPI(APITestCase):
@@ -1091,6 +1175,126 @@ class TestUserLocationsAPI(APITestCase):
         self.assertFalse(isinstance(location, dict))
 
 
+@override_settings(DYNAMIC_REST={"ENABLE_LINKS": False})
+class TestAsyncUsersAPI(APITestCase):
+    """
+    Test API on an async viewset.
+    """
+
+    def setUp(self):
+        self.fixture = create_fixture()
+
+    def test_get_list(self):
+        url = "/async_users/?include[]=groups.&include[]=location."
+        with self.assertNumQueries(4):
+            # 4 queries: 1 for count, 1 for User, 1 for Group, 1 for Location
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(4, len(content["users"]))
+        self.assertEqual(2, len(content["groups"]))
+        self.assertEqual(3, len(content["locations"]))
+        self.assertEqual(
+            [[1, 2]] * 4, [user["groups"] for user in content["users"]]
+        )
+
+    def test_get_list_paginated(self):
+        response = self.client.get("/async_users/?per_page=2&page=2&sort[]=-id")
+        self.assertEqual(200, response.status_code)
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEqual([2, 1], [user["id"] for user in content["users"]])
+        self.assertEqual(
+            {"page": 2, "per_page": 2, "total_results": 4, "total_pages": 2},
+            content["meta"],
+        )
+
+        response = self.client.get("/async_users/?per_page=2&page=3")
+        self.assertEqual(404, response.status_code)
+
+        response = self.client.get(
+            "/async_users/?per_page=3&page=last&sort[]=id"
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEqual([4], [user["id"] for user in content["users"]])
+        self.assertEqual(2, content["meta"]["page"])
+
+    def test_get_detail(self):
+        with self.assertNumQueries(2):
+            # 2 queries: 1 for User, 1 for Location
+            response = self.client.get("/async_users/1/?include[]=location.")
+        self.assertEqual(200, response.status_code)
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEqual("0", content["user"]["name"])
+        self.assertEqual("0", content["locations"][0]["name"])
+
+        response = self.client.get("/async_users/100/")
+        self.assertEqual(404, response.status_code)
+
+    def test_create(self):
+        response = self.client.post(
+            "/async_users/",
+            json.dumps({"name": "test", "last_name": "last"}),
+            content_type="application/json",
+        )
+        self.assertEqual(201, response.status_code)
+        self.assertTrue(User.objects.filter(name="test").exists())
+
+
+@override_settings(DYNAMIC_REST={"ENABLE_LINKS": False})
+class TestSideloadCacheAPI(APITestCase):
+    """
+    Test API on serializer with a cached sideload.
+    """
+
+    def setUp(self):
+        SideloadCache.clear_all()
+        self.fixture = create_fixture()
+
+    def tearDown(self):
+        SideloadCache.clear_all()
+
+    def test_get_cached_sideload(self):
+        url = "/cached_users/?include[]=location.&exclude[]=groups"
+        with self.assertNumQueries(3):
+            # 3 queries: 1 for count, 1 for User, 1 for Location
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        expected = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(3, len(expected["locations"]))
+
+        with self.assertNumQueries(2):
+            # 2 queries: 1 for count, 1 for User, Location is cached
+            response = self.client.get(url)
+        self.assertEqual(expected, json.loads(response.content.decode("utf-8")))
+
+    def test_get_cached_sideload_invalidated_on_save(self):
+        url = "/cached_users/?include[]=location.&exclude[]=groups"
+        self.client.get(url)
+
+        location = Location.objects.get(pk=1)
+        location.name = "updated"
+        location.save()
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        content = json.loads(response.content.decode("utf-8"))
+        names = {loc["id"]: loc["name"] for loc in content["locations"]}
+        self.assertEqual("updated", names[1])
+
+    def test_get_filtered_sideload_not_cached(self):
+        url = (
+            "/cached_users/?include[]=location.&exclude[]=groups"
+            "&filter{location|name}=0"
+        )
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(["0"], [loc["name"] for loc in content["locations"]])
+
+
 class TestLinks(APITestCase):
     def setUp(self):
         self.fixture = create_fixture()
@@ -1174,6 +1378,14 @@ class TestLinks(APITestCase):
         self.assertTrue("locations" in content)  # check for sideload
         self.assertFalse("foobar" in cat["links"])  # no link
 
+    def test_canonical_links(self):
+        # other views of the same models keep their canonical URLs
+        for url, name in (("/users/1/", "user"), ("/dogs/1/", "dog")):
+            r = self.client.get(url)
+            self.assertEqual(200, r.status_code, r.content)
+            content = json.loads(r.content.decode("utf-8"))
+            self.assertEqual(url, content[name]["links"]["self"])
+
     def test_one_to_one_dne(self):
         user = User.objects.create(name="foo", last_name="bar")
 
@@ -1468,6 +1680,79 @@ class TestDogsAPI(APITestCase):
         self.assertEquals(400, response.status_code)
 
 
+class TestConditionalAPI(APITestCase):
+    """
+    Tests for conditional GET
+    """
+
+    def setUp(self):
+        self.fixture = create_fixture()
+
+    def test_get_list_not_modified(self):
+        url = "/conditional_dogs/?sort[]=name"
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        etag = response["ETag"]
+        # deleted rows would not change it
+        self.assertFalse(response.has_header("Last-Modified"))
+
+        # 1 query: the aggregate, no count, no dogs
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response["ETag"])
+
+        # different query parameters produce a different validator
+        response = self.client.get(
+            "/conditional_dogs/?sort[]=-name", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_get_list_modified(self):
+        url = "/conditional_dogs/"
+        etag = self.client.get(url)["ETag"]
+        Dog.objects.filter(pk=1).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_get_detail_not_modified(self):
+        response = self.client.get("/conditional_dogs/1/")
+        self.assertEqual(200, response.status_code)
+
+        response = self.client.get(
+            "/conditional_dogs/1/",
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(304, response.status_code)
+
+    def test_get_detail_not_found(self):
+        response = self.client.get("/conditional_dogs/100/")
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_get_coalesced(self):
+        url = "/conditional_dogs/?sort[]=name"
+        expected = self.client.get(url)
+        with self.settings(
+            DYNAMIC_REST={"REQUEST_COALESCING_BACKEND": "default"}
+        ):
+            ConditionalDogViewSet.ENABLE_REQUEST_COALESCING = True
+            try:
+                response = self.client.get(url)
+                not_found = self.client.get("/conditional_dogs/100/")
+            finally:
+                del ConditionalDogViewSet.ENABLE_REQUEST_COALESCING
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(dict(expected.items()), dict(response.items()))
+        self.assertEqual(
+            json.loads(expected.content.decode("utf-8")),
+            json.loads(response.content.decode("utf-8")),
+        )
+        self.assertEqual(404, not_found.status_code)
+
+
 class TestHorsesAPI(APITestCase):
     """
     Tests for sorting on default fields and limit sorting fields
@@ -1724,6 +2009,17 @@ class TestCatsAPI(APITestCase):
             data["data"]["count(name)"],
             [["2019-12-30", 1], ["2020-01-06", 1], ["2020-02-03", 1]],
         )
+        # auto bounds are computed in a single query
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                "/users?combine=count(name)&combine.over="
+                "auto(date_of_birth) as a,auto(date_of_birth) as b"
+            )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            data["data"]["count(name)"][0], ["2019-12-30", "2019-12-30", 1]
+        )
 
         # over with by
         response = self.client.get(
@@ -1842,6 +2138,231 @@ class TestCatsAPI(APITestCase):
             data["data"],
         )
 
+    def test_combine_post_aggregate_windows(self):
+        self.setup_users()
+        url = (
+            "/users?combine=count(name) as count,sum1(count) as s1,"
+            "max0(count) as m0,avg1(count) as a1,percent1(count) as p1,"
+            "distinct0(count) as d0&combine.over=month(date_of_birth),last_name"
+            "&combine.format=flat&debug=1"
+        )
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertIn("OVER (PARTITION BY", data["meta"]["query"])
+        self.assertEqual(
+            [(2, 1, 1.0, "50.0", 1), (2, 1, 1.0, "50.0", 1), (1, 1, 1.0, "100.0", 1)],
+            [
+                (row["s1"], row["m0"], row["a1"], row["p1"], row["d0"])
+                for row in data["data"]
+            ],
+        )
+
+        features = connection.features
+        supports_over_clause = features.supports_over_clause
+        features.supports_over_clause = False
+        try:
+            response = self.client.get(url)
+        finally:
+            features.supports_over_clause = supports_over_clause
+        fallback = json.loads(response.content.decode("utf-8"))
+        self.assertNotIn("OVER", fallback["meta"]["query"])
+        self.assertEqual(data["data"], fallback["data"])
+
+    def test_combine_limit(self):
+        # a real group named like the flag of the other groups
+        User.objects.filter(name="3").update(name="_other")
+        response = self.client.get(
+            "/users?combine=sum(id) as s,count(id) as c&combine.by=name"
+            "&combine.limit=2&combine.format=flat"
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [
+                {"name": "_other", "s": 4, "c": 1, "_other": False},
+                {"name": "2", "s": 3, "c": 1, "_other": False},
+                {"name": None, "s": 3, "c": 2, "_other": True},
+            ],
+            data["data"],
+        )
+
+        # ties are broken by group
+        response = self.client.get(
+            "/users?combine=count(id) as c&combine.by=name"
+            "&combine.limit=2&combine.format=flat"
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            ["0", "1", None], [row["name"] for row in data["data"]]
+        )
+
+        # smallest first, nested
+        response = self.client.get(
+            f'/users?combine=count(id)&combine.by=name,last_name'
+            f'&combine.limit=1&combine.order={quote("-sum(id)")}'
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual({"0": {"0": {"count(id)": 1}}}, data["data"])
+        self.assertEqual({"count(id)": 3}, data["other"])
+
+        response = self.client.get("/users?combine=count(id)&combine.limit=2")
+        self.assertEqual(400, response.status_code, response.content)
+
+    def test_combine_order(self):
+        url = "/users?combine=count(id) as c&combine.by=name&combine.format=flat"
+        response = self.client.get(f"{url}&combine.order=sum(id)")
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            ["3", "2", "1", "0"], [row["name"] for row in data["data"]]
+        )
+        self.assertEqual({"name", "c"}, set(data["data"][0]))
+
+        # combine.over orders by bucket
+        for params in (
+            "combine=count(id)&combine.order=sum(id)",
+            "combine=count(id)&combine.by=name&combine.over=last_name"
+            "&combine.order=sum(id)",
+        ):
+            response = self.client.get(f"/users?{params}")
+            self.assertEqual(400, response.status_code, response.content)
+
+    def test_combine_cache(self):
+        url = "/users?combine=count(id) as c&combine.by=last_name"
+        ResultCache.for_settings().local.clear()
+        UserViewSet.ENABLE_COMBINE_CACHE = True
+        try:
+            expected = self.client.get(url)
+            # whitespace does not change the parsed expression
+            with self.assertNumQueries(0):
+                cached = self.client.get(url + " ")
+            self.assertEqual(expected.content, cached.content)
+
+            User.objects.create(name="5", last_name="1")
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+        finally:
+            del UserViewSet.ENABLE_COMBINE_CACHE
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(2, data["data"]["1"]["c"])
+
+    def test_combine_csv(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/users?combine=count(id) as c&combine.by=last_name&format=csv"
+            )
+            content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["last_name,c", "0,1", "1,1", "2,1", "3,1"], content.splitlines())
+
+        response = self.client.get("/users?combine=count(id) as c&format=ndjson")
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEqual('{"c": 4}\n', content)
+
+    def test_combine_fill(self):
+        User.objects.all().delete()
+        User.objects.create(name="a", last_name="1", date_of_birth="2020-01-05")
+        User.objects.create(name="b", last_name="1", date_of_birth="2020-04-05")
+        User.objects.create(name="c", last_name="2", date_of_birth="2020-02-08")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/users?combine=count(id) as c&combine.over=month(date_of_birth)"
+                "&combine.fill=zero"
+            )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [["2020-01-01", 1], ["2020-02-01", 1], ["2020-03-01", 0], ["2020-04-01", 1]],
+            data["data"]["c"],
+        )
+
+        # every group gets every bucket
+        response = self.client.get(
+            "/users?combine=count(id) as c&combine.over=month(date_of_birth) as m"
+            "&combine.by=last_name&combine.fill=previous&combine.format=flat"
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [
+                ("1", "2020-01-01", 1),
+                ("2", "2020-01-01", None),
+                ("1", "2020-02-01", 1),
+                ("2", "2020-02-01", 1),
+                ("1", "2020-03-01", 1),
+                ("2", "2020-03-01", 1),
+                ("1", "2020-04-01", 1),
+                ("2", "2020-04-01", 1),
+            ],
+            [(row["last_name"], row["m"], row["c"]) for row in data["data"]],
+        )
+
+        response = self.client.get(
+            "/users?combine=count(id)&combine.by=last_name&combine.fill=zero"
+        )
+        self.assertEqual(400, response.status_code, response.content)
+        response = self.client.get(
+            "/users?combine=count(id)&combine.over=month(date_of_birth)&combine.fill=x"
+        )
+        self.assertEqual(400, response.status_code, response.content)
+
+        url = (
+            "/users?combine=count(id)&combine.over=month(date_of_birth)"
+            "&combine.fill=zero"
+        )
+        for max_buckets, status in ((3, 400), (4, 200)):
+            with override_settings(DYNAMIC_REST={
+                "ENABLE_LINKS": False, "COMBINE_MAX_BUCKETS": max_buckets
+            }):
+                response = self.client.get(url)
+            self.assertEqual(status, response.status_code, response.content)
+
+    def test_combine_sample(self):
+        response = self.client.get(
+            "/users?combine=count(id) as c,sum(id) as s,"
+            "distinct(last_name) as d,sum(id) / count(id) as r"
+            "&combine.sample=0.5"
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        # ids 2 and 4 are sampled, sums and counts are scaled up
+        self.assertEqual({"c": 4, "s": 12, "d": 4, "r": 3}, data["data"])
+        self.assertEqual(0.5, data["meta"]["sample"])
+        self.assertEqual({"c", "s", "d"}, set(data["meta"]["error"]))
+        # distinct counts are exact
+        self.assertEqual(0, data["meta"]["error"]["d"])
+
+        # with top groups, distinct counts follow the same groups
+        response = self.client.get(
+            "/users?combine=count(id) as c,distinct(last_name) as d"
+            "&combine.by=name&combine.limit=1&combine.sample=0.5"
+            "&combine.format=flat"
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            [
+                {"name": "1", "c": 2, "d": 1, "_other": False},
+                {"name": None, "c": 2, "d": 3, "_other": True},
+            ],
+            data["data"],
+        )
+
+        response = self.client.get(
+            "/users?combine=distinct(id) %2B 1 as d&combine.sample=0.5"
+        )
+        self.assertEqual(400, response.status_code, response.content)
+        response = self.client.get("/users?combine=count(id)&combine.sample=2")
+        self.assertEqual(400, response.status_code, response.content)
+        response = self.client.get(
+            "/users?combine=count(id)&combine.sample=1e-320"
+        )
+        self.assertEqual(400, response.status_code, response.content)
+
     def test_combine_expression(self):
         # weird aggregation, but test data doesn't have many integer fields..
         response = self.client.get(
@@ -1858,6 +2379,26 @@ class TestCatsAPI(APITestCase):
         data = json.loads(response.content.decode("utf-8"))
         self.assertEqual(data["data"]["doubleCats"], 9)
 
+    def test_combine_expression_precedence(self):
+        response = self.client.get(
+            f'/cars?combine={quote("count(id) + count(name) * 2 as a")}'
+            f'&combine={quote("(count(id) + count(name)) * 2 as b")}'
+            f'&combine={quote("-count(id) / 2 as c")}'
+        )
+        self.assertEqual(200, response.status_code, response.content)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["data"]["a"], 9)
+        self.assertEqual(data["data"]["b"], 12)
+        self.assertEqual(data["data"]["c"], -1.5)
+
+        response = self.client.get(
+            f'/cars?combine={quote("count(id) + sum0(count) as a")}'
+        )
+        self.assertEqual(400, response.status_code, response.content)
+
+        response = self.client.get(f'/cars?combine={quote("count(id")}')
+        self.assertEqual(400, response.status_code, response.content)
+
     def test_combine_as(self):
         response = self.client.get("/cars?combine=count(name) as numCats")
         self.assertEqual(200, response.status_code, response.content)
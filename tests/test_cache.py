@@ -0,0 +1,69 @@
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase
+
+from dynamic_rest.cache import ResultCache, SideloadCache
+from tests.models import Location, User
+
+
+class TestResultCache(SimpleTestCase):
+
+    def test_invalidated_by_generation(self):
+        cache = ResultCache(ttl=60)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(1, cache.get_or_compute('k', [User], compute))
+        self.assertEqual(1, cache.get_or_compute('k', [User], compute))
+        cache.generations.bump(Location)
+        self.assertEqual(1, cache.get_or_compute('k', [User], compute))
+        cache.generations.bump(User)
+        self.assertEqual(2, cache.get_or_compute('k', [User], compute))
+
+    def test_only_watches_cached_models(self):
+        cache = ResultCache(ttl=60)
+        cache.get_or_compute('k', [User], lambda: 1)
+        post_save.send(sender=Location, instance=Location(pk=1))
+        post_save.send(sender=User, instance=User(pk=1))
+        self.assertEqual(
+            {'drest:generation:tests.user': 1}, cache.generations.local
+        )
+
+    def test_stale_while_revalidate(self):
+        cache = ResultCache(ttl=60, stale_while_revalidate=True)
+        self.assertEqual(1, cache.get_or_compute('k', [User], lambda: 1))
+        cache.generations.bump(User)
+
+        def compute():
+            # concurrent callers get the stale result meanwhile
+            return cache.get_or_compute('k', [User], lambda: 3) + 1
+
+        self.assertEqual(2, cache.get_or_compute('k', [User], compute))
+        self.assertEqual(2, cache.get_or_compute('k', [User], lambda: 4))
+
+
+class TestSideloadCache(SimpleTestCase):
+
+    def test_local_invalidation(self):
+        cache = SideloadCache(Location, backend='')
+        cache.set_many({1: Location(pk=1, name='a'), 2: Location(pk=2)})
+        cache.delete(1)
+        self.assertEqual([2], list(cache.get_many([1, 2])))
+        cache.clear()
+        self.assertEqual({}, cache.get_many([1, 2]))
+
+    def test_shared_invalidation(self):
+        # two processes, sharing the default cache
+        first = SideloadCache(Location, backend='default')
+        second = SideloadCache(Location, backend='default')
+        first.set_many({1: Location(pk=1, name='a')})
+        self.assertEqual('a', second.get_many([1])[1].name)
+        # both levels of the other process are invalidated
+        first.clear()
+        self.assertEqual({}, second.get_many([1]))
+        second.set_many({1: Location(pk=1, name='b')})
+        self.assertEqual('b', first.get_many([1])[1].name)
+        second.delete(1)
+        self.assertEqual({}, first.get_many([1]))
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from dynamic_rest.coalesce import SingleFlight
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        cache.clear()
+
+    def test_concurrent_calls_are_coalesced(self):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        def call():
+            results.append(self.flight.do('key', compute, timeout=5))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=call) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        # wait for the followers to block on the in-flight call
+        flight = self.flight._flights['key']
+        deadline = time.monotonic() + 5
+        while (
+            len(flight.done._cond._waiters) < 3
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(
+            [('result', False)] + [('result', True)] * 3,
+            sorted(results, key=lambda r: r[1])
+        )
+
+    def test_failed_call_is_not_shared(self):
+        def fail():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            self.flight.do('key', fail)
+        self.assertEqual(('ok', False), self.flight.do('key', lambda: 'ok'))
+
+    def test_shared_lease(self):
+        cache.add('drest:flight:lease:key', 'other')
+        cache.set('drest:flight:result:other', 'shared')
+        self.assertEqual(
+            ('shared', True),
+            self.flight.do('key', lambda: 'own', backend='default')
+        )
+
+    def test_shared_lease_timeout(self):
+        cache.add('drest:flight:lease:key', 'other')
+        self.assertEqual(
+            ('own', False),
+            self.flight.do('key', lambda: 'own', timeout=0.1, backend='default')
+        )
+        self.assertEqual('other', cache.get('drest:flight:lease:key'))
@@ -0,0 +1,143 @@
+import statistics
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from dynamic_rest import combine
+from dynamic_rest.combine import (
+    BinOp,
+    Call,
+    CombineSyntaxError,
+    Identifier,
+    Literal,
+    group_index,
+    parse,
+    post_aggregate
+)
+
+
+class TestPostAggregate(SimpleTestCase):
+
+    def get_rows(self, n=12):
+        return [
+            {'a': i % 2, 'b': i % 3, 'x': i if i % 5 else None}
+            for i in range(n)
+        ]
+
+    def test_group_index(self):
+        rows = self.get_rows(6)
+        self.assertEqual(
+            {(0,): [0, 2, 4], (1,): [1, 3, 5]},
+            group_index(rows, ['a'])
+        )
+        self.assertEqual({(): list(range(6))}, group_index(rows, []))
+
+    def test_post_aggregate(self):
+        rows = self.get_rows()
+        post_aggregate(rows, ['a'], 'sum0', 'sum', 'x', sum)
+        post_aggregate(rows, ['a', 'b'], 'count1', 'count', 'x', len)
+        post_aggregate(rows, [], 'max', 'max', 'x', max)
+        for row in rows:
+            group = [
+                r['x'] for r in rows
+                if r['a'] == row['a'] and r['x'] is not None
+            ]
+            self.assertEqual(sum(group), row['sum0'])
+            self.assertEqual(
+                len([
+                    r for r in rows
+                    if r['a'] == row['a'] and r['b'] == row['b']
+                    and r['x'] is not None
+                ]),
+                row['count1']
+            )
+            self.assertEqual(11, row['max'])
+
+    def test_post_aggregate_percent(self):
+        rows = [{'a': 1, 'x': 1}, {'a': 1, 'x': 3}, {'a': 2, 'x': 0}]
+        post_aggregate(rows, ['a'], 'p', 'percent', 'x', None)
+        self.assertEqual(
+            [Decimal('25'), Decimal('75'), None],
+            [row['p'] for row in rows]
+        )
+
+    def test_post_aggregate_numpy_matches_python(self):
+        if combine.numpy is None:
+            self.skipTest('NumPy is not installed')
+
+        functions = {
+            'sum': sum,
+            'min': min,
+            'max': max,
+            'avg': statistics.mean,
+            'count': len
+        }
+        size = combine.NUMPY_MIN_ROWS * 2
+        for function, python in functions.items():
+            rows = [
+                {'a': i % 7, 'x': i * 3 if i % 11 else None}
+                for i in range(size)
+            ]
+            expected = [dict(row) for row in rows]
+            post_aggregate(rows, ['a'], 'y', function, 'x', python)
+
+            numpy = combine.numpy
+            combine.numpy = None
+            try:
+                post_aggregate(expected, ['a'], 'y', function, 'x', python)
+            finally:
+                combine.numpy = numpy
+
+            self.assertEqual(
+                [row['y'] for row in expected],
+                [row['y'] for row in rows],
+                function
+            )
+            self.assertEqual(
+                [type(row['y']) for row in expected],
+                [type(row['y']) for row in rows],
+                function
+            )
+
+
+class TestParse(SimpleTestCase):
+
+    def test_precedence(self):
+        (ex,) = parse('a + sum(b) * 2')
+        self.assertEqual(
+            BinOp(
+                '+',
+                Identifier('a'),
+                BinOp('*', Call('sum', (Identifier('b'),)), Literal(2))
+            ),
+            ex.node
+        )
+        (ex,) = parse('(a + b) / 2 - c')
+        self.assertEqual(
+            BinOp(
+                '-',
+                BinOp('/', BinOp('+', Identifier('a'), Identifier('b')), Literal(2)),
+                Identifier('c')
+            ),
+            ex.node
+        )
+
+    def test_aliases(self):
+        first, second = parse(' COUNT( id ) AS total,max(b.c)')
+        self.assertEqual(Call('count', (Identifier('id'),)), first.node)
+        self.assertEqual('total', first.alias)
+        self.assertEqual('COUNT( id )', first.text)
+        self.assertIsNone(second.alias)
+        self.assertEqual('max(b.c)', second.text)
+
+    def test_negative_literals(self):
+        (ex,) = parse('-(-2) * -.5')
+        self.assertEqual(BinOp('*', Literal(2), Literal(-0.5)), ex.node)
+
+    def test_cached(self):
+        self.assertIs(parse('count(id) * 3'), parse('count(id) * 3'))
+
+    def test_errors(self):
+        for text in ('count(id', 'a b', '1 +', 'a as', 'a % b'):
+            with self.assertRaises(CombineSyntaxError):
+                parse(text)
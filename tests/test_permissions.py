@@ -1,9 +1,16 @@
 import json
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from tests.setup import create_fixture
 from rest_framework.test import APITestCase
 
+from dynamic_rest.permissions import Me, Permissions
+
 
 class TestPermissionsUsersAPI(APITestCase):
 
@@ -193,3 +200,173 @@ class TestPermissionsUsersAPI(APITestCase):
             '/p/users/%s/' % self.admin_user.id
         )
         self.assertEquals(204, response.status_code)
+
+    def test_sideload_permissions(self):
+        visible = Group.objects.create(name='visible')
+        hidden = Group.objects.create(name='hidden')
+        visible.user_set.add(self.officer_user, self.default_user)
+        hidden.user_set.add(self.default_user)
+
+        url = '/p/users/%s/?include[]=groups.*' % self.default_user.id
+        self.client.force_authenticate(user=self.officer_user)
+        with self.assertNumQueries(4):
+            # 2 for roles, 1 for the user, 1 for the groups the officer is in
+            response = self.client.get(url)
+        self.assertEquals(200, response.status_code, response.content)
+        content = json.loads(response.content)
+        self.assertEquals([visible.id], content['user']['groups'])
+        self.assertEquals(['visible'], [g['name'] for g in content['groups']])
+
+        # superusers are not restricted
+        self.client.force_authenticate(user=self.admin_user)
+        content = json.loads(self.client.get(url).content)
+        self.assertEquals(
+            {visible.id, hidden.id}, set(content['user']['groups'])
+        )
+
+    def test_bulk_create_permissions(self):
+        staff_user = User.objects.create(username='staff', is_staff=True)
+        self.client.force_authenticate(user=staff_user)
+        data = [
+            {'username': 'new%s' % i, 'last_name': 'staff'} for i in range(3)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/p/users/', data, format='json')
+        self.assertEquals(201, response.status_code, response.content)
+        self.assertEquals(3, len(response.data['users']))
+        # created users are checked together
+        checks = [
+            q for q in queries if 'COUNT(' in q['sql'] and 'staff' in q['sql']
+        ]
+        self.assertEquals(1, len(checks))
+
+        # one user that is not permitted rolls back the whole request
+        data = [
+            {'username': 'other1', 'last_name': 'staff'},
+            {'username': 'other2', 'last_name': 'other'},
+        ]
+        response = self.client.post('/p/users/', data, format='json')
+        self.assertEquals(403, response.status_code, response.content)
+        self.assertFalse(
+            User.objects.filter(username__startswith='other').exists()
+        )
+
+    @override_settings(DYNAMIC_REST={'BULK_BATCH_SIZE': 2})
+    def test_csv_import_permissions(self):
+        staff_user = User.objects.create(username='staff', is_staff=True)
+        self.client.force_authenticate(user=staff_user)
+        file = SimpleUploadedFile(
+            'users.csv',
+            b'username,last_name\nnew1,staff\nnew2,staff\n'
+            b'new3,staff\nnew4,other\n'
+        )
+        response = self.client.post('/p/users/', {'file': file})
+        # the second batch is not permitted, the first one is kept
+        self.assertEquals(400, response.status_code, response.content)
+        self.assertEquals(2, response.data['created'])
+        self.assertEquals(2, response.data['failed'])
+        self.assertEquals([3, 4], [e['row'] for e in response.data['errors']])
+        self.assertEquals(
+            ['new1', 'new2'],
+            sorted(User.objects.filter(
+                username__startswith='new'
+            ).values_list('username', flat=True))
+        )
+
+    def test_bulk_delete_permissions(self):
+        self.client.force_authenticate(user=self.manager_user)
+        ids = [self.default_user.id, self.admin_user.id, 31415]
+        response = self.client.delete(
+            '/p/users/', [{'id': i} for i in ids], format='json'
+        )
+        # managers cannot delete superusers
+        self.assertEquals(200, response.status_code, response.content)
+        self.assertEquals(
+            {'deleted': 1, 'rejected': [self.admin_user.id, 31415]},
+            response.data
+        )
+        self.assertFalse(User.objects.filter(pk=self.default_user.id).exists())
+        self.assertTrue(User.objects.filter(pk=self.admin_user.id).exists())
+
+    def test_bulk_upsert(self):
+        self.client.force_authenticate(user=self.admin_user)
+        data = [
+            {'username': self.default_user.username, 'first_name': 'renamed'},
+            {'username': 'new', 'first_name': 'new'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/p/users/?upsert=username', data, format='json'
+            )
+        self.assertEquals(200, response.status_code, response.content)
+        self.assertEquals(1, response.data['created'])
+        self.assertEquals(1, response.data['updated'])
+        new = User.objects.get(username='new')
+        self.assertEquals(
+            [self.default_user.pk, new.pk], response.data['ids']
+        )
+        self.assertEquals(
+            'renamed', User.objects.get(pk=self.default_user.pk).first_name
+        )
+        # one statement writes every row
+        inserts = [q for q in queries if q['sql'].startswith('INSERT')]
+        self.assertEquals(1, len(inserts))
+
+        # managers can create and update users, officers cannot
+        self.client.force_authenticate(user=self.officer_user)
+        response = self.client.post(
+            '/p/users/?upsert=username', data, format='json'
+        )
+        self.assertEquals(403, response.status_code, response.content)
+
+
+class TestCompiledPermissions(TestCase):
+
+    spec = {
+        'is_staff': {
+            'list': True,
+            'update': lambda user: Q(pk=user.pk),
+        },
+        '*': {
+            'list': {'groups__user': Me},
+            'read': Me,
+            'fields': {'username': {'read_only': True}},
+        },
+    }
+
+    def setUp(self):
+        self.users = [
+            User.objects.create(username='a'),
+            User.objects.create(username='b'),
+            User.objects.create(username='c', is_staff=True),
+        ]
+
+    def test_compiled_per_role_set(self):
+        a, b, c = [Permissions(self.spec, user) for user in self.users]
+        self.assertIs(a.compiled, b.compiled)
+        self.assertIsNot(a.compiled, c.compiled)
+
+        # only the user-dependent values are bound
+        self.assertEqual(Q(groups__user=self.users[0]), a.list.filters)
+        self.assertEqual(Q(groups__user=self.users[1]), b.list.filters)
+        self.assertEqual(Q(pk=self.users[1].pk), b.read.filters)
+        self.assertTrue(c.list.full_access)
+        self.assertIs(a.fields, b.fields)
+        self.assertEqual({'username': {'read_only': True}}, a.fields.spec)
+
+        # callables are evaluated for each user
+        self.assertEqual(Q(pk=self.users[2].pk), c.update.filters)
+        self.assertTrue(a.update.no_access)
+
+    def test_expression_filters(self):
+        exists = Exists(User.objects.filter(pk=OuterRef('pk'), is_staff=True))
+        spec = {'*': {'list': Q(exists) & Q(groups__user=Me)}}
+        user = self.users[0]
+        filters = Permissions(spec, user).list.filters
+        self.assertEqual(Q(exists) & Q(groups__user=user), filters)
+        self.assertEqual(0, User.objects.filter(filters).count())
+
+    def test_allowed(self):
+        permissions = Permissions(self.spec, self.users[2], allowed=['read'])
+        self.assertTrue(permissions.list.no_access)
+        self.assertFalse(permissions.read.no_access)
@@ -1,7 +1,11 @@
+import json
+
+from django.db import transaction
 from django.db.models import Prefetch
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 
 from tests.models import A, B, C, D
+from tests.setup import create_fixture
 
 
 class TestPrefetch(TestCase):
@@ -33,3 +37,40 @@ class TestPrefetch(TestCase):
                 )
             )
         )[0]
+
+
+@override_settings(
+    DYNAMIC_REST={
+        'ENABLE_LINKS': False,
+        'ENABLE_CONCURRENT_PREFETCH': True,
+        'CONCURRENT_PREFETCH_WORKERS': 2
+    }
+)
+class TestConcurrentPrefetch(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.fixture = create_fixture()
+
+    def test_concurrent_prefetch(self):
+        url = '/users/?include[]=groups.&include[]=location.&sort[]=id'
+        # 1 query on this thread for User,
+        # groups and locations are prefetched by workers
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        content = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(
+            [[1, 2]] * 4, [user['groups'] for user in content['users']]
+        )
+        self.assertEqual(
+            [1, 1, 2, 3], [user['location'] for user in content['users']]
+        )
+        self.assertEqual(3, len(content['locations']))
+
+    def test_sequential_in_transaction(self):
+        url = '/users/?include[]=groups.&include[]=location.'
+        with transaction.atomic():
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
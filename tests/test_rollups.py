@@ -0,0 +1,123 @@
+import datetime
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+
+from dynamic_rest.filters import DynamicFilterBackend, DynamicSortingFilter
+from dynamic_rest.rollups import RollupState, get_rollups
+from tests.models import User
+from tests.setup import create_fixture
+from tests.viewsets import RollupUserViewSet
+
+
+class TestRollups(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        self.fixture = create_fixture()
+        for pk, day in ((1, 5), (2, 20), (3, 35)):
+            User.objects.filter(pk=pk).update(
+                date_of_birth=datetime.date(2020, 1, 1)
+                + datetime.timedelta(days=day)
+            )
+        (self.rollup,) = get_rollups(RollupUserViewSet)
+        self.rollup._built.clear()
+
+    def tearDown(self):
+        tables = connection.introspection.table_names()
+        with connection.schema_editor() as editor:
+            for model in (self.rollup.get_model(), RollupState):
+                if model._meta.db_table in tables:
+                    editor.delete_model(model)
+        self.rollup._built.clear()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code, response.content)
+        return json.loads(response.content.decode('utf-8'))
+
+    def refresh(self, *args):
+        call_command('refresh_rollups', *args, stdout=StringIO())
+
+    def test_answered_from_rollup(self):
+        urls = [
+            '/rollup_users/?combine=count(name),max(name)'
+            '&combine.over=month(date_of_birth)&combine.by=last_name',
+            '/rollup_users/?combine=count(name) as c,sum0(c) as c0'
+            '&combine.over=month(date_of_birth)&combine.format=flat',
+            '/rollup_users/?combine=avg(id) * 2 as a&combine.by=last_name',
+            '/rollup_users/?combine=count(name)&combine.by=last_name'
+            '&filter{last_name}=1'
+        ]
+        expected = [self.get(url + '&debug=1') for url in urls]
+        for data in expected:
+            self.assertNotIn('drest_rollup', data['meta']['query'])
+
+        self.refresh()
+        for url, data in zip(urls, expected):
+            answered = self.get(url + '&debug=1')
+            self.assertIn('drest_rollup', answered['meta']['query'])
+            self.assertEqual(data['data'], answered['data'])
+
+    def test_not_covered(self):
+        self.refresh()
+        for url in (
+            # missing dimension
+            '/rollup_users/?combine=count(name)&combine.by=location',
+            # missing aggregate
+            '/rollup_users/?combine=min(name)&combine.by=last_name',
+            # filter on a field that is not a dimension
+            '/rollup_users/?combine=count(name)&filter{name}=0',
+            # filter that is not an equality
+            '/rollup_users/?combine=count(name)&filter{last_name.gt}=1'
+        ):
+            data = self.get(url + '&debug=1')
+            self.assertNotIn('drest_rollup', data['meta']['query'], url)
+
+    def test_not_used_with_custom_filter_backends(self):
+        class ScopedFilterBackend(DynamicFilterBackend):
+            pass
+
+        self.refresh()
+        url = '/rollup_users/?combine=count(name)&combine.by=last_name&debug=1'
+        self.assertIn('drest_rollup', self.get(url)['meta']['query'])
+        RollupUserViewSet.filter_backends = (
+            ScopedFilterBackend, DynamicSortingFilter
+        )
+        try:
+            data = self.get(url)
+        finally:
+            del RollupUserViewSet.filter_backends
+        self.assertNotIn('drest_rollup', data['meta']['query'])
+
+    def test_refresh(self):
+        url = (
+            '/rollup_users/?combine=count(name)'
+            '&combine.over=month(date_of_birth)'
+        )
+        self.refresh()
+        before = self.get(url)['data']['count(name)']
+        self.assertEqual([['2020-01-01', 2], ['2020-02-01', 1]], before[1:])
+
+        User.objects.create(
+            name='new',
+            last_name='1',
+            date_of_birth=datetime.date(2020, 2, 14)
+        )
+        # stale until refreshed
+        self.assertEqual(before, self.get(url)['data']['count(name)'])
+
+        self.refresh()
+        self.assertEqual(
+            [['2020-01-01', 2], ['2020-02-01', 2]],
+            self.get(url)['data']['count(name)'][1:]
+        )
+
+        self.refresh('--rebuild', self.rollup.name)
+        self.assertEqual(
+            [['2020-01-01', 2], ['2020-02-01', 2]],
+            self.get(url)['data']['count(name)'][1:]
+        )
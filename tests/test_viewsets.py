@@ -1,16 +1,23 @@
 import json
 
 
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from rest_framework import exceptions, status
 from rest_framework.request import Request
 
+from dynamic_rest.cache import ResultCache
 from dynamic_rest.filters import DynamicFilterBackend
+from dynamic_rest.jobs import JobStore, run_job
 from dynamic_rest.test import ViewSetTestCase
+from dynamic_rest.viewsets import SKIPPED_ROW
 from tests.models import Dog, Group, User
 from tests.setup import create_fixture
 from tests.viewsets import (
+    AdoptedDogViewSet,
     UserViewSet
 )
 
@@ -64,6 +71,34 @@ class TestUserViewSet(TestCase):
                 exceptions.ParseError,
                 self.view.get_request_fields)
 
+    def test_combine_cache_key_depends_on_rows(self):
+        request = Request(self.rf.get('/users/', {'combine': 'count(id)'}))
+        request.accepted_renderer = None
+        self.view.request = request
+        self.view.kwargs = {}
+        self.view.format_kwarg = None
+        combine = {'': 'count(id)'}
+        key, _ = self.view.get_combine_cache_key(combine, User.objects.all())
+        scoped, _ = self.view.get_combine_cache_key(
+            combine, User.objects.filter(pk=1)
+        )
+        self.assertNotEqual(key, scoped)
+
+    def test_unresolved_combine_fields_not_cached(self):
+        serializer = self.view.serializer_class()
+        self.assertEqual(
+            'name', self.view._resolve_combine_field(serializer, 'name')
+        )
+        self.assertIsNone(
+            self.view._resolve_combine_field(serializer, 'no_such_field')
+        )
+        self.assertIn(
+            (serializer.__class__, 'name'), self.view._combine_fields
+        )
+        self.assertNotIn(
+            (serializer.__class__, 'no_such_field'), self.view._combine_fields
+        )
+
     def test_filter_extraction(self):
         filters_map = {
             'attr': ['bar'],
@@ -168,6 +203,97 @@ class BulkUpdateTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(Dog.objects.get(id=3).fur_color == 'gold')
 
+    def test_update_with_return_preference(self):
+        response = self.client.patch(
+            '/dogs/1/',
+            json.dumps({'fur': 'grey'}),
+            content_type='application/json',
+            HTTP_PREFER='return=minimal'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b'', response.content)
+        self.assertEqual('return=minimal', response['Preference-Applied'])
+        self.assertEqual('grey', Dog.objects.get(id=1).fur_color)
+
+        response = self.client.patch(
+            '/dogs/',
+            json.dumps([{'id': 1, 'fur': 'gold'}, {'id': 2, 'fur': 'gold'}]),
+            content_type='application/json',
+            HTTP_PREFER='return=ids'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([1, 2], sorted(response.data['ids']))
+
+        # the representation only has the requested fields
+        response = self.client.patch(
+            '/users/1/',
+            json.dumps({'name': 'foo'}),
+            content_type='application/json',
+            HTTP_PREFER='return=representation'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual('foo', response.data['user']['name'])
+        self.assertNotIn('last_name', response.data['user'])
+
+    def test_bulk_update_filtered_as_one_statement(self):
+        brown = set(
+            Dog.objects.filter(
+                fur_color__contains='brown'
+            ).values_list('pk', flat=True)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                '/dogs/?filter{fur.contains}=brown',
+                json.dumps({'fur': 'teal'}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({'updated': len(brown)}, response.data)
+        self.assertEqual(
+            brown,
+            set(Dog.objects.filter(
+                fur_color='teal'
+            ).values_list('pk', flat=True))
+        )
+        updates = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(1, len(updates))
+        self.assertFalse(any(
+            q['sql'].startswith('SELECT') and 'tests_dog' in q['sql']
+            for q in queries.captured_queries
+        ))
+
+    def test_bulk_update_filtered_with_return_ids(self):
+        generations = ResultCache.for_settings().generations
+        (before,) = generations.get_many([Dog])
+        brown = Dog.objects.filter(fur_color__contains='brown')
+        pks = sorted(brown.values_list('pk', flat=True))
+        response = self.client.patch(
+            '/dogs/?filter{fur.contains}=brown',
+            json.dumps({'fur': 'teal'}),
+            content_type='application/json',
+            HTTP_PREFER='return=ids'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(pks, sorted(response.data['ids']))
+        # the update sends no signals, but still invalidates cached results
+        self.assertNotEqual([before], generations.get_many([Dog]))
+
+    def test_bulk_update_filtered_with_relations(self):
+        # many-relations are set instance by instance
+        response = self.client.patch(
+            '/users/?filter{location}=1',
+            json.dumps({'groups': [1]}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        users = User.objects.filter(location=1)
+        self.assertTrue(users.exists())
+        for user in users:
+            self.assertEqual([1], [g.pk for g in user.groups.all()])
+
     def test_bulk_update_fail_without_lookup_attribute(self):
         '''
         Test that PATCH request will fail if lookup attribute wasn't provided.
@@ -180,6 +306,28 @@ class BulkUpdateTestCase(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_patch_bulk_with_unique_fields(self):
+        foo = Group.objects.create(name='foo')
+        bar = Group.objects.create(name='bar')
+        data = [{'id': foo.pk, 'name': 'foo'}, {'id': bar.pk, 'name': 'baz'}]
+        response = self.client.patch(
+            '/groups/',
+            json.dumps(data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual('baz', Group.objects.get(pk=bar.pk).name)
+
+        data = [{'id': bar.pk, 'name': 'foo'}]
+        response = self.client.patch(
+            '/groups/',
+            json.dumps(data),
+            content_type='application/json'
+        )
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST, response.content
+        )
+
 
 class BulkCreationTestCase(TestCase):
 
@@ -209,6 +357,144 @@ class BulkCreationTestCase(TestCase):
             )
             self.assertEqual(2, Group.objects.count())
 
+    @override_settings(
+        DYNAMIC_REST={'BULK_BATCH_SIZE': 2, 'CSV_IMPORT_MAX_ERRORS': 1}
+    )
+    def test_csv_import_in_batches(self):
+        file = SimpleUploadedFile(
+            'groups.csv', b'name\nfoo\nbar\nbar\nbaz\n\n""\n'
+        )
+        response = self.client.post('/groups/', data={'file': file})
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST, response.content
+        )
+        # the second batch has a duplicate, so only the first is written
+        self.assertEqual(
+            ['bar', 'foo'],
+            sorted(Group.objects.values_list('name', flat=True))
+        )
+        self.assertEqual(2, response.data['created'])
+        # "baz" is valid, but is not written with its batch
+        self.assertEqual(3, response.data['failed'])
+        # errors are capped, and numbered by row
+        self.assertEqual(
+            [{'name': 'bar'}],
+            [error['source'] for error in response.data['errors']]
+        )
+        self.assertEqual([3], [e['row'] for e in response.data['errors']])
+
+    @override_settings(DYNAMIC_REST={'BULK_BATCH_SIZE': 3})
+    def test_csv_import_reports_skipped_rows(self):
+        file = SimpleUploadedFile('groups.csv', b'name\nfoo\nbar\n""\nbaz\n')
+        response = self.client.post('/groups/', data={'file': file})
+        self.assertEqual(
+            response.status_code, status.HTTP_400_BAD_REQUEST, response.content
+        )
+        self.assertEqual(['baz'], list(Group.objects.values_list('name', flat=True)))
+        # every row read is either created or failed
+        self.assertEqual(
+            {'created': 1, 'failed': 3},
+            {key: response.data[key] for key in ('created', 'failed')}
+        )
+        errors = response.data['errors']
+        self.assertEqual([1, 2, 3], [error['row'] for error in errors])
+        self.assertEqual(
+            [SKIPPED_ROW, SKIPPED_ROW],
+            [error['detail'] for error in errors[:2]]
+        )
+
+    @override_settings(
+        DYNAMIC_REST={
+            'BULK_BATCH_SIZE': 2,
+            'JOB_EXECUTOR': 'dynamic_rest.jobs.InlineJobExecutor',
+            'JOB_MIN_ROWS': 2
+        }
+    )
+    def test_post_bulk_as_job(self):
+        data = [{'name': 'foo'}, {'name': 'bar'}, {'name': 'bar'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/groups/',
+                json.dumps(data),
+                content_type='application/json',
+                HTTP_PREFER='respond-async, return=ids'
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_202_ACCEPTED, response.content
+            )
+            # nothing is written until the job runs
+            self.assertEqual(0, Group.objects.count())
+        url = response['Location']
+        self.assertEqual(url, response.data['job']['url'])
+
+        job = self.client.get(url).data['job']
+        self.assertEqual('completed', job['status'])
+        self.assertEqual(3, job['processed'])
+        # rows are written in batches, and failed batches are reported
+        self.assertEqual([[0, 2]], [r['rows'] for r in job['results']])
+        # chunks are replayed with the original headers
+        self.assertEqual(2, len(job['results'][0]['data']['ids']))
+        self.assertEqual([[2, 3]], [e['rows'] for e in job['errors']])
+        self.assertEqual(400, job['errors'][0]['status'])
+        self.assertEqual(2, Group.objects.count())
+
+        # jobs only run once
+        store = JobStore.for_settings()
+        record = store.get(job['id'])
+        record['status'] = 'queued'
+        store.set(record)
+        run_job(job['id'])
+        self.assertEqual('queued', store.get(job['id'])['status'])
+        self.assertEqual(2, Group.objects.count())
+
+    @override_settings(
+        DYNAMIC_REST={
+            'JOB_EXECUTOR': 'dynamic_rest.jobs.InlineJobExecutor',
+            'JOB_MAX_RESPONSE_SIZE': 10,
+            'JOB_MIN_ROWS': 2
+        }
+    )
+    def test_job_records_stay_small(self):
+        data = [{'name': 'foo'}, {'name': 'bar'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/groups/',
+                json.dumps(data),
+                content_type='application/json',
+                HTTP_PREFER='respond-async'
+            )
+        store = JobStore.for_settings()
+        job_id = response.data['job']['id']
+        record = store.get(job_id)
+        # the payload is stored apart, and large responses are dropped
+        self.assertNotIn('request', record)
+        self.assertEqual(data, store.get_payload(job_id)['data'])
+        self.assertEqual(
+            [{'rows': [0, 2], 'status': 201, 'data': None, 'truncated': True}],
+            record['results']
+        )
+
+        # jobs whose payload is lost fail
+        record.update(id='lost', status='queued', results=[])
+        store.set(record)
+        run_job('lost')
+        record = store.get('lost')
+        self.assertEqual('failed', record['status'])
+        self.assertEqual([[0, 2]], [e['rows'] for e in record['errors']])
+
+    def test_post_bulk_with_return_ids(self):
+        response = self.client.post(
+            '/groups/',
+            json.dumps([{'name': 'foo'}, {'name': 'bar'}]),
+            content_type='application/json',
+            HTTP_PREFER='return=ids'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(Group.objects.values_list('pk', flat=True)),
+            sorted(response.data['ids'])
+        )
+
     def test_post_bulk_from_resource_plural_name(self):
         data = {
             'groups': [
@@ -293,6 +579,96 @@ class BulkCreationTestCase(TestCase):
         self.assertEqual(2, len(resp_data['users']))
         self.assertEqual(2, len(resp_data['groups']))
 
+    def test_post_bulk_resolves_relations_once(self):
+        users = [
+            User.objects.create(name=str(i), last_name='x') for i in range(4)
+        ]
+        data = [
+            {'name': 'foo', 'members': [users[0].pk, users[1].pk]},
+            {'name': 'bar', 'members': [users[1].pk, users[2].pk]},
+            {'name': 'baz', 'members': [str(users[3].pk)]},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/groups/',
+                json.dumps(data),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        lookups = [
+            q for q in queries if '"tests_user"."id" IN' in q['sql']
+        ]
+        self.assertEqual(1, len(lookups))
+        self.assertEqual(
+            [users[1].pk, users[2].pk],
+            sorted(
+                Group.objects.get(name='bar')
+                .users.values_list('pk', flat=True)
+            )
+        )
+
+    def test_post_bulk_with_missing_relations(self):
+        user = User.objects.create(name='foo', last_name='bar')
+        data = [{'name': 'foo', 'members': [user.pk, 31415, 27182]}]
+        response = self.client.post(
+            '/groups/',
+            json.dumps(data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            ['"User" with IDs "31415", "27182" not found'],
+            response.data['errors'][0]['detail']['members']
+        )
+        self.assertEqual(0, Group.objects.count())
+
+    def test_post_bulk_checks_uniqueness_once(self):
+        Group.objects.create(name='foo')
+        data = [
+            {'name': 'foo'}, {'name': 'bar'}, {'name': 'bar'}, {'name': 'baz'}
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/groups/',
+                json.dumps(data),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        lookups = [
+            q for q in queries if '"tests_group"."name" IN' in q['sql']
+        ]
+        self.assertEqual(1, len(lookups))
+        # existing and duplicated names are both rejected
+        self.assertEqual(
+            [{'name': 'foo'}, {'name': 'bar'}],
+            [error['source'] for error in response.data['errors']]
+        )
+        self.assertEqual(1, Group.objects.count())
+    def test_post_bulk_upsert(self):
+        foo = Group.objects.create(name='foo')
+        generations = ResultCache.for_settings().generations
+        (before,) = generations.get_many([Group])
+        data = [{'name': 'foo'}, {'name': 'bar'}]
+        response = self.client.post(
+            '/groups/?upsert=name',
+            json.dumps(data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({'created': 1, 'updated': 1}, response.data)
+        self.assertEqual(foo.pk, Group.objects.get(name='foo').pk)
+        self.assertEqual(2, Group.objects.count())
+        # upserts send no signals, but still invalidate cached results
+        self.assertNotEqual([before], generations.get_many([Group]))
+
+        # upsert fields must be unique
+        response = self.client.post(
+            '/groups/?upsert=id',
+            json.dumps(data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class BulkDeletionTestCase(TestCase):
 
@@ -327,6 +703,23 @@ class BulkDeletionTestCase(TestCase):
             0
         )
 
+    def test_bulk_delete_calls_model_delete(self):
+        view = AdoptedDogViewSet.as_view({'delete': 'destroy'})
+        request = RequestFactory().delete(
+            '/adopted_dogs/',
+            json.dumps([{'id': i} for i in self.ids_to_delete]),
+            content_type='application/json',
+        )
+        response = view(request)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        # the dogs are kept, as their model's delete does
+        self.assertEqual(
+            ['adopted'] * 2,
+            list(Dog.objects.filter(
+                id__in=self.ids_to_delete
+            ).values_list('origin', flat=True))
+        )
+
     def test_bulk_delete_single(self):
         response = self.client.delete(
             '/dogs/%s' % self.ids_to_delete[0],
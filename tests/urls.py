@@ -1,5 +1,6 @@
 
 from dynamic_rest.compat import url, include
+from dynamic_rest.jobs import JobViewSet
 from dynamic_rest.views import login, logout
 from dynamic_rest.routers import DynamicRouter
 from dynamic_rest.urls import *  # noqa
@@ -19,6 +20,11 @@ router.register_resource(viewsets.PermissionViewSet)
 router.register_resource(viewsets.OfficerViewSet)
 router.register(r'zebras', viewsets.ZebraViewSet)  # not canonical
 router.register(r'user_locations', viewsets.UserLocationViewSet)
+router.register(r'cached_users', viewsets.CachedLocationUserViewSet)
+router.register(r'async_users', viewsets.AsyncUserViewSet)
+router.register(r'conditional_dogs', viewsets.ConditionalDogViewSet)
+router.register(r'rollup_users', viewsets.RollupUserViewSet)
+router.register(r'jobs', JobViewSet)
 
 # the above routes are duplicated to test versioned prefixes
 router.register_resource(viewsets.CatViewSet, namespace='v2')  # canonical
@@ -1,9 +1,10 @@
 from rest_framework import exceptions
 
-from dynamic_rest.viewsets import DynamicModelViewSet
+from dynamic_rest.viewsets import AsyncDynamicModelViewSet, DynamicModelViewSet
 from dynamic_rest.actions import action
 from django.contrib.auth import models as auth
 from tests.models import (
+    AdoptedDog,
     Car,
     Cat,
     Dog,
@@ -17,8 +18,11 @@ from tests.models import (
     Zebra
 )
 from tests.serializers import (
+    AsyncUserSerializer,
     CarSerializer,
+    CachedLocationUserSerializer,
     CatSerializer,
+    ConditionalDogSerializer,
     DogSerializer,
     GroupSerializer,
     HorseSerializer,
@@ -26,6 +30,7 @@ from tests.serializers import (
     OfficerSerializer,
     PermissionSerializer,
     ProfileSerializer,
+    RollupUserSerializer,
     UserLocationSerializer,
     UserSerializer,
     PermissionsUserSerializer,
@@ -129,6 +134,18 @@ class UserLocationViewSet(DynamicModelViewSet):
     queryset = User.objects.all()
 
 
+class AsyncUserViewSet(AsyncDynamicModelViewSet):
+    model = User
+    serializer_class = AsyncUserSerializer
+    queryset = User.objects.all()
+
+
+class CachedLocationUserViewSet(DynamicModelViewSet):
+    model = User
+    serializer_class = CachedLocationUserSerializer
+    queryset = User.objects.all()
+
+
 class ProfileViewSet(DynamicModelViewSet):
     features = (
         DynamicModelViewSet.EXCLUDE,
@@ -152,6 +169,15 @@ class DogViewSet(DynamicModelViewSet):
     queryset = Dog.objects.all()
 
 
+class ConditionalDogViewSet(DogViewSet):
+    serializer_class = ConditionalDogSerializer
+    updated_field = 'created'
+
+
+class AdoptedDogViewSet(DogViewSet):
+    queryset = AdoptedDog.objects.all()
+
+
 class HorseViewSet(DynamicModelViewSet):
     features = (DynamicModelViewSet.SORT,)
     model = Horse
@@ -182,3 +208,20 @@ class CarViewSet(DynamicModelViewSet):
 class OfficerViewSet(DynamicModelViewSet):
     serializer_class = OfficerSerializer
     queryset = Officer.objects.all()
+
+
+class RollupUserViewSet(DynamicModelViewSet):
+    features = (
+        DynamicModelViewSet.FILTER, DynamicModelViewSet.DEBUG,
+        DynamicModelViewSet.COMBINE
+    )
+    model = User
+    serializer_class = RollupUserSerializer
+    queryset = User.objects.all()
+    rollups = [{
+        'name': 'users_by_month',
+        'by': ['last_name'],
+        'over': ['month(date_of_birth)'],
+        'values': ['count(name)', 'sum(id)', 'count(id)', 'max(name)'],
+        'watermark': 'id'
+    }]